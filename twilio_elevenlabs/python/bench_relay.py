@@ -0,0 +1,233 @@
+"""
+Relay latency and throughput for many concurrent calls: relay.py vs a
+line-by-line port of inbound-calls.js.
+
+    python bench_relay.py --calls 100 --seconds 20
+
+The relay server (main.py) and the fake agent (fake_agent_server.py) each
+run in their own process. This process plays Twilio: --calls media streams,
+started over --ramp seconds, each sending a 20 ms caller frame every 20 ms
+and echoing marks back. Modes:
+
+js     the inbound-calls.js logic: signed URL, then the agent socket, only
+       after Twilio is accepted; json.loads/dumps and a base64 decode and
+       re-encode on every frame; no queues; clear forwarded but audio of
+       the interrupted response still relayed
+relay  main.py's /media-stream (relay.MediaRelay)
+
+Reported per mode:
+- time to first audio: Twilio socket opened -> first agent (greeting) frame
+- uplink: caller frame sent -> agent received it (from the agent's /stats)
+- downlink: agent frame sent -> Twilio received it
+- frames per second each way
+- stale frames: audio of an interrupted response reaching Twilio after its clear
+- calls cut off: calls the relay hung up on before the caller was done
+- relay CPU: CPU seconds used by the relay process per second of the run,
+  and per frame relayed (either way). The bench shares the machine with
+  the relay, so once the cores are busy CPU per frame is the fair comparison.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--calls", type=int, default=100)
+parser.add_argument("--seconds", type=float, default=20.0, help="caller audio per call")
+parser.add_argument("--ramp", type=float, default=2.0, help="spread call starts over this many seconds")
+parser.add_argument("--port", type=int, default=8100)
+parser.add_argument("--agent-port", type=int, default=9200)
+parser.add_argument("--modes", default="js,relay")
+parser.add_argument("--agent-args", default="", help="extra fake_agent_server.py arguments")
+parser.add_argument("--serve", choices=["js", "relay"], help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+FRAME_FILL = b"\xff" * 152
+
+def serve(mode: str) -> None:
+    """Relay server process: main.app, plus the inbound-calls.js port for --serve js"""
+    import uvicorn
+    from fastapi import WebSocket
+
+    import main
+
+    @main.app.websocket("/js-media-stream")
+    async def js_media_stream(websocket: WebSocket):
+        await websocket.accept()
+        signed_url = await main.get_signed_url(websocket.app.state.http_client)
+        agent = await websockets.connect(signed_url)
+        stream_sid = None
+
+        async def from_agent():
+            async for raw in agent:
+                message = json.loads(raw)
+                if message["type"] == "audio" and message.get("audio_event", {}).get("audio_base_64"):
+                    await websocket.send_text(json.dumps({
+                        "event": "media",
+                        "streamSid": stream_sid,
+                        "media": {"payload": message["audio_event"]["audio_base_64"]},
+                    }))
+                elif message["type"] == "interruption":
+                    await websocket.send_text(json.dumps({"event": "clear", "streamSid": stream_sid}))
+                elif message["type"] == "ping" and message.get("ping_event", {}).get("event_id"):
+                    await agent.send(json.dumps({"type": "pong", "event_id": message["ping_event"]["event_id"]}))
+
+        relay = asyncio.create_task(from_agent())
+        try:
+            async for raw in websocket.iter_text():
+                data = json.loads(raw)
+                if data["event"] == "start":
+                    stream_sid = data["start"]["streamSid"]
+                elif data["event"] == "media":
+                    chunk = base64.b64encode(base64.b64decode(data["media"]["payload"])).decode()
+                    await agent.send(json.dumps({"user_audio_chunk": chunk}))
+                elif data["event"] == "stop":
+                    break
+        finally:
+            relay.cancel()
+            await agent.close()
+            await websocket.close()
+
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning", ws_per_message_deflate=False)
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else float("nan")
+
+class CallResult:
+    def __init__(self):
+        self.first_audio = None
+        self.downlink = []
+        self.frames_received = 0
+        self.stale = 0
+        self.clears = 0
+        self.cut_off = False
+
+async def twilio_call(index: int, path: str, result: CallResult) -> None:
+    await asyncio.sleep(args.ramp * index / args.calls)
+    stream_sid = f"MZ{index:032d}"
+    opened = time.perf_counter()
+    async with websockets.connect(f"ws://127.0.0.1:{args.port}{path}", max_size=None) as ws:
+        async def receive():
+            latest, cleared_through = 0, 0
+            async for raw in ws:
+                now = time.perf_counter()
+                message = json.loads(raw)
+                if message["event"] == "media":
+                    sent_at, event_id = struct.unpack_from("<dI", base64.b64decode(message["media"]["payload"]))
+                    result.downlink.append(now - sent_at)
+                    result.frames_received += 1
+                    if result.first_audio is None:
+                        result.first_audio = now - opened
+                    if event_id <= cleared_through:
+                        result.stale += 1
+                    latest = max(latest, event_id)
+                elif message["event"] == "clear":
+                    result.clears += 1
+                    cleared_through = latest
+                elif message["event"] == "mark":
+                    await ws.send(json.dumps({"event": "mark", "streamSid": stream_sid, "mark": message["mark"]}))
+
+        receiver = asyncio.create_task(receive())
+        await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await ws.send(json.dumps({"event": "start", "sequenceNumber": "1", "streamSid": stream_sid, "start": {
+            "streamSid": stream_sid, "callSid": f"CA{index:032d}",
+            "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}}}))
+        next_frame = time.perf_counter()
+        try:
+            for chunk in range(int(args.seconds * 50)):
+                payload = base64.b64encode(struct.pack("<d", time.perf_counter()) + FRAME_FILL).decode()
+                await ws.send(f'{{"event":"media","sequenceNumber":"{chunk + 2}","media":{{"track":"inbound",'
+                              f'"chunk":"{chunk + 1}","timestamp":"{chunk * 20}","payload":"{payload}"}},'
+                              f'"streamSid":"{stream_sid}"}}')
+                next_frame += 0.02
+                await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+            await ws.send(json.dumps({"event": "stop", "sequenceNumber": str(int(args.seconds * 50) + 2),
+                                      "streamSid": stream_sid, "stop": {"callSid": f"CA{index:032d}"}}))
+        except websockets.ConnectionClosed:
+            # The relay hung up mid-call (agent connect failed or timed out)
+            result.cut_off = True
+        try:
+            await asyncio.wait_for(receiver, 5)
+        except (asyncio.TimeoutError, websockets.ConnectionClosed):
+            pass
+
+async def wait_for_http(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(200):
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"{url} did not come up")
+
+def stop_process(process: subprocess.Popen) -> float:
+    """Terminate a child and return the CPU seconds it used"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    process.terminate()
+    process.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+async def run(mode: str) -> None:
+    agent = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_agent_server.py"),
+                              "--port", str(args.agent_port), *args.agent_args.split()])
+    env = {**os.environ, "ELEVENLABS_API_KEY": "bench-key", "ELEVENLABS_AGENT_ID": "bench-agent",
+           "ELEVENLABS_API_URL": f"http://127.0.0.1:{args.agent_port}"}
+    relay = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(args.port)],
+                             env=env, cwd=HERE, stderr=subprocess.DEVNULL)
+    try:
+        await wait_for_http(f"http://127.0.0.1:{args.agent_port}/stats")
+        await wait_for_http(f"http://127.0.0.1:{args.port}/")
+        results = [CallResult() for _ in range(args.calls)]
+        path = "/js-media-stream" if mode == "js" else "/media-stream"
+        started = time.perf_counter()
+        await asyncio.gather(*(twilio_call(i, path, result) for i, result in enumerate(results)))
+        elapsed = time.perf_counter() - started
+        async with httpx.AsyncClient() as client:
+            agent_stats = (await client.get(f"http://127.0.0.1:{args.agent_port}/stats")).json()
+            relay_stats = (await client.get(f"http://127.0.0.1:{args.port}/")).json()["relay"]
+    finally:
+        relay_cpu = stop_process(relay)
+        stop_process(agent)
+
+    first_audio = [r.first_audio for r in results if r.first_audio is not None]
+    downlink = [latency for r in results for latency in r.downlink]
+    frames = agent_stats['caller_chunks'] + sum(r.frames_received for r in results)
+    print(f"{mode:<6} first audio p50={percentile(first_audio, 0.5):7.1f} ms  p99={percentile(first_audio, 0.99):7.1f} ms"
+          f" | uplink p50={agent_stats['uplink_p50_ms']} ms  p99={agent_stats['uplink_p99_ms']} ms"
+          f" | downlink p50={percentile(downlink, 0.5):6.2f} ms  p99={percentile(downlink, 0.99):7.2f} ms")
+    print(f"{'':<6} {agent_stats['caller_chunks'] / elapsed:,.0f} caller frames/s, "
+          f"{sum(r.frames_received for r in results) / elapsed:,.0f} agent frames/s, "
+          f"{sum(r.clears for r in results)} clears, {sum(r.stale for r in results)} stale frames after clear, "
+          f"{agent_stats['pongs']} pongs, {sum(r.cut_off for r in results)} calls cut off, "
+          f"relay CPU {relay_cpu / elapsed:.0%} of a core, {relay_cpu / max(frames, 1) * 1e6:.0f} us/frame")
+    if mode == "relay":
+        print(f"{'':<6} relay: {relay_stats['caller_frames_dropped']} caller frames dropped, "
+              f"{relay_stats['agent_frames_cleared']} queued agent frames cleared, "
+              f"{relay_stats['stale_frames_dropped']} stale frames dropped, "
+              f"{relay_stats['backpressure_waits']} backpressure waits, connect p50 {relay_stats['connect_p50_ms']} ms")
+
+async def bench():
+    print(f"{args.calls} calls x {args.seconds:.0f}s of caller audio, started over {args.ramp:.0f}s")
+    for mode in args.modes.split(","):
+        await run(mode)
+
+if __name__ == "__main__":
+    if args.serve:
+        serve(args.serve)
+    else:
+        asyncio.run(bench())
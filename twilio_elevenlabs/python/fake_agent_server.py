@@ -0,0 +1,178 @@
+"""
+Local stand-in for the ElevenLabs conversational agent API.
+
+    python fake_agent_server.py --port 9200
+
+Serves GET /v1/convai/conversation/get_signed_url and the conversation
+websocket it points to. That is enough of the protocol to run main.py
+offline with ELEVENLABS_API_URL=http://127.0.0.1:9200:
+
+- conversation_initiation_metadata, then a greeting
+- another response of --response-ms after every --turn-frames caller
+  chunks, streamed --realtime-factor times faster than real time, as the
+  real agent does
+- every --interrupt-every'th response is interrupted halfway. The
+  interruption event is followed by --late-frames frames of the
+  interrupted response, which were already in flight.
+- a ping every --ping-interval seconds, with pongs counted
+
+Audio frames are 20 ms of 8 kHz mu-law. The first 12 bytes carry the send
+time (perf_counter, comparable across processes on Linux) and the event_id.
+Frames from bench_relay.py's fake Twilio calls carry their send time the
+same way, so GET /stats reports caller-to-agent latency through the relay.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import struct
+import time
+import uuid
+from collections import deque
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+import uvicorn
+
+FRAME_MS = 20
+FRAME_BYTES = 160
+# perf_counter at send time, event_id
+FRAME_HEADER = struct.Struct("<dI")
+
+def audio_frame(event_id: int) -> str:
+    header = FRAME_HEADER.pack(time.perf_counter(), event_id)
+    return base64.b64encode(header + b"\xff" * (FRAME_BYTES - len(header))).decode("ascii")
+
+class FakeAgent:
+    def __init__(self, signed_url_ms: float = 100.0, handshake_ms: float = 50.0, response_ms: int = 2000,
+                 realtime_factor: float = 4.0, turn_frames: int = 100, interrupt_every: int = 3,
+                 late_frames: int = 5, ping_interval: float = 2.0):
+        self.signed_url_ms = signed_url_ms
+        self.handshake_ms = handshake_ms
+        self.response_ms = response_ms
+        self.realtime_factor = realtime_factor
+        self.turn_frames = turn_frames
+        self.interrupt_every = interrupt_every
+        self.late_frames = late_frames
+        self.ping_interval = ping_interval
+        self.conversations = 0
+        self.caller_chunks = 0
+        self.agent_frames = 0
+        self.interruptions = 0
+        self.pongs = 0
+        self.uplink_latencies = deque(maxlen=100000)
+
+    async def speak(self, ws: WebSocket, event_id: int) -> None:
+        frames = self.response_ms // FRAME_MS
+        interrupted = self.interrupt_every and event_id % self.interrupt_every == 0
+        for i in range(frames):
+            if interrupted and i == frames // 2:
+                self.interruptions += 1
+                await ws.send_text(json.dumps({"type": "interruption", "interruption_event": {"event_id": event_id}}))
+                for _ in range(self.late_frames):
+                    await self.send_frame(ws, event_id)
+                return
+            await self.send_frame(ws, event_id)
+            await asyncio.sleep(FRAME_MS / 1000 / self.realtime_factor)
+
+    async def send_frame(self, ws: WebSocket, event_id: int) -> None:
+        self.agent_frames += 1
+        await ws.send_text('{"type":"audio","audio_event":{"audio_base_64":"' + audio_frame(event_id)
+                           + '","event_id":' + str(event_id) + '}}')
+
+    async def respond(self, ws: WebSocket, turns: asyncio.Queue) -> None:
+        event_id = 1
+        while True:
+            await self.speak(ws, event_id)
+            event_id += 1
+            await turns.get()
+
+    async def ping(self, ws: WebSocket) -> None:
+        event_id = 0
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            event_id += 1
+            await ws.send_text(json.dumps({"type": "ping", "ping_event": {"event_id": event_id, "ping_ms": None}}))
+
+    async def converse(self, ws: WebSocket) -> None:
+        self.conversations += 1
+        await ws.send_text(json.dumps({
+            "type": "conversation_initiation_metadata",
+            "conversation_initiation_metadata_event": {
+                "conversation_id": f"conv_{uuid.uuid4().hex[:12]}",
+                "agent_output_audio_format": "ulaw_8000",
+                "user_input_audio_format": "ulaw_8000",
+            },
+        }))
+        turns = asyncio.Queue()
+        tasks = [asyncio.create_task(self.respond(ws, turns)), asyncio.create_task(self.ping(ws))]
+        chunks = 0
+        try:
+            async for message in ws.iter_text():
+                data = json.loads(message)
+                if "user_audio_chunk" in data:
+                    self.caller_chunks += 1
+                    chunks += 1
+                    try:
+                        sent_at, = struct.unpack_from("<d", base64.b64decode(data["user_audio_chunk"]))
+                        self.uplink_latencies.append(time.perf_counter() - sent_at)
+                    except (binascii.Error, struct.error):
+                        pass
+                    if chunks % self.turn_frames == 0:
+                        turns.put_nowait(chunks)
+                elif data.get("type") == "pong":
+                    self.pongs += 1
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        ordered = sorted(self.uplink_latencies)
+        def percentile(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3) if ordered else None
+        return {
+            "conversations": self.conversations,
+            "caller_chunks": self.caller_chunks,
+            "agent_frames": self.agent_frames,
+            "interruptions": self.interruptions,
+            "pongs": self.pongs,
+            "uplink_p50_ms": percentile(0.5),
+            "uplink_p99_ms": percentile(0.99),
+        }
+
+agent = FakeAgent()
+app = FastAPI(title="ElevenLabs agent stub")
+
+@app.get("/v1/convai/conversation/get_signed_url")
+async def get_signed_url(agent_id: str, request: Request):
+    await asyncio.sleep(agent.signed_url_ms / 1000)
+    base = str(request.base_url).replace("http", "ws", 1)
+    return {"signed_url": f"{base}v1/convai/conversation?agent_id={agent_id}&token={uuid.uuid4().hex}"}
+
+@app.websocket("/v1/convai/conversation")
+async def conversation(websocket: WebSocket):
+    await asyncio.sleep(agent.handshake_ms / 1000)
+    await websocket.accept()
+    await agent.converse(websocket)
+
+@app.get("/stats")
+async def stats():
+    return agent.stats()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--signed-url-ms", type=float, default=100.0)
+    parser.add_argument("--handshake-ms", type=float, default=50.0)
+    parser.add_argument("--response-ms", type=int, default=2000)
+    parser.add_argument("--realtime-factor", type=float, default=4.0)
+    parser.add_argument("--turn-frames", type=int, default=100, help="caller chunks between agent responses")
+    parser.add_argument("--interrupt-every", type=int, default=3)
+    parser.add_argument("--late-frames", type=int, default=5)
+    parser.add_argument("--ping-interval", type=float, default=2.0)
+    args = parser.parse_args()
+    agent = FakeAgent(args.signed_url_ms, args.handshake_ms, args.response_ms, args.realtime_factor,
+                      args.turn_frames, args.interrupt_every, args.late_frames, args.ping_interval)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -1 +1,110 @@
-TBC
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import Response
+from starlette.websockets import WebSocketState
+import httpx
+import websockets
+from twilio.twiml.voice_response import VoiceResponse
+import logging
+
+from relay import MediaRelay, RelayStats
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configuration
+ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+ELEVENLABS_AGENT_ID = os.getenv('ELEVENLABS_AGENT_ID')
+ELEVENLABS_API_URL = os.getenv('ELEVENLABS_API_URL', 'https://api.elevenlabs.io')
+ELEVENLABS_CONNECT_TIMEOUT = float(os.getenv('ELEVENLABS_CONNECT_TIMEOUT', '10.0'))
+PORT = int(os.getenv('PORT', '8000'))
+
+# Relay queues, in frames (Twilio sends 20 ms frames; agent frames vary in length).
+# Caller audio beyond the uplink queue drops the oldest frame; agent audio beyond
+# the downlink queue stops reading from the agent until Twilio catches up.
+RELAY_UPLINK_QUEUE = int(os.getenv('RELAY_UPLINK_QUEUE', '50'))
+RELAY_DOWNLINK_QUEUE = int(os.getenv('RELAY_DOWNLINK_QUEUE', '500'))
+# How long to wait for Twilio to play the agent's last words after the agent hangs up
+RELAY_PLAY_OUT_TIMEOUT = float(os.getenv('RELAY_PLAY_OUT_TIMEOUT', '15.0'))
+
+if not ELEVENLABS_API_KEY or not ELEVENLABS_AGENT_ID:
+    raise ValueError("ELEVENLABS_API_KEY and ELEVENLABS_AGENT_ID environment variables are required")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared ElevenLabs HTTP client on startup and close it on shutdown"""
+    app.state.http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(ELEVENLABS_CONNECT_TIMEOUT),
+        headers={'xi-api-key': ELEVENLABS_API_KEY}
+    )
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+
+app = FastAPI(title="ElevenLabs FastAPI Server", lifespan=lifespan)
+
+relay_stats = RelayStats()
+
+async def get_signed_url(client: httpx.AsyncClient) -> str:
+    """Signed URL for an authenticated conversation with the agent"""
+    response = await client.get(
+        f"{ELEVENLABS_API_URL}/v1/convai/conversation/get_signed_url",
+        params={'agent_id': ELEVENLABS_AGENT_ID}
+    )
+    response.raise_for_status()
+    return response.json()['signed_url']
+
+async def connect_agent(client: httpx.AsyncClient):
+    """Fetch a signed URL and open the agent websocket"""
+    signed_url = await get_signed_url(client)
+    # Base64 mu-law barely compresses, so permessage-deflate would only cost CPU
+    agent = await websockets.connect(signed_url, open_timeout=ELEVENLABS_CONNECT_TIMEOUT, max_size=2**22,
+                                     compression=None)
+    logger.info("Connected to ElevenLabs conversational agent")
+    return agent
+
+@app.get("/")
+async def root():
+    """Health check with relay counters"""
+    return {"message": "Server is running", "relay": relay_stats.snapshot()}
+
+@app.api_route("/incoming-call-eleven", methods=["GET", "POST"])
+async def handle_incoming_call(request: Request):
+    """Handle incoming calls from Twilio: stream the call to /media-stream"""
+    twiml = VoiceResponse()
+    connect = twiml.connect()
+    connect.stream(url=f"wss://{request.headers['host']}/media-stream")
+    return Response(
+        content=str(twiml),
+        media_type="text/xml"
+    )
+
+@app.websocket("/media-stream")
+async def media_stream(websocket: WebSocket):
+    """Relay a Twilio media stream to an ElevenLabs agent and back"""
+    # The signed URL and agent handshake run while Twilio's socket is accepted
+    agent = asyncio.create_task(connect_agent(websocket.app.state.http_client))
+    await websocket.accept()
+    logger.info("Twilio connected to media stream")
+
+    relay = MediaRelay(
+        relay_stats,
+        uplink_queue=RELAY_UPLINK_QUEUE,
+        downlink_queue=RELAY_DOWNLINK_QUEUE,
+        connect_timeout=ELEVENLABS_CONNECT_TIMEOUT,
+        play_out_timeout=RELAY_PLAY_OUT_TIMEOUT
+    )
+    try:
+        await relay.run(websocket.iter_text(), websocket.send_text, agent)
+    finally:
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+        logger.info("Twilio media stream closed")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT, ws_per_message_deflate=False)
@@ -0,0 +1,393 @@
+"""
+Media relay between a Twilio media stream and an ElevenLabs conversational agent.
+
+Each call has two websockets: Twilio's media stream and the agent's
+conversation socket. Audio is 8 kHz mu-law in both directions (the agent's
+input and output formats are set to ulaw_8000), so the relay never decodes it:
+
+- Caller audio: the base64 payload is sliced out of Twilio's media message
+  and wrapped as ``{"user_audio_chunk": ...}``. There is no JSON parse and
+  no base64 round trip.
+- Agent audio: ``audio_base_64`` is sliced out the same way and wrapped in
+  a Twilio media message built from a per-stream template.
+- Only rare messages (start, stop, ping, interruption, metadata) go through
+  ``json.loads``. Messages that don't match the fast path are fully parsed,
+  so it is never wrong, only sometimes not taken.
+
+Each direction has a writer task fed by an Outbox, a bounded queue:
+
+- Caller audio drops the oldest frame when the queue is full. If the agent
+  socket stalls, late audio is worse than lost audio, and the Twilio reader
+  keeps going, so stop and disconnect are never stuck behind it.
+- Agent audio waits for space. That stops reading the agent socket, so TCP
+  pushes back on the agent instead of the relay buffering without limit.
+- Control messages (pong, clear) skip the queue.
+
+On an interruption the queued agent audio is dropped and ``clear`` goes to
+Twilio ahead of everything else. Audio still arriving for the interrupted
+response (event_id at or below the interruption's) is discarded, so the
+caller never hears the old answer carry on.
+
+When the agent ends the conversation, the audio already queued is sent,
+followed by a mark. The Twilio socket is closed only when Twilio echoes
+the mark back (its playback reached it), so the goodbye is not cut off.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+from typing import AsyncIterable, Awaitable, Callable, Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Twilio sends compact JSON with "event" first, so a media message starts with this
+_TWILIO_MEDIA_HEAD = '{"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+# Inside a JSON string these would be escaped, so a match is always the real key
+_AGENT_AUDIO_KEY = re.compile(r'"audio_base_64":\s*"')
+_EVENT_ID = re.compile(r'"event_id":\s*(\d+)')
+_PLAYED_OUT_MARK = "agent-finished"
+
+def twilio_payload(message: str) -> Optional[str]:
+    """Base64 payload of a Twilio media message, or None if the message needs a full parse"""
+    if message.startswith(_TWILIO_MEDIA_HEAD):
+        start = message.find(_PAYLOAD_KEY)
+        if start >= 0:
+            start += len(_PAYLOAD_KEY)
+            end = message.find('"', start)
+            if end > 0:
+                return message[start:end]
+    return None
+
+def agent_audio(message: str) -> Optional[Tuple[str, int]]:
+    """(base64 audio, event_id) of an agent audio message, or None if it needs a full parse"""
+    key = _AGENT_AUDIO_KEY.search(message)
+    if key is None:
+        return None
+    end = message.find('"', key.end())
+    event_id = _EVENT_ID.search(message)
+    if end < 0 or event_id is None:
+        return None
+    return message[key.end():end], int(event_id.group(1))
+
+class Outbox:
+    """Bounded audio queue for one direction, plus a control lane that is always sent first"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._audio: Deque[Tuple[str, float]] = deque()
+        self._control: Deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self.closed = False
+        self.dropped = 0
+        self.waits = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._audio)
+
+    def _append(self, payload: str) -> None:
+        self._audio.append((payload, time.perf_counter()))
+        if len(self._audio) > self.max_depth:
+            self.max_depth = len(self._audio)
+        self._ready.set()
+
+    def offer(self, payload: str) -> None:
+        """Queue audio, dropping the oldest frame if full (never waits)"""
+        if self.closed:
+            return
+        if len(self._audio) >= self.maxsize:
+            self._audio.popleft()
+            self.dropped += 1
+        self._append(payload)
+
+    async def put(self, payload: str) -> None:
+        """Queue audio, waiting for the writer to make room if full"""
+        if len(self._audio) >= self.maxsize:
+            self.waits += 1
+            while len(self._audio) >= self.maxsize and not self.closed:
+                self._space.clear()
+                await self._space.wait()
+        if not self.closed:
+            self._append(payload)
+
+    def put_control(self, message: str) -> None:
+        if not self.closed:
+            self._control.append(message)
+            self._ready.set()
+
+    def discard_audio(self) -> int:
+        """Drop all queued audio; returns how many frames were dropped"""
+        count = len(self._audio)
+        self._audio.clear()
+        self._space.set()
+        return count
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+        self._space.set()
+
+    async def drain(self, send_control: Callable[[str], Awaitable[None]],
+                    send_audio: Callable[[str, float], Awaitable[None]]) -> None:
+        """Writer loop: control messages first, then audio, until closed and empty"""
+        while True:
+            if self._control:
+                await send_control(self._control.popleft())
+            elif self._audio:
+                payload, queued_at = self._audio.popleft()
+                self._space.set()
+                await send_audio(payload, queued_at)
+            elif self.closed:
+                return
+            else:
+                self._ready.clear()
+                await self._ready.wait()
+
+def _percentile(samples, q: float) -> Optional[float]:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3) if ordered else None
+
+class RelayStats:
+    """Counters across all calls on this server, for the health endpoint"""
+
+    def __init__(self, window: int = 5000):
+        self.active_calls = 0
+        self.calls = 0
+        self.connect_failures = 0
+        self.caller_frames = 0
+        self.agent_frames = 0
+        self.caller_frames_dropped = 0
+        self.agent_frames_cleared = 0
+        self.stale_frames_dropped = 0
+        self.interruptions = 0
+        self.backpressure_waits = 0
+        self.connect_times: Deque[float] = deque(maxlen=200)
+        self.uplink_times: Deque[float] = deque(maxlen=window)
+        self.downlink_times: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> dict:
+        return {
+            "active_calls": self.active_calls,
+            "calls": self.calls,
+            "connect_failures": self.connect_failures,
+            "caller_frames": self.caller_frames,
+            "agent_frames": self.agent_frames,
+            "caller_frames_dropped": self.caller_frames_dropped,
+            "agent_frames_cleared": self.agent_frames_cleared,
+            "stale_frames_dropped": self.stale_frames_dropped,
+            "interruptions": self.interruptions,
+            "backpressure_waits": self.backpressure_waits,
+            "connect_p50_ms": _percentile(self.connect_times, 0.5),
+            "uplink_p50_ms": _percentile(self.uplink_times, 0.5),
+            "uplink_p99_ms": _percentile(self.uplink_times, 0.99),
+            "downlink_p50_ms": _percentile(self.downlink_times, 0.5),
+            "downlink_p99_ms": _percentile(self.downlink_times, 0.99),
+        }
+
+class MediaRelay:
+    """Relays one call between Twilio and the agent"""
+
+    def __init__(self, stats: RelayStats, uplink_queue: int = 50, downlink_queue: int = 500,
+                 connect_timeout: float = 10.0, play_out_timeout: float = 15.0):
+        self.stats = stats
+        self.uplink = Outbox(uplink_queue)
+        self.downlink = Outbox(downlink_queue)
+        self.connect_timeout = connect_timeout
+        self.play_out_timeout = play_out_timeout
+        self.stream_sid: Optional[str] = None
+        self.agent = None
+        self._media_prefix = ""
+        self._clear: Optional[str] = None
+        self._mark = ""
+        self._started = asyncio.Event()
+        self._played_out = asyncio.Event()
+        # Agent audio at or below this event_id belongs to an interrupted response
+        self._interrupted_id = -1
+        self._last_event_id = -1
+
+    async def run(self, twilio_messages: AsyncIterable[str], twilio_send: Callable[[str], Awaitable[None]],
+                  agent_task: "asyncio.Task") -> None:
+        """Relay until either side hangs up
+
+        ``agent_task`` (signed URL plus agent websocket) is already running, so
+        the agent handshake overlaps with accepting Twilio and its start message.
+        Caller audio that arrives first waits in the uplink queue.
+        """
+        self.stats.calls += 1
+        self.stats.active_calls += 1
+        started = time.perf_counter()
+        twilio_reader = asyncio.create_task(self._read_twilio(twilio_messages))
+        tasks = [twilio_reader]
+        try:
+            done, _ = await asyncio.wait({agent_task, twilio_reader}, timeout=self.connect_timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if agent_task not in done:
+                if twilio_reader not in done:
+                    self.stats.connect_failures += 1
+                    logger.error(f"No ElevenLabs agent connection after {self.connect_timeout:.0f}s")
+                return
+            try:
+                self.agent = agent_task.result()
+            except Exception as e:
+                self.stats.connect_failures += 1
+                logger.error(f"Could not connect to the ElevenLabs agent: {e}")
+                return
+            self.stats.connect_times.append(time.perf_counter() - started)
+
+            agent_reader = asyncio.create_task(self._read_agent())
+            twilio_writer = asyncio.create_task(self._write_twilio(twilio_send))
+            tasks += [
+                agent_reader,
+                twilio_writer,
+                asyncio.create_task(self.uplink.drain(self.agent.send, self._send_caller_audio)),
+            ]
+            done, _ = await asyncio.wait({twilio_reader, agent_reader}, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.warning(f"Media relay {'Twilio' if task is twilio_reader else 'agent'} "
+                                   f"side failed: {task.exception()!r}")
+            if twilio_reader not in done:
+                await self._play_out(twilio_send, twilio_writer)
+        finally:
+            self.uplink.close()
+            self.downlink.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if not agent_task.done():
+                agent_task.cancel()
+                await asyncio.gather(agent_task, return_exceptions=True)
+            if self.agent is None and not agent_task.cancelled() and agent_task.exception() is None:
+                # The agent connected after Twilio had already gone
+                self.agent = agent_task.result()
+            if self.agent is not None:
+                await self.agent.close()
+            self._finish()
+
+    async def _play_out(self, twilio_send: Callable[[str], Awaitable[None]], twilio_writer: "asyncio.Task") -> None:
+        """The agent hung up: send what is queued, then wait until Twilio has played it"""
+        self.downlink.close()
+        if not self._started.is_set():
+            return
+        done, _ = await asyncio.wait({twilio_writer}, timeout=self.play_out_timeout)
+        if twilio_writer not in done or twilio_writer.exception() is not None:
+            return
+        try:
+            await twilio_send(self._mark)
+            await asyncio.wait_for(self._played_out.wait(), self.play_out_timeout)
+        except Exception as e:
+            logger.info(f"Stream {self.stream_sid} closed before the agent's last audio played: {e!r}")
+
+    def _finish(self) -> None:
+        stats = self.stats
+        stats.active_calls -= 1
+        stats.caller_frames_dropped += self.uplink.dropped
+        stats.backpressure_waits += self.downlink.waits
+        logger.info(f"Stream {self.stream_sid} relay finished: {self.uplink.dropped} caller frames dropped, "
+                    f"{self.downlink.waits} backpressure waits, max queue depth "
+                    f"{self.uplink.max_depth} up / {self.downlink.max_depth} down")
+
+    async def _read_twilio(self, messages: AsyncIterable[str]) -> None:
+        try:
+            await self._relay_twilio(messages)
+        finally:
+            # Nothing left to wait for once Twilio is gone
+            self._played_out.set()
+
+    async def _relay_twilio(self, messages: AsyncIterable[str]) -> None:
+        async for message in messages:
+            payload = twilio_payload(message)
+            if payload is not None:
+                self.stats.caller_frames += 1
+                self.uplink.offer(payload)
+                continue
+            try:
+                data = json.loads(message)
+                event = data.get("event")
+                if event == "media":
+                    self.stats.caller_frames += 1
+                    self.uplink.offer(data["media"]["payload"])
+                elif event == "start":
+                    self._start(data["start"]["streamSid"])
+                elif event == "stop":
+                    logger.info(f"Twilio stream {self.stream_sid} stopped")
+                    return
+                elif event == "mark":
+                    if data["mark"]["name"] == _PLAYED_OUT_MARK:
+                        self._played_out.set()
+                elif event != "connected":
+                    logger.info(f"Unhandled Twilio event: {event}")
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Error processing Twilio message: {e!r}")
+
+    def _start(self, stream_sid: str) -> None:
+        self.stream_sid = stream_sid
+        sid = json.dumps(stream_sid)
+        self._media_prefix = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+        self._clear = '{"event":"clear","streamSid":' + sid + '}'
+        self._mark = '{"event":"mark","streamSid":' + sid + ',"mark":{"name":"' + _PLAYED_OUT_MARK + '"}}'
+        self._started.set()
+        logger.info(f"Twilio stream started: {stream_sid}")
+
+    async def _read_agent(self) -> None:
+        async for message in self.agent:
+            if isinstance(message, bytes):
+                message = message.decode()
+            audio = agent_audio(message)
+            if audio is not None:
+                await self._agent_audio(*audio)
+                continue
+            try:
+                data = json.loads(message)
+                kind = data.get("type")
+                if kind == "audio":
+                    event = data.get("audio_event") or {}
+                    if event.get("audio_base_64"):
+                        await self._agent_audio(event["audio_base_64"], int(event.get("event_id", self._last_event_id)))
+                elif kind == "interruption":
+                    self._interrupt((data.get("interruption_event") or {}).get("event_id"))
+                elif kind == "ping":
+                    event_id = (data.get("ping_event") or {}).get("event_id")
+                    if event_id is not None:
+                        self.uplink.put_control(json.dumps({"type": "pong", "event_id": event_id}))
+                elif kind == "conversation_initiation_metadata":
+                    logger.info("Received conversation initiation metadata")
+            except (ValueError, TypeError) as e:
+                logger.error(f"Error processing agent message: {e!r}")
+
+    async def _agent_audio(self, payload: str, event_id: int) -> None:
+        if event_id <= self._interrupted_id:
+            self.stats.stale_frames_dropped += 1
+            return
+        if event_id > self._last_event_id:
+            self._last_event_id = event_id
+        self.stats.agent_frames += 1
+        await self.downlink.put(payload)
+
+    def _interrupt(self, event_id: Optional[int]) -> None:
+        """Caller barged in: drop queued agent audio and tell Twilio to flush what it buffered"""
+        self._interrupted_id = max(self._interrupted_id, self._last_event_id if event_id is None else int(event_id))
+        cleared = self.downlink.discard_audio()
+        if self._clear is not None:
+            self.downlink.put_control(self._clear)
+        self.stats.interruptions += 1
+        self.stats.agent_frames_cleared += cleared
+
+    async def _send_caller_audio(self, payload: str, queued_at: float) -> None:
+        await self.agent.send('{"user_audio_chunk":"' + payload + '"}')
+        self.stats.uplink_times.append(time.perf_counter() - queued_at)
+
+    async def _write_twilio(self, twilio_send: Callable[[str], Awaitable[None]]) -> None:
+        # Agent audio (the greeting) can arrive before Twilio's start message names the stream
+        await self._started.wait()
+
+        async def send_audio(payload: str, queued_at: float) -> None:
+            await twilio_send(self._media_prefix + payload + '"}}')
+            self.stats.downlink_times.append(time.perf_counter() - queued_at)
+
+        await self.downlink.drain(twilio_send, send_audio)
@@ -0,0 +1,134 @@
+"""
+Menu question latency: local index (menu_index.py) vs a remote corpus query.
+
+    python bench_menu.py --concurrency 20 --queries 2000 --corpus-latency-ms 150
+
+Runs typical caller questions (dishes, prices, dietary tags, policies)
+through:
+
+1. Index build and load: building parses the documents once; loading maps
+   the file, so startup does not depend on document size.
+2. MenuIndex.search, and MenuIndex.answer with a cold and a warm LRU cache.
+3. The queryCorpus path against the stub API (POST /api/corpora/{id}/query),
+   one HTTP round trip plus the stub's retrieval time. Skipped with
+   --no-remote.
+
+Also prints each answer so wrong facets or prices are easy to spot.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from menu_index import MenuIndex, build
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--documents", nargs="+", default=[
+    os.path.join(HERE, "..", "..", "twilio_ultravox_agent_server", "menu.md"),
+    os.path.join(HERE, "policies.md"),
+])
+parser.add_argument("--queries", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, default=20)
+parser.add_argument("--port", type=int, default=9001)
+parser.add_argument("--latency-ms", type=float, default=20.0, help="stub API latency")
+parser.add_argument("--corpus-latency-ms", type=float, default=150.0, help="stub retrieval time per query")
+parser.add_argument("--no-remote", action="store_true")
+parser.add_argument("--show-answers", action="store_true")
+args = parser.parse_args()
+
+QUESTIONS = [
+    "is the risotto gluten-free",
+    "what vegan dishes do you have",
+    "does the chocolate torte have nuts",
+    "is the margherita vegan",
+    "how much is the osso buco",
+    "do you have wheelchair access",
+    "what's your cancellation policy",
+    "is the carbonara dairy free",
+    "can I bring a birthday cake",
+    "gluten free pizza",
+    "any vegetarian desserts",
+    "what soups do you have",
+    "do you have a kids menu",
+    "is the tiramisu vegetarian",
+    "dairy free options",
+    "what time do you close",
+]
+
+def percentiles(samples) -> str:
+    ordered = sorted(samples)
+    return (f"p50={ordered[len(ordered) // 2] * 1e6:9.1f} us  p99={ordered[int(len(ordered) * 0.99)] * 1e6:9.1f} us"
+            f"  mean={statistics.mean(samples) * 1e6:9.1f} us")
+
+def timed(label: str, operation, questions) -> None:
+    samples = []
+    for question in questions:
+        started = time.perf_counter()
+        operation(question)
+        samples.append(time.perf_counter() - started)
+    print(f"  {label:<28} {percentiles(samples)}")
+
+def bench_local(path: str, questions) -> None:
+    started = time.perf_counter()
+    count = build(args.documents, path)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    index = MenuIndex(path)
+    loaded = time.perf_counter() - started
+    print(f"index: {count} passages, {os.path.getsize(path):,} bytes, "
+          f"build {built * 1000:.1f} ms, load {loaded * 1000:.2f} ms")
+
+    if args.show_answers:
+        for question in QUESTIONS:
+            print(f"  {question!r}: {index.answer(question)['message']}")
+
+    uncached = MenuIndex(path, cache_size=0)
+    timed("search (BM25)", index.search, questions)
+    timed("answer, cache off", uncached.answer, questions)
+    for question in QUESTIONS:
+        index.answer(question)
+    timed("answer, cache warm", index.answer, questions)
+    print(f"  cache {index.cache_stats()}")
+    uncached.close()
+    index.close()
+
+async def bench_remote(questions) -> None:
+    import httpx
+    from stub_ultravox_api import start_stub_server
+
+    server = start_stub_server(args.port, args.latency_ms, args.corpus_latency_ms)
+    url = f"http://127.0.0.1:{args.port}/api/corpora/menu/query"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    samples = []
+    async with httpx.AsyncClient() as client:
+        async def query(question):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(url, json={"query": question, "maxResults": 5})
+                samples.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(query(question) for question in questions))
+        elapsed = time.perf_counter() - started
+    server.should_exit = True
+
+    print(f"remote corpus query ({args.latency_ms:.0f} ms API + {args.corpus_latency_ms:.0f} ms retrieval, "
+          f"{args.concurrency} concurrent): {len(questions) / elapsed:,.0f} queries/s")
+    print(f"  {'queryCorpus round trip':<28} {percentiles(samples)}")
+
+def main():
+    rng = random.Random(0)
+    questions = [rng.choice(QUESTIONS) for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_local(os.path.join(tmp, "menu_index.bin"), questions)
+    if not args.no_remote:
+        asyncio.run(bench_remote(questions[:max(1, args.queries // 10)]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Benchmark the reservation tools with a large booking book.
+
+    python bench_reservations.py --bookings 100000 --concurrency 50 --calls 5000
+
+Tool round trips are silence on the call, so they need to stay flat as the
+book grows. This loads --bookings reservations and then measures:
+
+1. Inventory operations, indexed vs the flat-list approach the TypeScript
+   server uses (availability counts bookings for the date, lookups scan
+   for the code).
+2. Check-and-reserve from many threads racing for the same few seatings,
+   then confirms no seating was sold past its capacity.
+3. Confirmation codes read back the way callers say them (letters, A-B-C,
+   phonetic words, "A for Alpha", "x ray") must normalize to the code,
+   including every code with an X in it.
+4. Concurrent tool calls through the FastAPI app (/tools/check-availability,
+   /tools/make-reservation, /tools/check-booking, /tools/cancel-booking)
+   over an in-process ASGI transport, so only the handler cost is measured.
+   Skipped with --no-http.
+
+Before any of that it checks the guards: a one-letter code space runs out
+with CodesExhausted instead of hanging, and seatings that have started
+today are neither offered nor booked.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from reservations import (PHONETIC_ALPHABET, CodesExhausted, ReservationInventory, SeatingStarted, SlotFull, normalize_code,
+                          spoken_time, to_phonetic)
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--bookings", type=int, default=100_000)
+parser.add_argument("--days", type=int, default=365, help="spread the preloaded bookings over this many days")
+parser.add_argument("--operations", type=int, default=2000, help="per inventory measurement")
+parser.add_argument("--threads", type=int, default=16)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--calls", type=int, default=5000, help="HTTP tool calls")
+parser.add_argument("--no-http", action="store_true")
+args = parser.parse_args()
+
+TODAY = date.today()
+
+class FlatBookings:
+    """The TypeScript server's shape: one list, scanned for everything"""
+
+    def __init__(self, seatings, seats):
+        self.seatings = seatings
+        self.seats = seats
+        self.bookings = []
+
+    def availability(self, day, party_size):
+        booked = {slot: 0 for slot in self.seatings}
+        for booking in self.bookings:
+            if booking.date == day:
+                booked[booking.time] += booking.party_size
+        return [(slot, self.seats - n) for slot, n in booked.items() if self.seats - n >= party_size]
+
+    def lookup(self, code):
+        for booking in self.bookings:
+            if booking.code == code:
+                return booking
+        return None
+
+def preload(inventory: ReservationInventory, count: int, rng: random.Random) -> list:
+    codes = []
+    while len(codes) < count:
+        day = TODAY + timedelta(days=rng.randrange(args.days))
+        try:
+            booking = inventory.reserve("Bench Guest", day, rng.choice(inventory.seatings), rng.randint(1, 6))
+        except (SlotFull, SeatingStarted):
+            continue
+        codes.append(booking.code)
+    return codes
+
+def timed(label: str, operation, inputs) -> None:
+    started = time.perf_counter()
+    for item in inputs:
+        operation(item)
+    per_op = (time.perf_counter() - started) / len(inputs)
+    print(f"  {label:<34} {per_op * 1e6:12.1f} us/op")
+
+def check_guards() -> None:
+    tiny = ReservationInventory(seats_per_seating=1000, code_length=1)
+    day = TODAY + timedelta(days=1)
+    started = time.perf_counter()
+    try:
+        for _ in range(27):
+            tiny.reserve("Guest", day, tiny.seatings[0], 1)
+        raise AssertionError("27 one-letter codes were handed out")
+    except CodesExhausted as e:
+        print(f"one-letter codes ran out after {len(tiny)} bookings in "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms: {e}")
+
+    evening = datetime.combine(TODAY, datetime.min.time()).replace(hour=21, minute=45)
+    offered = [slot for slot, _ in tiny.availability(TODAY, 2, evening)]
+    assert offered == [], offered
+    try:
+        tiny.reserve("Late", TODAY, tiny.seatings[0], 2, now=evening)
+        raise AssertionError("booked a seating that had started")
+    except SeatingStarted:
+        pass
+    print(f"at 21:45 today offers {offered or 'nothing'}, tomorrow offers "
+          f"{len(tiny.availability(day, 2, evening))} seatings")
+
+def bench_inventory(inventory: ReservationInventory, codes: list, rng: random.Random) -> None:
+    flat = FlatBookings(inventory.seatings, inventory.seats_per_seating)
+    flat.bookings = [inventory.lookup(code) for code in codes]
+    days = [TODAY + timedelta(days=rng.randrange(args.days)) for _ in range(args.operations)]
+    lookups = [rng.choice(codes) for _ in range(args.operations)]
+    slow = max(1, args.operations // 20)
+
+    print(f"inventory with {len(inventory):,} bookings")
+    timed("availability (indexed)", lambda day: inventory.availability(day, 4), days)
+    timed("availability (flat list scan)", lambda day: flat.availability(day, 4), days[:slow])
+    timed("lookup by code (indexed)", inventory.lookup, lookups)
+    timed("lookup by code (flat list scan)", flat.lookup, lookups[:slow])
+
+def bench_contention(inventory: ReservationInventory) -> None:
+    """Threads race for the seatings of one fresh date"""
+    day = TODAY + timedelta(days=args.days + 1)
+    sold = {slot: 0 for slot in inventory.seatings}
+    lock = threading.Lock()
+    attempts = inventory.seats_per_seating * len(inventory.seatings)
+
+    def attempt(i):
+        slot = inventory.seatings[i % 3]
+        try:
+            booking = inventory.reserve("Race", day, slot, 2)
+        except SlotFull:
+            return
+        with lock:
+            sold[booking.time] += booking.party_size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(attempt, range(attempts)))
+    elapsed = time.perf_counter() - started
+    oversold = {slot: n for slot, n in sold.items() if n > inventory.seats_per_seating}
+    remaining = dict(inventory.availability(day, 0))
+    consistent = all(remaining[slot] == inventory.seats_per_seating - sold[slot] for slot in inventory.seatings)
+    print(f"{attempts} reservations from {args.threads} threads on 3 seatings: {attempts / elapsed:,.0f}/s, "
+          f"oversold={oversold or 'none'}, seat counts consistent={consistent}")
+
+def spoken_forms(code: str) -> list:
+    """Ways a caller (or the model's transcript) reads a code back"""
+    words = [PHONETIC_ALPHABET[letter] for letter in code]
+    return [
+        code.lower(),
+        ' '.join(code),
+        '-'.join(code),
+        ' '.join(words),
+        ', '.join(words).lower(),
+        ' '.join(words).replace('X-ray', 'x ray'),
+        to_phonetic(code),
+        to_phonetic(code).replace('X-ray', 'x ray'),
+    ]
+
+def bench_codes(codes: list, rng: random.Random) -> None:
+    sample = rng.sample(codes, min(len(codes), args.operations))
+    sample += [code for code in codes if 'X' in code][:args.operations]
+    forms = [(code, form) for code in sample for form in spoken_forms(code)]
+    started = time.perf_counter()
+    wrong = [(code, form) for code, form in forms if normalize_code(form) != code]
+    per_op = (time.perf_counter() - started) / len(forms)
+    print(f"{len(forms):,} spoken codes normalized at {per_op * 1e6:.1f} us each, {len(wrong)} wrong"
+          + (f", e.g. {wrong[0][1]!r} -> {normalize_code(wrong[0][1])}" if wrong else ""))
+    assert not wrong, "confirmation codes did not round-trip"
+
+async def bench_http(inventory: ReservationInventory, codes: list, rng: random.Random) -> None:
+    os.environ.setdefault('ULTRAVOX_API_KEY', 'bench-key')
+    import httpx
+    import main
+
+    main.reservations = inventory
+    latencies = {"check-availability": [], "make-reservation": [], "check-booking": [], "cancel-booking": []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    def request():
+        tool = rng.choice(list(latencies))
+        day = (TODAY + timedelta(days=rng.randrange(args.days))).isoformat()
+        if tool == "check-availability":
+            return tool, {"date": day, "partySize": rng.randint(1, 8)}
+        if tool == "make-reservation":
+            return tool, {"customerName": "Bench Caller", "date": day, "partySize": rng.randint(1, 6),
+                          "time": spoken_time(rng.choice(inventory.seatings))}
+        return tool, {"confirmationCode": rng.choice(codes)}
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://tools") as client:
+        async def call():
+            tool, body = request()
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(f"/tools/{tool}", json=body)
+                latencies[tool].append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(args.calls)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.calls} tool calls, {args.concurrency} concurrent, {len(inventory):,} bookings: "
+          f"{args.calls / elapsed:,.0f} calls/s")
+    for tool, samples in latencies.items():
+        ordered = sorted(samples)
+        print(f"  {tool:<20} p50={ordered[len(ordered) // 2] * 1000:6.2f} ms  "
+              f"p99={ordered[int(len(ordered) * 0.99)] * 1000:6.2f} ms  mean={statistics.mean(samples) * 1000:6.2f} ms")
+
+def main():
+    check_guards()
+    rng = random.Random(0)
+    inventory = ReservationInventory(seats_per_seating=10_000, booking_days=args.days + 1, seed=0)
+    started = time.perf_counter()
+    codes = preload(inventory, args.bookings, rng)
+    print(f"loaded {len(codes):,} bookings in {time.perf_counter() - started:.2f}s")
+    bench_inventory(inventory, codes, rng)
+    bench_contention(ReservationInventory(seats_per_seating=40))
+    bench_codes(codes, rng)
+    if not args.no_http:
+        asyncio.run(bench_http(inventory, codes, rng))
+
+if __name__ == "__main__":
+    main()
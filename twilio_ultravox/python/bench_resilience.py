@@ -0,0 +1,147 @@
+"""
+/incoming under Ultravox API faults: one plain attempt vs ResilientCaller.
+
+    python bench_resilience.py --rate 50 --seconds 4
+
+Rings arrive at a fixed --rate (open loop, like real callers) while the stub
+API (stub_ultravox_api.py) injects faults:
+
+healthy  no faults
+tail     --slow-rate of requests take --slow-ms longer
+errors   --error-rate of requests get a 503
+hangs    --hang-rate of requests never answer
+outage   the API hangs from 25% to 60% of the run, then recovers
+
+plain is a single attempt bounded by the HTTP client's read timeout
+(ULTRAVOX_READ_TIMEOUT, 10 s), with no hedge and no breaker. resilient is
+the server's own ResilientCaller. Both warm up on a healthy API first, so
+the learned timeouts start from real samples. For each run the script
+prints webhook latency, how many callers were connected to the agent vs
+given the fallback TwiML, how many requests reached the API, and the
+caller's outcome counters.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--rate", type=float, default=50.0, help="rings per second")
+parser.add_argument("--seconds", type=float, default=4.0, help="length of each run")
+parser.add_argument("--port", type=int, default=9001)
+parser.add_argument("--latency-ms", type=float, default=20.0)
+parser.add_argument("--slow-rate", type=float, default=0.05)
+parser.add_argument("--slow-ms", type=float, default=3000.0)
+parser.add_argument("--error-rate", type=float, default=0.2)
+parser.add_argument("--hang-rate", type=float, default=0.02)
+parser.add_argument("--scenarios", default="healthy,tail,errors,hangs,outage")
+args = parser.parse_args()
+
+os.environ.setdefault('ULTRAVOX_API_KEY', 'bench-key')
+os.environ['ULTRAVOX_API_URL'] = f"http://127.0.0.1:{args.port}/api/calls"
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+import stub_ultravox_api as stub  # noqa: E402
+from resilient_client import CircuitBreaker, LatencyTracker, ResilientCaller  # noqa: E402
+
+NO_FAULTS = {"error_rate": 0, "slow_rate": 0, "hang_rate": 0}
+SCENARIOS = {
+    "healthy": {},
+    "tail": {"slow_rate": args.slow_rate, "slow_ms": args.slow_ms},
+    "errors": {"error_rate": args.error_rate},
+    "hangs": {"hang_rate": args.hang_rate},
+    "outage": {},
+}
+
+def plain_caller() -> ResilientCaller:
+    """One attempt, the client's read timeout, a breaker that never opens"""
+    return ResilientCaller(
+        latency=LatencyTracker(initial_timeout=main.ULTRAVOX_READ_TIMEOUT, min_samples=10**9),
+        breaker=CircuitBreaker(failure_threshold=10**9),
+        max_attempts=1
+    )
+
+def resilient_caller() -> ResilientCaller:
+    """The server's configuration"""
+    return ResilientCaller(
+        latency=LatencyTracker(
+            initial_timeout=main.ULTRAVOX_TIMEOUT_INITIAL,
+            timeout_multiplier=main.ULTRAVOX_TIMEOUT_MULTIPLIER,
+            min_timeout=main.ULTRAVOX_TIMEOUT_MIN,
+            max_timeout=main.ULTRAVOX_TIMEOUT_MAX
+        ),
+        breaker=CircuitBreaker(
+            failure_threshold=main.ULTRAVOX_CIRCUIT_FAILURES,
+            reset_timeout=main.ULTRAVOX_CIRCUIT_RESET_SECONDS,
+            max_reset_timeout=main.ULTRAVOX_CIRCUIT_RESET_MAX_SECONDS
+        ),
+        hedge_budget=main.ULTRAVOX_HEDGE_BUDGET
+    )
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+async def rings(twilio: httpx.AsyncClient, count: int, on_ring=None) -> list:
+    """Send ``count`` rings at --rate; (latency, connected) per ring"""
+    results = []
+
+    async def ring():
+        started = time.perf_counter()
+        response = await twilio.post("/incoming", data={"CallSid": "CAbench"})
+        assert response.status_code == 200, response.text
+        results.append((time.perf_counter() - started, "<Stream" in response.text))
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(count):
+        if on_ring is not None:
+            on_ring(i / count)
+        tasks.append(asyncio.create_task(ring()))
+        await asyncio.sleep(max(0.0, started + (i + 1) / args.rate - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return results
+
+async def run(scenario: str, mode: str) -> None:
+    main.ultravox_api = plain_caller() if mode == "plain" else resilient_caller()
+    stub.configure_faults(**NO_FAULTS)
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://webhook", timeout=60) as twilio:
+            await rings(twilio, 50)
+            main.ultravox_api.outcomes = dict.fromkeys(main.ultravox_api.outcomes, 0)
+            stub.configure_faults(**SCENARIOS[scenario])
+            api_requests = stub.FAULT_COUNTS["requests"]
+
+            def outage(progress: float) -> None:
+                stub.configure_faults(hang_rate=1 if 0.25 <= progress < 0.6 else 0)
+
+            started = time.perf_counter()
+            results = await rings(twilio, int(args.rate * args.seconds), outage if scenario == "outage" else None)
+            elapsed = time.perf_counter() - started
+            api_requests = stub.FAULT_COUNTS["requests"] - api_requests
+
+    latencies = [latency for latency, _ in results]
+    connected = sum(1 for _, ok in results if ok)
+    stats = main.ultravox_api.stats()
+    outcomes = ", ".join(f"{name}={count}" for name, count in stats["outcomes"].items() if count)
+    print(f"{scenario:<8} {mode:<9} p50={percentile(latencies, 0.5) * 1000:7.1f} ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:8.1f} ms  max={max(latencies) * 1000:8.1f} ms  "
+          f"connected={connected}/{len(results)}  api requests={api_requests}  run {elapsed:.1f}s")
+    print(f"{'':<18} {outcomes}; timeout {stats['timeout_ms']} ms, hedge after {stats['hedge_after_ms']} ms, "
+          f"circuit opened {stats['circuit_opened']}x")
+
+async def bench():
+    print(f"{args.rate:.0f} rings/s for {args.seconds:.0f}s per run, stub latency {args.latency_ms} ms")
+    for scenario in args.scenarios.split(","):
+        for mode in ("plain", "resilient"):
+            await run(scenario, mode)
+
+if __name__ == "__main__":
+    server = stub.start_stub_server(args.port, args.latency_ms)
+    try:
+        asyncio.run(bench())
+    finally:
+        server.should_exit = True
@@ -0,0 +1,96 @@
+"""
+Benchmark /incoming webhook latency: pooled app-lifetime client vs a new
+httpx.AsyncClient per call (the previous behaviour).
+
+    python bench_webhook.py --concurrency 50 --rings 1000
+
+The stub API runs on localhost without TLS, so the measured gain only covers
+TCP setup and connection churn. Against api.ultravox.ai the per-call client
+also pays a TLS handshake on every ring, so the real gain is larger.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--rings", type=int, default=1000)
+parser.add_argument("--port", type=int, default=9001)
+parser.add_argument("--latency-ms", type=float, default=20.0)
+parser.add_argument("--pool-size", type=int, default=0, help="also benchmark with a warm call pool of this size")
+args = parser.parse_args()
+
+os.environ.setdefault('ULTRAVOX_API_KEY', 'bench-key')
+os.environ['ULTRAVOX_API_URL'] = f"http://127.0.0.1:{args.port}/api/calls"
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from stub_ultravox_api import start_stub_server  # noqa: E402
+
+async def create_call_per_request_client(client: httpx.AsyncClient, config: dict = None) -> dict:
+    """Previous behaviour: a fresh client (and connection) for every call"""
+    async with httpx.AsyncClient() as fresh:
+        response = await fresh.post(
+            main.ULTRAVOX_API_URL,
+            json=main.ULTRAVOX_CALL_CONFIG,
+            headers={'Content-Type': 'application/json', 'X-API-Key': main.ULTRAVOX_API_KEY},
+            timeout=30.0
+        )
+        response.raise_for_status()
+        return response.json()
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def run(label: str) -> None:
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with main.lifespan(main.app):
+        pool = main.app.state.call_pool
+        while pool is not None and pool.stats()["ready"] < pool.size:
+            await asyncio.sleep(0.05)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://webhook") as twilio:
+            async def ring():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await twilio.post("/incoming", data={"CallSid": "CAbench"})
+                    latencies.append(time.perf_counter() - start)
+                    assert response.status_code == 200 and "Stream" in response.text, response.text
+
+            started = time.perf_counter()
+            await asyncio.gather(*(ring() for _ in range(args.rings)))
+            elapsed = time.perf_counter() - started
+
+        if pool is not None:
+            label = f"{label} ({pool.stats()['hits']} hits)"
+
+    print(
+        f"{label:<30} p50={percentile(latencies, 0.50) * 1000:7.1f} ms  "
+        f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+        f"mean={statistics.mean(latencies) * 1000:7.1f} ms  "
+        f"rings/s={args.rings / elapsed:8.1f}"
+    )
+
+async def bench():
+    print(f"{args.rings} rings, {args.concurrency} concurrent, stub latency {args.latency_ms} ms")
+    pooled = main.create_ultravox_call
+    main.create_ultravox_call = create_call_per_request_client
+    await run("client per call")
+    main.create_ultravox_call = pooled
+    await run("pooled client")
+    if args.pool_size:
+        main.ULTRAVOX_CALL_POOL_SIZE = args.pool_size
+        await run("warm call pool")
+
+if __name__ == "__main__":
+    server = start_stub_server(args.port, args.latency_ms)
+    try:
+        asyncio.run(bench())
+    finally:
+        server.should_exit = True
@@ -0,0 +1,145 @@
+"""
+Warm pool of pre-created Ultravox calls.
+
+Ultravox calls are created ahead of time so /incoming can hand Twilio a join
+URL without waiting on POST /api/calls. Each pooled call is only valid until
+its joinTimeout expires on the Ultravox side, so entries carry a TTL that is
+kept safely below that timeout and stale entries are discarded on pop.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class PooledCall:
+    """A pre-created Ultravox call waiting for a caller"""
+
+    __slots__ = ("join_url", "call_id", "expires_at")
+
+    def __init__(self, join_url: str, call_id: Optional[str], expires_at: float):
+        self.join_url = join_url
+        self.call_id = call_id
+        self.expires_at = expires_at
+
+class UltravoxCallPool:
+    """Keeps up to ``size`` Ultravox calls ready and refills them in the background"""
+
+    def __init__(
+        self,
+        create_call: Callable[[], Awaitable[dict]],
+        size: int,
+        ttl_seconds: float,
+        refill_interval: float = 1.0,
+        refill_concurrency: int = 4
+    ):
+        self._create_call = create_call
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self.refill_interval = refill_interval
+        self.refill_concurrency = refill_concurrency
+
+        # Oldest entries are on the left so they are handed out before they expire
+        self._calls: Deque[PooledCall] = deque()
+        self._in_flight = 0
+        self._wakeup = asyncio.Event()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.created = 0
+        self.refill_errors = 0
+
+    def start(self) -> None:
+        """Start the background refill loop"""
+        if self._refill_task is None:
+            self._refill_task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self) -> None:
+        """Stop refilling; pooled calls are left to time out on the Ultravox side"""
+        if self._refill_task is not None:
+            # The flag covers wait_for swallowing a cancel that races the wakeup
+            self._stopping = True
+            self._wakeup.set()
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+            self._stopping = False
+        self._calls.clear()
+
+    def acquire(self) -> Optional[PooledCall]:
+        """Pop a ready call, or return None so the caller can create one synchronously"""
+        now = time.monotonic()
+        while self._calls:
+            call = self._calls.popleft()
+            if call.expires_at > now:
+                self.hits += 1
+                self._wakeup.set()
+                return call
+            self.expired += 1
+
+        self.misses += 1
+        self._wakeup.set()
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """Pool counters for the health endpoint"""
+        return {
+            "size": self.size,
+            "ready": len(self._calls),
+            "in_flight": self._in_flight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "created": self.created,
+            "refill_errors": self.refill_errors,
+        }
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        while self._calls and self._calls[0].expires_at <= now:
+            self._calls.popleft()
+            self.expired += 1
+
+    async def _create_one(self) -> bool:
+        try:
+            response = await self._create_call()
+            self._calls.append(PooledCall(
+                join_url=response['joinUrl'],
+                call_id=response.get('callId'),
+                expires_at=time.monotonic() + self.ttl_seconds
+            ))
+            self.created += 1
+            return True
+        except Exception as e:
+            self.refill_errors += 1
+            logger.warning(f"Failed to pre-create Ultravox call for pool: {e}")
+            return False
+        finally:
+            self._in_flight -= 1
+
+    async def _refill_loop(self) -> None:
+        while not self._stopping:
+            self._evict_expired()
+            missing = self.size - len(self._calls) - self._in_flight
+            batch = min(missing, self.refill_concurrency)
+            if batch > 0:
+                self._in_flight += batch
+                results = await asyncio.gather(*(self._create_one() for _ in range(batch)))
+                if not any(results):
+                    # API is failing: back off instead of hammering it
+                    await asyncio.sleep(self.refill_interval * 5)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -1,21 +1,82 @@
 import os
 import asyncio
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import Response
 import httpx
+from pydantic import BaseModel, Field
 from twilio.twiml.voice_response import VoiceResponse
 import logging
 
+from call_pool import UltravoxCallPool
+from menu_index import TAG_NAMES, MenuIndex
+from resilient_client import CircuitBreaker, CircuitOpenError, LatencyTracker, ResilientCaller
+from reservations import (CodesExhausted, ReservationInventory, SeatingStarted, SlotFull, normalize_code, parse_date,
+                          parse_time, spoken_time, to_phonetic)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Ultravox FastAPI Server")
-
 # Configuration
 ULTRAVOX_API_KEY = os.getenv('ULTRAVOX_API_KEY')
-ULTRAVOX_API_URL = 'https://api.ultravox.ai/api/calls'
+ULTRAVOX_API_URL = os.getenv('ULTRAVOX_API_URL', 'https://api.ultravox.ai/api/calls')
+
+# HTTP client configuration (one pooled client for the lifetime of the app)
+ULTRAVOX_HTTP2 = os.getenv('ULTRAVOX_HTTP2', 'true').lower() == 'true'
+ULTRAVOX_MAX_CONNECTIONS = int(os.getenv('ULTRAVOX_MAX_CONNECTIONS', '100'))
+ULTRAVOX_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('ULTRAVOX_MAX_KEEPALIVE_CONNECTIONS', '20'))
+ULTRAVOX_KEEPALIVE_EXPIRY = float(os.getenv('ULTRAVOX_KEEPALIVE_EXPIRY', '60.0'))
+ULTRAVOX_CONNECT_TIMEOUT = float(os.getenv('ULTRAVOX_CONNECT_TIMEOUT', '3.0'))
+ULTRAVOX_READ_TIMEOUT = float(os.getenv('ULTRAVOX_READ_TIMEOUT', '10.0'))
+ULTRAVOX_POOL_TIMEOUT = float(os.getenv('ULTRAVOX_POOL_TIMEOUT', '2.0'))
+
+# Call creation: deadlines follow the observed latency (p99 x multiplier, clamped to
+# min/max; the initial value is used until there are enough samples), a hedged second
+# request starts at the p95, and the circuit opens after consecutive failures. Its
+# cool-down doubles from RESET to RESET_MAX while the API stays down.
+# Twilio waits about 15 s for the webhook, so the max stays well below that.
+ULTRAVOX_TIMEOUT_INITIAL = float(os.getenv('ULTRAVOX_TIMEOUT_INITIAL', '5.0'))
+ULTRAVOX_TIMEOUT_MIN = float(os.getenv('ULTRAVOX_TIMEOUT_MIN', '4.0'))
+ULTRAVOX_TIMEOUT_MAX = float(os.getenv('ULTRAVOX_TIMEOUT_MAX', '8.0'))
+ULTRAVOX_TIMEOUT_MULTIPLIER = float(os.getenv('ULTRAVOX_TIMEOUT_MULTIPLIER', '3.0'))
+ULTRAVOX_HEDGE_BUDGET = float(os.getenv('ULTRAVOX_HEDGE_BUDGET', '0.1'))
+ULTRAVOX_CIRCUIT_FAILURES = int(os.getenv('ULTRAVOX_CIRCUIT_FAILURES', '5'))
+ULTRAVOX_CIRCUIT_RESET_SECONDS = float(os.getenv('ULTRAVOX_CIRCUIT_RESET_SECONDS', '1.0'))
+ULTRAVOX_CIRCUIT_RESET_MAX_SECONDS = float(os.getenv('ULTRAVOX_CIRCUIT_RESET_MAX_SECONDS', '30.0'))
+# A hedge that loses is cancelled here but may still create a call at Ultravox;
+# the join timeout bounds how long that orphan lives. Twilio joins within seconds.
+ULTRAVOX_JOIN_TIMEOUT = int(os.getenv('ULTRAVOX_JOIN_TIMEOUT', '15'))
+# When the API is down, callers are transferred here (or just hear an apology if unset)
+ULTRAVOX_FALLBACK_NUMBER = os.getenv('ULTRAVOX_FALLBACK_NUMBER')
+ULTRAVOX_FALLBACK_MESSAGE = os.getenv(
+    'ULTRAVOX_FALLBACK_MESSAGE', 'Sorry, our assistant is unavailable right now. Please call back in a few minutes.')
+
+# Warm call pool (0 disables it). The TTL must stay below the join timeout
+# Ultravox applies to pooled calls, otherwise callers get dead join URLs.
+ULTRAVOX_CALL_POOL_SIZE = int(os.getenv('ULTRAVOX_CALL_POOL_SIZE', '0'))
+ULTRAVOX_CALL_POOL_TTL = float(os.getenv('ULTRAVOX_CALL_POOL_TTL', '45'))
+ULTRAVOX_CALL_POOL_JOIN_TIMEOUT = int(os.getenv('ULTRAVOX_CALL_POOL_JOIN_TIMEOUT', '60'))
+
+# Reservation tools, offered to the agent when TOOLS_BASE_URL (this server's public URL) is set
+TOOLS_BASE_URL = os.getenv('TOOLS_BASE_URL')
+RESERVATION_SEATS_PER_SEATING = int(os.getenv('RESERVATION_SEATS_PER_SEATING', '40'))
+RESERVATION_MAX_PARTY_SIZE = int(os.getenv('RESERVATION_MAX_PARTY_SIZE', '12'))
+RESERVATION_CODE_LENGTH = int(os.getenv('RESERVATION_CODE_LENGTH', '4'))
+# Past dates are dropped from the inventory on this schedule, freeing their codes
+RESERVATION_PRUNE_INTERVAL = float(os.getenv('RESERVATION_PRUNE_INTERVAL', '3600'))
+
+# Menu questions are answered from a local index instead of a remote corpus query.
+# The index is rebuilt at startup when any of the documents is newer than it.
+_HERE = os.path.dirname(os.path.abspath(__file__))
+MENU_INDEX_PATH = os.getenv('MENU_INDEX_PATH', os.path.join(_HERE, 'menu_index.bin'))
+MENU_DOCUMENTS = [path for path in os.getenv('MENU_DOCUMENTS', ','.join([
+    os.path.join(_HERE, '..', '..', 'twilio_ultravox_agent_server', 'menu.md'),
+    os.path.join(_HERE, 'policies.md'),
+])).split(',') if path]
+MENU_ANSWER_CACHE_SIZE = int(os.getenv('MENU_ANSWER_CACHE_SIZE', '1024'))
 
 if not ULTRAVOX_API_KEY:
     raise ValueError("ULTRAVOX_API_KEY environment variable is required")
@@ -23,42 +84,210 @@ if not ULTRAVOX_API_KEY:
 # Ultravox configuration
 SYSTEM_PROMPT = 'Your name is Steve. You are receiving a phone call. Ask them their name and see how they are doing.'
 
+TOOLS_PROMPT = (
+    ' You can also take table reservations: check availability first, then book, and read back the'
+    ' confirmation code letter by letter using the phonetic alphabet. Callers can look up a booking by its code,'
+    ' or cancel it once they have confirmed the booking you read back is the one to cancel.'
+    ' For questions about dishes, prices, dietary needs or restaurant policies, use queryMenu.'
+)
+
+def body_parameter(name: str, schema: dict, required: bool = True) -> dict:
+    return {"name": name, "location": "PARAMETER_LOCATION_BODY", "schema": schema, "required": required}
+
+def agent_tools(base_url: str) -> list:
+    """Ultravox temporary tools pointing at the /tools endpoints below"""
+    party_size = {"type": "number", "description": "Number of people in the party",
+                  "minimum": 1, "maximum": RESERVATION_MAX_PARTY_SIZE}
+    tools = [
+        ("checkAvailability", "Check available reservation times for a date and party size", "check-availability", [
+            body_parameter("date", {"type": "string", "description": "YYYY-MM-DD, or today, tomorrow, a weekday name"}),
+            body_parameter("partySize", party_size),
+        ]),
+        ("makeReservation", "Book a table once the caller has chosen a time", "make-reservation", [
+            body_parameter("customerName", {"type": "string", "description": "Name for the reservation"}),
+            body_parameter("date", {"type": "string", "description": "YYYY-MM-DD, or today, tomorrow, a weekday name"}),
+            body_parameter("time", {"type": "string", "description": "Time, e.g. 7:30 PM"}),
+            body_parameter("partySize", party_size),
+            body_parameter("specialRequirements", {"type": "string", "description": "Any special requests"}, required=False),
+        ]),
+        ("checkBooking", "Look up an existing reservation by confirmation code", "check-booking", [
+            body_parameter("confirmationCode", {"type": "string", "description": "The code, as letters or phonetic words"}),
+        ]),
+        ("cancelBooking", "Cancel a reservation by confirmation code once the caller has confirmed", "cancel-booking", [
+            body_parameter("confirmationCode", {"type": "string", "description": "The code, as letters or phonetic words"}),
+        ]),
+        ("queryMenu", "Answer questions about the menu, prices, dietary options and restaurant policies", "menu", [
+            body_parameter("question", {"type": "string", "description": "The caller's question"}),
+            body_parameter("dietary", {"type": "array", "items": {"type": "string", "enum": list(TAG_NAMES)},
+                                       "description": "Dietary needs the caller mentioned earlier"}, required=False),
+        ]),
+    ]
+    return [{
+        "temporaryTool": {
+            "modelToolName": name,
+            "description": description,
+            "dynamicParameters": parameters,
+            "http": {"baseUrlPattern": f"{base_url.rstrip('/')}/tools/{path}", "httpMethod": "POST"},
+        }
+    } for name, description, path, parameters in tools]
+
 ULTRAVOX_CALL_CONFIG = {
-    "systemPrompt": SYSTEM_PROMPT,
+    "systemPrompt": SYSTEM_PROMPT + (TOOLS_PROMPT if TOOLS_BASE_URL else ''),
     "model": "fixie-ai/ultravox",
     "voice": "Mark",
     "temperature": 0.3,
     "firstSpeaker": "FIRST_SPEAKER_AGENT",
-    "medium": {"twilio": {}}
+    "medium": {"twilio": {}},
+    "joinTimeout": f"{ULTRAVOX_JOIN_TIMEOUT}s"
 }
+if TOOLS_BASE_URL:
+    ULTRAVOX_CALL_CONFIG["selectedTools"] = agent_tools(TOOLS_BASE_URL)
 
-async def create_ultravox_call() -> dict:
-    """Create Ultravox call and get join URL"""
-    async with httpx.AsyncClient() as client:
+POOLED_CALL_CONFIG = {
+    **ULTRAVOX_CALL_CONFIG,
+    "joinTimeout": f"{ULTRAVOX_CALL_POOL_JOIN_TIMEOUT}s"
+}
+
+def fallback_twiml() -> str:
+    """TwiML for callers when no Ultravox call can be created, built once at import"""
+    twiml = VoiceResponse()
+    if ULTRAVOX_FALLBACK_NUMBER:
+        twiml.say('Sorry, our assistant is unavailable right now. Connecting you to a member of staff.')
+        twiml.dial(ULTRAVOX_FALLBACK_NUMBER)
+    else:
+        twiml.say(ULTRAVOX_FALLBACK_MESSAGE)
+    return str(twiml)
+
+FALLBACK_TWIML = fallback_twiml()
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the pooled keep-alive client used for all Ultravox API calls"""
+    http2 = ULTRAVOX_HTTP2
+    if http2:
         try:
-            response = await client.post(
-                ULTRAVOX_API_URL,
-                json=ULTRAVOX_CALL_CONFIG,
-                headers={
-                    'Content-Type': 'application/json',
-                    'X-API-Key': ULTRAVOX_API_KEY
-                },
-                timeout=30.0
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error calling Ultravox API: {e.response.status_code} - {e.response.text}")
-            raise HTTPException(
-                status_code=502,
-                detail=f"Ultravox API error: {e.response.status_code}"
-            )
-        except httpx.RequestError as e:
-            logger.error(f"Request error calling Ultravox API: {e}")
-            raise HTTPException(
-                status_code=502,
-                detail="Failed to connect to Ultravox API"
-            )
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("ULTRAVOX_HTTP2 enabled but 'h2' is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    logger.info(f"Creating Ultravox HTTP client (http2={http2}, max_connections={ULTRAVOX_MAX_CONNECTIONS})")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=ULTRAVOX_MAX_CONNECTIONS,
+            max_keepalive_connections=ULTRAVOX_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=ULTRAVOX_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=ULTRAVOX_CONNECT_TIMEOUT,
+            read=ULTRAVOX_READ_TIMEOUT,
+            write=ULTRAVOX_READ_TIMEOUT,
+            pool=ULTRAVOX_POOL_TIMEOUT
+        ),
+        headers={
+            'Content-Type': 'application/json',
+            'X-API-Key': ULTRAVOX_API_KEY
+        }
+    )
+
+async def prune_reservations(interval: float) -> None:
+    """Drop bookings for past dates every ``interval`` seconds"""
+    while True:
+        pruned = reservations.prune()
+        if pruned:
+            logger.info(f"Pruned {pruned} past reservations")
+        await asyncio.sleep(interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared Ultravox HTTP client on startup and close it on shutdown"""
+    app.state.http_client = create_http_client()
+    app.state.call_pool = None
+    if ULTRAVOX_CALL_POOL_SIZE > 0:
+        app.state.call_pool = UltravoxCallPool(
+            # Refills are not time-critical, so they never spend the hedge budget
+            create_call=lambda: create_ultravox_call(app.state.http_client, POOLED_CALL_CONFIG, hedge=False),
+            size=ULTRAVOX_CALL_POOL_SIZE,
+            ttl_seconds=ULTRAVOX_CALL_POOL_TTL
+        )
+        app.state.call_pool.start()
+        logger.info(f"Ultravox call pool enabled (size={ULTRAVOX_CALL_POOL_SIZE}, ttl={ULTRAVOX_CALL_POOL_TTL}s)")
+    app.state.menu_index = None
+    try:
+        app.state.menu_index = MenuIndex.load(MENU_INDEX_PATH, MENU_DOCUMENTS, cache_size=MENU_ANSWER_CACHE_SIZE)
+        logger.info(f"Menu index loaded from {MENU_INDEX_PATH} ({len(app.state.menu_index.passages)} passages)")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Menu index unavailable, queryMenu will defer to staff: {e}")
+    prune_task = asyncio.create_task(prune_reservations(RESERVATION_PRUNE_INTERVAL))
+    try:
+        yield
+    finally:
+        prune_task.cancel()
+        if app.state.call_pool is not None:
+            await app.state.call_pool.stop()
+        if app.state.menu_index is not None:
+            app.state.menu_index.close()
+        await app.state.http_client.aclose()
+
+app = FastAPI(title="Ultravox FastAPI Server", lifespan=lifespan)
+
+reservations = ReservationInventory(
+    seats_per_seating=RESERVATION_SEATS_PER_SEATING,
+    max_party_size=RESERVATION_MAX_PARTY_SIZE,
+    code_length=RESERVATION_CODE_LENGTH
+)
+
+ultravox_api = ResilientCaller(
+    latency=LatencyTracker(
+        initial_timeout=ULTRAVOX_TIMEOUT_INITIAL,
+        timeout_multiplier=ULTRAVOX_TIMEOUT_MULTIPLIER,
+        min_timeout=ULTRAVOX_TIMEOUT_MIN,
+        max_timeout=ULTRAVOX_TIMEOUT_MAX
+    ),
+    breaker=CircuitBreaker(
+        failure_threshold=ULTRAVOX_CIRCUIT_FAILURES,
+        reset_timeout=ULTRAVOX_CIRCUIT_RESET_SECONDS,
+        max_reset_timeout=ULTRAVOX_CIRCUIT_RESET_MAX_SECONDS
+    ),
+    hedge_budget=ULTRAVOX_HEDGE_BUDGET
+)
+
+async def post_ultravox_call(client: httpx.AsyncClient, config: dict) -> dict:
+    """One POST /api/calls attempt"""
+    response = await client.post(ULTRAVOX_API_URL, json=config)
+    response.raise_for_status()
+    return response.json()
+
+async def create_ultravox_call(client: httpx.AsyncClient, config: dict = ULTRAVOX_CALL_CONFIG,
+                               hedge: bool = True) -> dict:
+    """Create Ultravox call and get join URL"""
+    # Only hedge when a losing duplicate expires by itself
+    hedge = hedge and "joinTimeout" in config
+    try:
+        return await ultravox_api.call(lambda: post_ultravox_call(client, config), hedge=hedge)
+    except CircuitOpenError:
+        raise HTTPException(
+            status_code=503,
+            detail="Ultravox API unavailable"
+        )
+    except asyncio.TimeoutError as e:
+        logger.error(f"Timed out calling Ultravox API: {e}")
+        raise HTTPException(
+            status_code=504,
+            detail="Ultravox API timed out"
+        )
+    except httpx.HTTPStatusError as e:
+        logger.error(f"HTTP error calling Ultravox API: {e.response.status_code} - {e.response.text}")
+        raise HTTPException(
+            status_code=502,
+            detail=f"Ultravox API error: {e.response.status_code}"
+        )
+    except httpx.RequestError as e:
+        logger.error(f"Request error calling Ultravox API: {e}")
+        raise HTTPException(
+            status_code=502,
+            detail="Failed to connect to Ultravox API"
+        )
 
 @app.post("/incoming")
 async def handle_incoming_call(request: Request):
@@ -66,14 +295,19 @@ async def handle_incoming_call(request: Request):
     try:
         logger.info("Incoming call received")
         
-        # Create Ultravox call
-        ultravox_response = await create_ultravox_call()
+        # Use a pre-created call if one is ready, otherwise create one now
+        pooled_call = request.app.state.call_pool.acquire() if request.app.state.call_pool else None
+        if pooled_call is not None:
+            join_url = pooled_call.join_url
+        else:
+            ultravox_response = await create_ultravox_call(request.app.state.http_client)
+            join_url = ultravox_response['joinUrl']
         
         # Generate TwiML response
         twiml = VoiceResponse()
         connect = twiml.connect()
         connect.stream(
-            url=ultravox_response['joinUrl'],
+            url=join_url,
             name='ultravox'
         )
         
@@ -83,9 +317,13 @@ async def handle_incoming_call(request: Request):
             media_type="text/xml"
         )
         
-    except HTTPException:
-        # Re-raise HTTP exceptions (these have proper error responses)
-        raise
+    except HTTPException as e:
+        # Twilio would play its own error message for a 5xx; answer with the fallback instead
+        logger.warning(f"No Ultravox call for incoming call ({e.detail}), answering with fallback TwiML")
+        return Response(
+            content=FALLBACK_TWIML,
+            media_type="text/xml"
+        )
     except Exception as e:
         logger.error(f"Unexpected error handling incoming call: {e}")
         
@@ -98,10 +336,175 @@ async def handle_incoming_call(request: Request):
             media_type="text/xml"
         )
 
+class AvailabilityRequest(BaseModel):
+    date: str
+    partySize: int = Field(ge=1)
+
+class ReservationRequest(BaseModel):
+    customerName: str = Field(min_length=1, max_length=100)
+    date: str
+    time: str
+    partySize: int = Field(ge=1)
+    specialRequirements: Optional[str] = Field(default=None, max_length=500)
+
+class BookingLookupRequest(BaseModel):
+    confirmationCode: str = Field(min_length=1, max_length=100)
+
+class MenuQuestion(BaseModel):
+    question: str = Field(min_length=1, max_length=500)
+    dietary: List[str] = Field(default_factory=list)
+
+def people(count: int) -> str:
+    return f"{count} {'person' if count == 1 else 'people'}"
+
+def bookable_date(text: str, now: datetime):
+    """The requested date, or a message for the agent to say instead"""
+    day = parse_date(text, now.date())
+    if day is None:
+        return None, f"I didn't catch the date \"{text}\". Could you give me the day again?"
+    if not reservations.bookable(day, now.date()):
+        return None, (f"I can only book from today up to {reservations.booking_days} days ahead. "
+                      f"Could you choose another date?")
+    return day, None
+
+# Tool endpoints: no awaits between reading and changing the inventory, and
+# ReservationInventory locks its check-and-reserve, so concurrent calls cannot double-book a seat
+
+@app.post("/tools/check-availability")
+async def check_availability(body: AvailabilityRequest, response: Response):
+    """Seatings on a date that can take the party"""
+    response.headers['X-Ultravox-Agent-Reaction'] = 'speaks'
+    now = datetime.now()
+    day, problem = bookable_date(body.date, now)
+    if problem:
+        return {"success": False, "message": problem, "availableSlots": []}
+    if body.partySize > reservations.max_party_size:
+        return {"success": False, "availableSlots": [],
+                "message": f"We can book parties of up to {reservations.max_party_size} by phone. "
+                           f"For a larger group, our manager can help directly."}
+
+    slots = reservations.availability(day, body.partySize, now)
+    if not slots:
+        return {"success": False, "availableSlots": [],
+                "message": f"Unfortunately we have nothing for {people(body.partySize)} on {day.isoformat()}. "
+                           f"Would you like to try a different date?"}
+    times = [spoken_time(slot) for slot, _ in slots]
+    return {
+        "success": True,
+        "message": f"For {people(body.partySize)} on {day.isoformat()} we have {', '.join(times)}.",
+        "date": day.isoformat(),
+        "partySize": body.partySize,
+        "availableSlots": [{"time": spoken_time(slot), "seatsLeft": left} for slot, left in slots],
+    }
+
+@app.post("/tools/make-reservation")
+async def make_reservation(body: ReservationRequest, response: Response):
+    """Book a seating, if it still has room"""
+    response.headers['X-Ultravox-Agent-Reaction'] = 'speaks'
+    now = datetime.now()
+    day, problem = bookable_date(body.date, now)
+    if problem:
+        return {"success": False, "message": problem}
+    slot = parse_time(body.time)
+    if slot is None or slot not in reservations.seatings:
+        first, last = spoken_time(reservations.seatings[0]), spoken_time(reservations.seatings[-1])
+        return {"success": False,
+                "message": f"We seat every half hour from {first} to {last}. Which of those would suit?"}
+    if body.partySize > reservations.max_party_size:
+        return {"success": False,
+                "message": f"We can book parties of up to {reservations.max_party_size} by phone."}
+
+    try:
+        booking = reservations.reserve(body.customerName.strip(), day, slot, body.partySize,
+                                       (body.specialRequirements or '').strip() or None, now)
+    except SeatingStarted:
+        return {"success": False,
+                "message": f"I'm sorry, the {spoken_time(slot)} seating today has already started. "
+                           f"Could you choose a later time or another day?"}
+    except CodesExhausted as e:
+        logger.error(f"Reservation not taken: {e}")
+        return {"success": False,
+                "message": "I'm sorry, I can't take bookings by phone right now. "
+                           "Please call back a little later."}
+    except SlotFull as e:
+        left = f"only {people(e.remaining)} left" if e.remaining else "no tables left"
+        return {"success": False,
+                "message": f"I'm sorry, {spoken_time(slot)} on {day.isoformat()} has {left}. "
+                           f"Shall I check other times?"}
+
+    logger.info(f"Reservation {booking.code}: {people(booking.party_size)} on {day.isoformat()} at {slot}")
+    return {
+        "success": True,
+        "message": (f"Confirmed: {booking.customer_name}, party of {booking.party_size}, on {day.isoformat()} "
+                    f"at {spoken_time(slot)}. Your confirmation code is {booking.code}, that is "
+                    f"{to_phonetic(booking.code)}."),
+        "booking": booking.to_dict(),
+    }
+
+@app.post("/tools/check-booking")
+async def check_booking(body: BookingLookupRequest, response: Response):
+    """Find a reservation by confirmation code"""
+    response.headers['X-Ultravox-Agent-Reaction'] = 'speaks'
+    code = normalize_code(body.confirmationCode)
+    booking = reservations.lookup(code)
+    if booking is None:
+        return {"success": False,
+                "message": f"I couldn't find a reservation with code {code}, that is {to_phonetic(code)}. "
+                           f"Could you check the code?"}
+    return {
+        "success": True,
+        "message": (f"I found it: {booking.customer_name}, party of {booking.party_size}, on "
+                    f"{booking.date.isoformat()} at {spoken_time(booking.time)}."
+                    + (f" Noted: {booking.special_requirements}." if booking.special_requirements else "")),
+        "booking": booking.to_dict(),
+    }
+
+@app.post("/tools/cancel-booking")
+async def cancel_booking(body: BookingLookupRequest, response: Response):
+    """Cancel a reservation by confirmation code and release its seats"""
+    response.headers['X-Ultravox-Agent-Reaction'] = 'speaks'
+    code = normalize_code(body.confirmationCode)
+    booking = reservations.cancel(code)
+    if booking is None:
+        return {"success": False,
+                "message": f"I couldn't find a reservation with code {code}, that is {to_phonetic(code)}. "
+                           f"Could you check the code?"}
+    logger.info(f"Cancelled reservation {booking.code}: {people(booking.party_size)} on "
+                f"{booking.date.isoformat()} at {booking.time}")
+    return {
+        "success": True,
+        "message": (f"Cancelled: {booking.customer_name}, party of {booking.party_size}, on "
+                    f"{booking.date.isoformat()} at {spoken_time(booking.time)}."),
+        "booking": booking.to_dict(),
+    }
+
+@app.post("/tools/menu")
+async def query_menu(body: MenuQuestion, request: Request, response: Response):
+    """Answer from the local menu index; no network round trip while the caller waits"""
+    response.headers['X-Ultravox-Agent-Reaction'] = 'speaks'
+    index = request.app.state.menu_index
+    if index is None:
+        return {"success": False, "message": "I can't check the menu right now, but a member of staff can help."}
+    dietary = [tag.upper() for tag in body.dietary if tag.upper() in TAG_NAMES]
+    result = index.answer(body.question, dietary)
+    return {
+        "success": bool(result["passages"]),
+        "message": result["message"],
+        "items": [{"name": p["name"], "price": p["price"], "tags": p["tags"], "onRequest": p["options"]}
+                  for p in result["passages"] if p["kind"] == "item"],
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "Ultravox FastAPI Server"}
+    health = {"status": "healthy", "service": "Ultravox FastAPI Server"}
+    if app.state.call_pool is not None:
+        health["call_pool"] = app.state.call_pool.stats()
+    health["ultravox_api"] = ultravox_api.stats()
+    health["reservations"] = reservations.stats()
+    if app.state.menu_index is not None:
+        health["menu_cache"] = app.state.menu_index.cache_stats()
+    return health
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,434 @@
+"""
+Local retrieval over the menu and policy documents, served as an agent tool.
+
+Menu questions used to go through Ultravox's queryCorpus tool, a remote RAG
+round trip in the middle of the conversation. This keeps the same documents
+(menu.md and the policy notes) in the webhook server:
+
+- Each menu item becomes one passage with its price, description and
+  dietary tags. A tag is either definite ("V") or available on request
+  ("GF available"). Every other bullet becomes a note passage under its
+  headings.
+- A BM25 index with the per-posting weights precomputed, plus optional
+  sentence-transformers embeddings, is written to one file by ``build()``
+  and memory-mapped by ``MenuIndex.load()``. A query only adds a few
+  weight slices, with no parsing or scoring setup.
+- Dietary words in a question ("gluten free", "vegan", "nuts") map to the
+  V / VG / GF / DF / N facets, so "is the risotto gluten-free" is answered
+  from the item's tags rather than from whatever text ranks first.
+- Answers are cached in an LRU keyed on the normalized question, so the
+  questions every caller asks cost one dict lookup.
+
+    python menu_index.py build menu.md policies.md --out menu_index.bin
+    python menu_index.py query "is the risotto gluten-free"
+"""
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MENUIDX1"
+_ALIGN = 64
+
+TAG_NAMES = {"V": "vegetarian", "VG": "vegan", "GF": "gluten-free", "DF": "dairy-free", "N": "made with nuts"}
+# Words (after stemming) that name a dietary facet
+_TAG_WORDS = {
+    "vegetarian": "V", "veggie": "V", "meatles": "V",
+    "vegan": "VG", "plant": "VG",
+    "gluten": "GF", "celiac": "GF", "coeliac": "GF", "wheat": "GF",
+    "dairy": "DF", "lactose": "DF", "milk": "DF",
+    "nut": "N", "peanut": "N", "almond": "N",
+}
+# Ingredients that make a dish N even when the menu does not tag it
+_NUT_WORDS = {"nut", "almond", "hazelnut", "pistachio", "walnut", "pecan", "cashew", "peanut", "pine"}
+_OPTIONAL = ("available", "option", "options", "usually")
+_STOPWORDS = {"the", "a", "an", "is", "are", "it", "do", "does", "you", "have", "any", "of", "and", "or",
+              "what", "which", "your", "with", "in", "on", "for", "to", "can", "i", "get", "there", "free", "that"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ITEM = re.compile(r"^- \*\*(.+?)\*\* - (.*)$")
+_TAGS = re.compile(r"\*\((.+?)\)\*")
+_PRICE = re.compile(r"\$\d+(?:\.\d{2})?")
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def words(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD.findall(text.lower())]
+
+def dietary_tags(text: str) -> List[str]:
+    """Facets a question asks about"""
+    return sorted({_TAG_WORDS[w] for w in words(text) if w in _TAG_WORDS})
+
+def _parse_tags(text: str) -> Tuple[List[str], List[str]]:
+    """"V, VG available, GF" -> (definite, on request)"""
+    definite, optional = [], []
+    parts = [p.strip() for p in text.split(",")]
+    all_optional = bool(parts) and parts[0].lower().startswith("usually")
+    for part in parts:
+        tokens = part.replace("Usually", "").split()
+        if not tokens or tokens[0].upper() not in TAG_NAMES:
+            continue
+        is_optional = all_optional or any(t.lower() in _OPTIONAL for t in tokens[1:])
+        (optional if is_optional else definite).append(tokens[0].upper())
+    return definite, optional
+
+def parse_documents(texts: Iterable[str]) -> List[dict]:
+    """Markdown -> passages (menu items and notes)"""
+    passages: List[dict] = []
+    for text in texts:
+        headings: Dict[int, str] = {}
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            heading = re.match(r"^(#{1,4})\s+(.*)", line)
+            if heading:
+                level = len(heading.group(1))
+                headings = {k: v for k, v in headings.items() if k < level}
+                headings[level] = heading.group(2).strip()
+                continue
+            if not line.startswith("- "):
+                continue
+            section = " / ".join(headings[k] for k in sorted(headings) if k > 1)
+            item = _ITEM.match(line.rstrip())
+            if item:
+                rest = item.group(2)
+                tags = _TAGS.search(rest)
+                definite, optional = _parse_tags(tags.group(1)) if tags else ([], [])
+                price = _PRICE.search(rest)
+                detail = _TAGS.sub("", rest).replace(price.group(0) if price else "\0", "").strip(" -")
+                description = lines[i + 1].strip() if i + 1 < len(lines) and lines[i + 1].startswith("  ") else ""
+                if "N" not in definite and _NUT_WORDS & set(words(f"{item.group(1)} {description}")):
+                    definite.append("N")
+                passages.append({
+                    "kind": "item", "section": section, "name": item.group(1).strip(),
+                    "price": price.group(0) if price else None, "tags": definite, "options": optional,
+                    "text": " ".join(part for part in (detail, description) if part),
+                })
+            else:
+                note = re.sub(r"\*\*(.+?)\*\*", r"\1", line[2:]).strip()
+                passages.append({"kind": "note", "section": section, "name": None, "price": None,
+                                 "tags": dietary_tags(note), "options": [], "text": note})
+    return passages
+
+def _passage_terms(passage: dict) -> Counter:
+    terms = Counter(words(passage["section"]) + words(passage["text"]))
+    if passage["name"]:
+        # Names count double: "the risotto" should find the risotto first
+        for w in words(passage["name"]):
+            terms[w] += 2
+    for tag in passage["tags"] + passage["options"]:
+        terms[f"tag:{tag}"] += 1
+    return terms
+
+def _query_terms(question: str) -> List[str]:
+    # Single letters are contraction debris ("what's" -> what, s)
+    tokens = [w for w in words(question) if w not in _STOPWORDS and len(w) > 1]
+    return tokens + [f"tag:{tag}" for tag in dietary_tags(question)]
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def build(paths: Sequence[str], out: str, k1: float = 1.2, b: float = 0.75, embed_model: Optional[str] = None) -> int:
+    """Parse the documents and write the index file; returns the passage count"""
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    passages = parse_documents(texts)
+    doc_terms = [_passage_terms(p) for p in passages]
+    lengths = [sum(t.values()) for t in doc_terms]
+    avg_length = sum(lengths) / max(len(lengths), 1)
+
+    postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+    for doc, terms in enumerate(doc_terms):
+        for term, tf in terms.items():
+            postings[term].append((doc, tf))
+    n = len(passages)
+    doc_ids, weights, terms_header = [], [], {}
+    for term in sorted(postings):
+        entries = postings[term]
+        idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+        terms_header[term] = [len(doc_ids), len(entries)]
+        for doc, tf in entries:
+            doc_ids.append(doc)
+            weights.append(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc] / avg_length)))
+
+    arrays = [np.asarray(doc_ids, dtype=np.int32), np.asarray(weights, dtype=np.float32)]
+    embedding = None
+    if embed_model:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            logger.warning("sentence-transformers is not installed, building the index without embeddings")
+        else:
+            model = SentenceTransformer(embed_model)
+            vectors = model.encode([_embedding_text(p) for p in passages], normalize_embeddings=True)
+            arrays.append(np.asarray(vectors, dtype=np.float32))
+            embedding = {"model": embed_model, "dim": int(vectors.shape[1])}
+
+    offsets, position = [], 0
+    for array in arrays:
+        offsets.append(position)
+        position = _aligned(position + array.nbytes)
+    header = json.dumps({
+        "passages": passages, "terms": terms_header, "postings": len(doc_ids),
+        "offsets": offsets, "embedding": embedding,
+    }).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp = f"{out}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for array, offset in zip(arrays, offsets):
+            f.seek(data_start + offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(tmp, out)
+    return n
+
+def _read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a menu index")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(header_length))
+
+def _embedding_text(passage: dict) -> str:
+    return " ".join(part for part in (passage["name"], passage["section"], passage["text"]) if part)
+
+class MenuIndex:
+    """Memory-mapped BM25 (+ optional embedding) index with cached spoken answers"""
+
+    def __init__(self, path: str, cache_size: int = 1024, embedding_weight: float = 0.5,
+                 min_score: Optional[float] = None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a menu index")
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header = json.loads(self._mmap[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        data_start = _aligned(len(MAGIC) + 8 + header_length)
+
+        self.passages: List[dict] = header["passages"]
+        self._terms: Dict[str, List[int]] = header["terms"]
+        count = header["postings"]
+        self._doc_ids = np.frombuffer(self._mmap, np.int32, count, data_start + header["offsets"][0])
+        self._weights = np.frombuffer(self._mmap, np.float32, count, data_start + header["offsets"][1])
+
+        self._vectors = None
+        self._encoder = None
+        self._embedding_weight = embedding_weight
+        if header["embedding"]:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                logger.warning("Menu index has embeddings but sentence-transformers is not installed, using BM25 only")
+            else:
+                dim = header["embedding"]["dim"]
+                self._vectors = np.frombuffer(self._mmap, np.float32, len(self.passages) * dim,
+                                              data_start + header["offsets"][2]).reshape(-1, dim)
+                self._encoder = SentenceTransformer(header["embedding"]["model"])
+
+        self._items = [i for i, p in enumerate(self.passages) if p["kind"] == "item"]
+        # BM25 of a word found in a single passage: a question sharing only
+        # commoner words with the documents is not about anything in them
+        self.min_score = min_score if min_score is not None else math.log(1 + (len(self.passages) - 0.5) / 1.5)
+        self._cached_answer = lru_cache(maxsize=cache_size)(self._answer)
+
+    @classmethod
+    def load(cls, path: str, sources: Sequence[str] = (), embed_model: Optional[str] = None,
+             **kwargs) -> "MenuIndex":
+        """Open the index, rebuilding it first if a source document is newer
+
+        A rebuild keeps the embedding model of the index it replaces unless
+        ``embed_model`` is given."""
+        if sources and (not os.path.exists(path)
+                        or max(os.path.getmtime(s) for s in sources) > os.path.getmtime(path)):
+            if embed_model is None and os.path.exists(path):
+                try:
+                    embed_model = (_read_header(path)["embedding"] or {}).get("model")
+                except (OSError, ValueError, KeyError, struct.error):
+                    pass
+            count = build(sources, path, embed_model=embed_model)
+            logger.info(f"Built menu index {path} with {count} passages")
+        return cls(path, **kwargs)
+
+    def close(self) -> None:
+        self._doc_ids = self._weights = self._vectors = None
+        self._mmap.close()
+
+    def bm25(self, question: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in _query_terms(question):
+            entry = self._terms.get(term)
+            if entry is not None:
+                start, count = entry
+                # A term appears once per passage, so plain fancy-index adds are safe
+                scores[self._doc_ids[start:start + count]] += self._weights[start:start + count]
+        return scores
+
+    def scores(self, question: str) -> np.ndarray:
+        scores = self.bm25(question)
+        if self._encoder is not None and scores.max() > 0:
+            query = self._encoder.encode([question], normalize_embeddings=True)[0]
+            scores = scores / scores.max() + self._embedding_weight * (self._vectors @ query)
+        return scores
+
+    def search(self, question: str, k: int = 3, tags: Sequence[str] = (), kind: Optional[str] = None,
+               min_ratio: float = 0.0) -> List[dict]:
+        """Best passages scoring at least ``min_ratio`` of the top one, optionally only
+        those carrying every tag in ``tags`` (definite or on request)"""
+        scores = self.scores(question)
+        ranked = []
+        for i in np.argsort(-scores, kind="stable"):
+            if scores[i] <= 0 or len(ranked) == k or (ranked and scores[i] < min_ratio * scores.max()):
+                break
+            passage = self.passages[i]
+            if kind and passage["kind"] != kind:
+                continue
+            if tags and not all(t in passage["tags"] or t in passage["options"] for t in tags):
+                continue
+            ranked.append(passage)
+        return ranked
+
+    def with_tags(self, tags: Sequence[str], topic: Iterable[str] = ()) -> Tuple[List[dict], List[dict]]:
+        """Items that have every tag, and items that can have them on request,
+        limited to items whose name or section mentions a ``topic`` word"""
+        topic = set(topic)
+        definite, optional = [], []
+        for i in self._items:
+            passage = self.passages[i]
+            if topic and not topic & set(words(f"{passage['section']} {passage['name']}")):
+                continue
+            if all(t in passage["tags"] for t in tags):
+                definite.append(passage)
+            elif all(t in passage["tags"] or t in passage["options"] for t in tags):
+                optional.append(passage)
+        return definite, optional
+
+    def answer(self, question: str, dietary: Sequence[str] = ()) -> dict:
+        """A short spoken answer plus the passages it came from"""
+        key = " ".join(_WORD.findall(question.lower()))
+        return self._cached_answer(key, tuple(sorted(t.upper() for t in dietary)))
+
+    def cache_stats(self) -> dict:
+        info = self._cached_answer.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+    def _named_items(self, question: str) -> List[dict]:
+        asked = _content_words(question)
+        named = []
+        for passage in self.search(question, k=5, kind="item"):
+            if asked & (set(words(passage["name"])) - _STOPWORDS):
+                named.append(passage)
+        return named[:3]
+
+    def _answer(self, question: str, dietary: Tuple[str, ...]) -> dict:
+        tags = sorted(set(dietary_tags(question)) | set(dietary))
+        named = self._named_items(question)
+
+        if tags and named:
+            sentences = []
+            for item in named:
+                for tag in tags:
+                    label = TAG_NAMES[tag]
+                    if tag in item["tags"]:
+                        sentences.append(f"The {item['name']} is {label}.")
+                    elif tag in item["options"]:
+                        sentences.append(f"The {item['name']} can be {label} on request.")
+                    elif tag == "N":
+                        sentences.append(f"The {item['name']} is not listed as containing nuts, "
+                                         f"but please tell your server about any allergy.")
+                    else:
+                        sentences.append(f"The {item['name']} is not marked {label}.")
+            if any(t not in item["tags"] for item in named for t in tags):
+                note = self.search(question, k=1, tags=tags, kind="note")
+                if note:
+                    sentences.append(note[0]["text"].rstrip(".") + ".")
+            return {"message": " ".join(sentences), "passages": named}
+
+        if tags:
+            label = " and ".join(TAG_NAMES[t] for t in tags)
+            # "gluten-free pizza" narrows to the pizza section when it exists
+            topic = _content_words(question)
+            definite, optional = self.with_tags(tags, topic) if topic else ([], [])
+            if not definite and not optional and topic and self.with_tags((), topic)[0]:
+                message = f"Nothing in that part of the menu is marked {label}."
+                note = self.search(question, k=1, tags=tags, kind="note")
+                if note:
+                    message += " " + note[0]["text"].rstrip(".") + "."
+                return {"message": message, "passages": note}
+            if not definite and not optional:
+                definite, optional = self.with_tags(tags)
+            if not definite and not optional:
+                return {"message": f"Nothing on the menu is marked {label}, but the kitchen can often adapt dishes.",
+                        "passages": []}
+            names = _spoken_list([p['name'] for p in definite[:8]]) if definite else ""
+            if not definite:
+                message = ""
+            elif "N" in tags:
+                message = f"Dishes {label}: {names}."
+            else:
+                message = f"Our {label} dishes are {names}."
+            if optional:
+                message += (f" {_spoken_list([p['name'] for p in optional[:5]])} can also be made {label} on request.")
+            return {"message": message.strip(), "passages": definite + optional}
+
+        hits = self.search(question, k=2, min_ratio=0.6)
+        if not hits or not self._on_topic(question, hits[0]):
+            return {"message": "I don't have that on the menu notes; a member of staff can help.", "passages": []}
+        return {"message": " ".join(_spoken_passage(p) for p in hits), "passages": hits}
+
+    def _on_topic(self, question: str, passage: dict) -> bool:
+        """The passage shares most of the question's terms, or the question has a
+        match as distinctive as a word found in one passage. "What time do you
+        close" shares only "time" with the table hold policy."""
+        terms = set(_query_terms(question))
+        if 2 * len(terms & set(_passage_terms(passage))) > len(terms):
+            return True
+        return float(self.bm25(question).max()) >= self.min_score
+
+def _content_words(question: str) -> set:
+    return {w for w in words(question) if w not in _STOPWORDS and w not in _TAG_WORDS}
+
+def _spoken_list(names: List[str]) -> str:
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+def _spoken_passage(passage: dict) -> str:
+    if passage["kind"] == "item":
+        price = f", {passage['price']}" if passage["price"] else ""
+        return f"{passage['name']}{price}: {passage['text'].rstrip('.')}."
+    return passage["text"].rstrip(".") + "."
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("documents", nargs="+")
+    build_parser.add_argument("--out", default="menu_index.bin")
+    build_parser.add_argument("--embed-model", help="sentence-transformers model for the optional embedding index")
+    query_parser = sub.add_parser("query")
+    query_parser.add_argument("question")
+    query_parser.add_argument("--index", default="menu_index.bin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"{build(args.documents, args.out, embed_model=args.embed_model)} passages -> {args.out}")
+    else:
+        result = MenuIndex(args.index).answer(args.question)
+        print(result["message"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+In-memory reservation inventory behind the agent's booking tools.
+
+Seats are tracked per service time per date: each date gets an array of
+remaining seats (one entry per seating), created on first use, so checking
+a date's availability reads at most one small list and never looks at
+individual bookings. Bookings are indexed by confirmation code in a dict.
+
+Tool calls can overlap (two callers after the last table at 7:30), so the
+capacity check and the seat decrement happen under one lock; a reservation
+either gets its seats or sees the slot as full, never both.
+
+Confirmation codes are letters only, so the agent can spell them with the
+phonetic alphabet. Three letters only give 17,576 codes, so the length is
+configurable (four by default). When nearly every code is taken, reserve()
+gives up after a bounded number of draws and raises CodesExhausted rather
+than spinning under the lock.
+
+Seatings that have already started today are neither offered nor booked.
+"""
+import random
+import re
+import string
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+PHONETIC_ALPHABET = {
+    'A': 'Alpha', 'B': 'Bravo', 'C': 'Charlie', 'D': 'Delta', 'E': 'Echo',
+    'F': 'Foxtrot', 'G': 'Golf', 'H': 'Hotel', 'I': 'India', 'J': 'Juliet',
+    'K': 'Kilo', 'L': 'Lima', 'M': 'Mike', 'N': 'November', 'O': 'Oscar',
+    'P': 'Papa', 'Q': 'Quebec', 'R': 'Romeo', 'S': 'Sierra', 'T': 'Tango',
+    'U': 'Uniform', 'V': 'Victor', 'W': 'Whiskey', 'X': 'X-ray', 'Y': 'Yankee', 'Z': 'Zulu'
+}
+_FROM_PHONETIC = {word.lower(): letter for letter, word in PHONETIC_ALPHABET.items()}
+_FROM_PHONETIC['xray'] = 'X'
+
+# Random draws for an unused confirmation code before giving up
+CODE_ATTEMPTS = 1000
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+def to_phonetic(code: str) -> str:
+    """Spell a code for the caller: A for Alpha, B for Bravo, ..."""
+    return ', '.join(f"{letter} for {PHONETIC_ALPHABET.get(letter, letter)}" for letter in code)
+
+def normalize_code(spoken: str) -> str:
+    """Confirmation code from what the model heard: abc, A B C, Alpha Bravo Charlie"""
+    # X-ray is the one phonetic word with a hyphen; join it before splitting "A-B-C"
+    text = re.sub(r"\bx[\s\-]*ray\b", "xray", spoken.strip().lower())
+    words = [w for w in re.split(r"[\s,.\-]+", text) if w]
+    if words and all(w in _FROM_PHONETIC or len(w) == 1 for w in words):
+        return ''.join(_FROM_PHONETIC.get(w, w.upper()) for w in words)
+    # "A for Alpha, B for Bravo" keeps only the letters
+    match = re.findall(r"\b([a-z]) for [a-z]+", text)
+    if match:
+        return ''.join(match).upper()
+    return re.sub(r"\s+", "", spoken).upper()
+
+def parse_date(text: str, today: Optional[date] = None) -> Optional[date]:
+    """ISO dates, today, tomorrow, in 3 days, (next) friday; None if not understood"""
+    today = today or date.today()
+    text = text.strip().lower()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    if text == 'today' or text == 'tonight':
+        return today
+    if text == 'tomorrow':
+        return today + timedelta(days=1)
+    match = re.fullmatch(r"in (\d+) days?", text)
+    if match:
+        return today + timedelta(days=int(match.group(1)))
+    match = re.fullmatch(r"(?:this |next )?(\w+)", text)
+    if match and match.group(1) in WEEKDAYS:
+        ahead = (WEEKDAYS.index(match.group(1)) - today.weekday()) % 7 or 7
+        return today + timedelta(days=ahead)
+    return None
+
+def parse_time(text: str) -> Optional[str]:
+    """7:30 PM, 7pm or 19:30 -> 19:30; None if not a time"""
+    match = re.fullmatch(r"\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*", text.lower())
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    if match.group(3):
+        hour = hour % 12 + (12 if match.group(3).startswith('p') else 0)
+    elif hour < 12:
+        # A dinner service: "seven thirty" means the evening
+        hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+def spoken_time(slot: str) -> str:
+    """19:30 -> 7:30 PM"""
+    hour, minute = map(int, slot.split(':'))
+    suffix = 'PM' if hour >= 12 else 'AM'
+    hour = hour % 12 or 12
+    return f"{hour} {suffix}" if minute == 0 else f"{hour}:{minute:02d} {suffix}"
+
+@dataclass
+class Booking:
+    code: str
+    customer_name: str
+    date: date
+    time: str
+    party_size: int
+    special_requirements: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return {
+            "confirmationNumber": self.code,
+            "phoneticCode": to_phonetic(self.code),
+            "customerName": self.customer_name,
+            "date": self.date.isoformat(),
+            "time": spoken_time(self.time),
+            "partySize": self.party_size,
+            "specialRequirements": self.special_requirements,
+        }
+
+class SlotFull(Exception):
+    """The seating cannot take the party (or does not exist)"""
+
+    def __init__(self, remaining: int):
+        super().__init__(f"{remaining} seats left")
+        self.remaining = remaining
+
+class SeatingStarted(Exception):
+    """The seating is today and has already started"""
+
+class CodesExhausted(Exception):
+    """No unused confirmation code could be found"""
+
+class ReservationInventory:
+    """Remaining seats per (date, seating) plus bookings indexed by code"""
+
+    def __init__(
+        self,
+        seatings: Tuple[str, ...] = ("17:00", "17:30", "18:00", "18:30", "19:00",
+                                     "19:30", "20:00", "20:30", "21:00", "21:30"),
+        seats_per_seating: int = 40,
+        max_party_size: int = 12,
+        booking_days: int = 90,
+        code_length: int = 4,
+        seed: Optional[int] = None
+    ):
+        self.seatings = tuple(seatings)
+        self._seating_index = {slot: i for i, slot in enumerate(self.seatings)}
+        self.seats_per_seating = seats_per_seating
+        self.max_party_size = max_party_size
+        self.booking_days = booking_days
+        self.code_length = code_length
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # date -> remaining seats per seating; dates nobody asked about are not stored
+        self._remaining: Dict[date, List[int]] = {}
+        self._by_code: Dict[str, Booking] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_code)
+
+    def _day(self, day: date) -> List[int]:
+        remaining = self._remaining.get(day)
+        if remaining is None:
+            remaining = self._remaining[day] = [self.seats_per_seating] * len(self.seatings)
+        return remaining
+
+    def bookable(self, day: date, today: Optional[date] = None) -> bool:
+        today = today or date.today()
+        return today <= day <= today + timedelta(days=self.booking_days)
+
+    @staticmethod
+    def _started_through(day: date, now: datetime) -> str:
+        """Seatings at or before this HH:MM have started ('' unless the day is today)"""
+        return now.strftime('%H:%M') if day == now.date() else ''
+
+    def availability(self, day: date, party_size: int, now: Optional[datetime] = None) -> List[Tuple[str, int]]:
+        """(seating, seats left) for every seating that can take the party and has not started"""
+        started_through = self._started_through(day, now or datetime.now())
+        remaining = self._remaining.get(day) or [self.seats_per_seating] * len(self.seatings)
+        return [(slot, left) for slot, left in zip(self.seatings, remaining)
+                if left >= party_size and slot > started_through]
+
+    def _new_code(self) -> str:
+        if len(self._by_code) >= len(string.ascii_uppercase) ** self.code_length:
+            raise CodesExhausted(f"all {self.code_length}-letter codes are in use")
+        for _ in range(CODE_ATTEMPTS):
+            code = ''.join(self._random.choices(string.ascii_uppercase, k=self.code_length))
+            if code not in self._by_code:
+                return code
+        raise CodesExhausted(f"no unused {self.code_length}-letter code in {CODE_ATTEMPTS} tries")
+
+    def reserve(self, customer_name: str, day: date, slot: str, party_size: int,
+                special_requirements: Optional[str] = None, now: Optional[datetime] = None) -> Booking:
+        """Take the seats and record the booking
+
+        Raises SlotFull if the seats are gone, SeatingStarted if the seating
+        is already under way, and CodesExhausted if no confirmation code is free.
+        """
+        index = self._seating_index.get(slot)
+        if index is None:
+            raise SlotFull(0)
+        if slot <= self._started_through(day, now or datetime.now()):
+            raise SeatingStarted(slot)
+        with self._lock:
+            remaining = self._day(day)
+            if remaining[index] < party_size:
+                raise SlotFull(remaining[index])
+            code = self._new_code()
+            remaining[index] -= party_size
+            booking = Booking(code, customer_name, day, slot, party_size, special_requirements)
+            self._by_code[booking.code] = booking
+        return booking
+
+    def cancel(self, code: str) -> Optional[Booking]:
+        with self._lock:
+            booking = self._by_code.pop(code, None)
+            if booking is not None:
+                self._day(booking.date)[self._seating_index[booking.time]] += booking.party_size
+        return booking
+
+    def lookup(self, code: str) -> Optional[Booking]:
+        return self._by_code.get(code)
+
+    def prune(self, before: Optional[date] = None) -> int:
+        """Drop bookings and seat counts for past dates, so their codes can be reused"""
+        before = before or date.today()
+        with self._lock:
+            past = [code for code, booking in self._by_code.items() if booking.date < before]
+            for code in past:
+                del self._by_code[code]
+            for day in [day for day in self._remaining if day < before]:
+                del self._remaining[day]
+        return len(past)
+
+    def stats(self) -> dict:
+        return {"bookings": len(self._by_code), "dates": len(self._remaining)}
@@ -0,0 +1,289 @@
+"""
+Hedged requests, adaptive timeouts and a circuit breaker for Ultravox API calls.
+
+Twilio gives the /incoming webhook about 15 seconds, and the caller hears
+ringing the whole time, so one slow or failed POST /api/calls should not
+end the call. ResilientCaller wraps each request:
+
+- Timeouts follow the observed latency: a multiple of the recent p99,
+  clamped between a floor and a ceiling, instead of one flat number.
+  Failed attempts count as samples, and so do attempts cut off by the
+  deadline (at the time they had run, a lower bound). A run of slow
+  answers raises the timeout instead of going unseen.
+- If the first attempt is still running at the recent p95, a second
+  (hedged) attempt starts. The first success wins and the other is
+  cancelled. Hedges are limited by a budget (a fraction of requests), so
+  a slow API does not get twice the load. A retryable failure (connection
+  error, 5xx, 429) starts the second attempt at once. A cancelled attempt
+  may still have been carried out by the API, so only hedge requests
+  whose duplicates are cheap. For call creation, the duplicate call
+  expires through its joinTimeout.
+- A circuit breaker opens after consecutive failures and rejects requests
+  immediately until a cool-down passes, then lets one probe through. The
+  cool-down starts short and doubles each time the probe fails, so a blip
+  costs about a second of fallbacks while a long outage is probed rarely.
+  Failures of requests that started before the breaker opened, or before
+  a later request succeeded, are stale and do not count. The webhook
+  answers with its fallback TwiML in microseconds instead of keeping
+  callers ringing into a dead API.
+- Every request ends in one outcome and is counted for /health: success
+  (first attempt), hedged (a hedge was in flight), retried (after a
+  failure), timeout, error, client_error (4xx, not retried) or
+  short_circuited.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+OUTCOMES = ("success", "hedged", "retried", "timeout", "error", "client_error", "short_circuited")
+
+class CircuitOpenError(Exception):
+    """The API is considered down; the request was not sent"""
+
+def retryable(error: BaseException) -> bool:
+    """Connection problems, timeouts, 5xx and 429 are worth another attempt; other 4xx are not"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+def _discard_result(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+class LatencyTracker:
+    """Recent attempt latencies and the timeouts derived from them"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, initial_timeout: float = 5.0,
+                 initial_hedge_delay: float = 1.0, timeout_multiplier: float = 3.0,
+                 min_timeout: float = 4.0, max_timeout: float = 8.0, min_hedge_delay: float = 0.05):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.initial_timeout = initial_timeout
+        self.initial_hedge_delay = initial_hedge_delay
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_hedge_delay = min_hedge_delay
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self) -> float:
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return self.initial_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> float:
+        p95 = self.percentile(0.95)
+        if p95 is None:
+            return self.initial_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures -> half_open after ``reset_timeout``
+
+    The cool-down doubles, up to ``max_reset_timeout``, each time the
+    half-open probe fails, and goes back to ``reset_timeout`` once the API
+    answers again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 1.0, max_reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        # When the most recent successful request started
+        self._healthy_at = 0.0
+        self._probe_in_flight = False
+        self._probe_sent_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and (
+                not self._probe_in_flight or time.monotonic() - self._probe_sent_at >= self.reset_timeout):
+            # One request finds out whether the API is back; a probe that
+            # hangs longer than the cool-down does not hold the circuit open
+            self._probe_in_flight = True
+            self._probe_sent_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self, started_at: float) -> None:
+        self._healthy_at = max(self._healthy_at, started_at)
+        if self.state != "closed":
+            logger.info("Ultravox API circuit closed")
+        self.state = "closed"
+        self._failures = 0
+        self._probe_in_flight = False
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self, started_at: float, probe: bool = False) -> None:
+        if probe and self._is_current_probe(started_at):
+            self._probe_in_flight = False
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+            return
+        if self.state != "closed" or started_at < self._healthy_at:
+            # Already open, or a request sent after this one has since succeeded
+            return
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self, started_at: float) -> None:
+        """The probe was cancelled before it learned anything; let the next request probe"""
+        if self._is_current_probe(started_at):
+            self._probe_in_flight = False
+
+    def _is_current_probe(self, started_at: float) -> bool:
+        # An older probe that outlived the cool-down was replaced by a newer one
+        return self.state == "half_open" and started_at >= self._probe_sent_at
+
+    def _open(self) -> None:
+        if self.state != "open":
+            self.opened += 1
+            logger.warning(f"Ultravox API circuit open after {self._failures} failures, "
+                           f"failing fast for {self.reset_timeout:g}s")
+        self.state = "open"
+        self._opened_at = time.monotonic()
+
+class ResilientCaller:
+    """Runs one API request with hedging, an adaptive deadline and a circuit breaker"""
+
+    def __init__(self, latency: Optional[LatencyTracker] = None, breaker: Optional[CircuitBreaker] = None,
+                 hedge_budget: float = 0.1, max_attempts: int = 2):
+        self.latency = latency or LatencyTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_budget = hedge_budget
+        self.max_attempts = max_attempts
+        # Token bucket: each request adds hedge_budget, each hedge spends 1
+        self._hedge_tokens = 1.0
+        self.outcomes: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+        self.hedges = 0
+        self.cancelled_attempts = 0
+
+    def _finish(self, outcome: str) -> str:
+        self.outcomes[outcome] += 1
+        return outcome
+
+    def _take_hedge_token(self) -> bool:
+        if self._hedge_tokens >= 1.0:
+            self._hedge_tokens -= 1.0
+            return True
+        return False
+
+    async def call(self, attempt: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        """Run ``attempt`` (a fresh request per call) until one succeeds or the deadline passes"""
+        if not self.breaker.allow():
+            self._finish("short_circuited")
+            raise CircuitOpenError("Ultravox API circuit is open")
+        probe = self.breaker.state == "half_open"
+        self._hedge_tokens = min(self._hedge_tokens + self.hedge_budget, 10.0)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        started_at = time.monotonic()
+        deadline = started + self.latency.timeout()
+        hedge_at = started + self.latency.hedge_delay()
+        running: Dict[asyncio.Task, float] = {}
+        attempts = 0
+        last_error: Optional[BaseException] = None
+
+        def launch() -> None:
+            nonlocal attempts
+            attempts += 1
+            running[asyncio.ensure_future(attempt())] = loop.time()
+
+        launch()
+        try:
+            while running:
+                now = loop.time()
+                can_add = attempts < self.max_attempts
+                wait_until = min(deadline, hedge_at) if hedge and can_add and hedge_at > now else deadline
+                done, _ = await asyncio.wait(running, timeout=max(0.0, wait_until - now),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt_started = running.pop(task)
+                    error = task.exception()
+                    self.latency.record(loop.time() - attempt_started)
+                    if error is None:
+                        self.breaker.record_success(started_at)
+                        self._finish("success" if attempts == 1 else "retried" if last_error else "hedged")
+                        return task.result()
+                    last_error = error
+                    if not retryable(error):
+                        self.breaker.record_success(started_at)  # the API answered; the request was wrong
+                        self._finish("client_error")
+                        raise error
+
+                now = loop.time()
+                if now >= deadline:
+                    # Attempts cut off here took at least this long
+                    for attempt_started in running.values():
+                        self.latency.record(now - attempt_started)
+                    break
+                can_add = attempts < self.max_attempts
+                # A failure retries straight away (the breaker guards against retry storms);
+                # a slow attempt gets a hedge at the p95 mark if the budget allows
+                if can_add and not running:
+                    launch()
+                elif can_add and hedge and now >= hedge_at and self._take_hedge_token():
+                    self.hedges += 1
+                    launch()
+                elif not running:
+                    break
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release_probe(started_at)
+            raise
+        finally:
+            for task in running:
+                task.cancel()
+                # An attempt that failed as the deadline passed: its error is moot
+                task.add_done_callback(_discard_result)
+                self.cancelled_attempts += 1
+
+        self.breaker.record_failure(started_at, probe)
+        if last_error is None or loop.time() >= deadline:
+            self._finish("timeout")
+            raise asyncio.TimeoutError(f"No Ultravox API response within {deadline - started:.2f}s")
+        self._finish("error")
+        raise last_error
+
+    def stats(self) -> dict:
+        """Counters for the health endpoint"""
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        return {
+            "outcomes": dict(self.outcomes),
+            "hedges": self.hedges,
+            "cancelled_attempts": self.cancelled_attempts,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "circuit_reset_ms": round(self.breaker.reset_timeout * 1000),
+            "timeout_ms": round(self.latency.timeout() * 1000),
+            "hedge_after_ms": round(self.latency.hedge_delay() * 1000),
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
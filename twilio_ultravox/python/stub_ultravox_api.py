@@ -0,0 +1,127 @@
+"""
+Local stand-in for the Ultravox REST API used by the benchmarks.
+
+Run directly with ``python stub_ultravox_api.py --port 9001`` or start it from
+another script with ``start_stub_server()``.
+
+POST /api/calls can inject faults, set from STUB_* env vars, the command line,
+``configure_faults()`` or at runtime with POST /stub/faults:
+
+- error_rate: fraction of requests answered with 503
+- slow_rate / slow_ms: fraction of requests that take slow_ms longer
+- hang_rate: fraction of requests that never answer (until the client gives up)
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+from fastapi import FastAPI, HTTPException
+import uvicorn
+
+STUB_LATENCY_MS = float(os.getenv('STUB_LATENCY_MS', '20'))
+# Extra time a corpus query spends on retrieval, on top of the API latency
+STUB_CORPUS_LATENCY_MS = float(os.getenv('STUB_CORPUS_LATENCY_MS', '150'))
+STUB_CORPUS_PATH = os.getenv('STUB_CORPUS_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'twilio_ultravox_agent_server', 'menu.md'))
+
+FAULTS = {
+    "error_rate": float(os.getenv('STUB_ERROR_RATE', '0')),
+    "slow_rate": float(os.getenv('STUB_SLOW_RATE', '0')),
+    "slow_ms": float(os.getenv('STUB_SLOW_MS', '3000')),
+    "hang_rate": float(os.getenv('STUB_HANG_RATE', '0')),
+}
+FAULT_COUNTS = {"requests": 0, "errors": 0, "slow": 0, "hung": 0}
+
+app = FastAPI(title="Ultravox API stub")
+_call_ids = itertools.count(1)
+
+def configure_faults(**faults) -> dict:
+    """Change any of FAULTS; unknown names raise KeyError"""
+    for name, value in faults.items():
+        if name not in FAULTS:
+            raise KeyError(name)
+        FAULTS[name] = float(value)
+    return dict(FAULTS)
+
+@app.post("/stub/faults")
+async def set_faults(faults: dict):
+    """Change the injected faults while the stub is running"""
+    try:
+        return {"faults": configure_faults(**faults), "counts": FAULT_COUNTS}
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown fault {e}")
+
+@app.post("/api/calls")
+async def create_call(config: dict):
+    """Pretend to create a call and return a join URL"""
+    FAULT_COUNTS["requests"] += 1
+    roll = random.random()
+    if roll < FAULTS["hang_rate"]:
+        FAULT_COUNTS["hung"] += 1
+        await asyncio.sleep(3600)
+    roll -= FAULTS["hang_rate"]
+    if roll < FAULTS["error_rate"]:
+        FAULT_COUNTS["errors"] += 1
+        await asyncio.sleep(STUB_LATENCY_MS / 1000.0)
+        raise HTTPException(status_code=503, detail="Injected fault")
+    roll -= FAULTS["error_rate"]
+    delay = STUB_LATENCY_MS
+    if roll < FAULTS["slow_rate"]:
+        FAULT_COUNTS["slow"] += 1
+        delay += FAULTS["slow_ms"]
+    await asyncio.sleep(delay / 1000.0)
+    call_id = f"stub-{next(_call_ids)}"
+    return {
+        "callId": call_id,
+        "joinUrl": f"wss://stub.ultravox.local/calls/{call_id}",
+        "created": time.time()
+    }
+
+@lru_cache(maxsize=1)
+def corpus_chunks() -> tuple:
+    with open(STUB_CORPUS_PATH, encoding="utf-8") as f:
+        return tuple(chunk.strip() for chunk in f.read().split("\n\n") if chunk.strip())
+
+@app.post("/api/corpora/{corpus_id}/query")
+async def query_corpus(corpus_id: str, body: dict):
+    """Pretend to run a corpus (RAG) query: retrieval time plus the chunks sharing most words"""
+    await asyncio.sleep((STUB_LATENCY_MS + STUB_CORPUS_LATENCY_MS) / 1000.0)
+    words = set(str(body.get("query", "")).lower().split())
+    ranked = sorted(corpus_chunks(), key=lambda chunk: -len(words & set(chunk.lower().split())))
+    return {"results": [{"content": chunk, "score": 1.0 / (i + 1)}
+                        for i, chunk in enumerate(ranked[:int(body.get("maxResults", 5))])]}
+
+def start_stub_server(port: int, latency_ms: float = STUB_LATENCY_MS,
+                      corpus_latency_ms: float = STUB_CORPUS_LATENCY_MS) -> uvicorn.Server:
+    """Start the stub in a background thread and wait until it accepts connections"""
+    global STUB_LATENCY_MS, STUB_CORPUS_LATENCY_MS
+    STUB_LATENCY_MS = latency_ms
+    STUB_CORPUS_LATENCY_MS = corpus_latency_ms
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_MS)
+    parser.add_argument("--corpus-latency-ms", type=float, default=STUB_CORPUS_LATENCY_MS)
+    parser.add_argument("--error-rate", type=float, default=FAULTS["error_rate"])
+    parser.add_argument("--slow-rate", type=float, default=FAULTS["slow_rate"])
+    parser.add_argument("--slow-ms", type=float, default=FAULTS["slow_ms"])
+    parser.add_argument("--hang-rate", type=float, default=FAULTS["hang_rate"])
+    args = parser.parse_args()
+    configure_faults(error_rate=args.error_rate, slow_rate=args.slow_rate,
+                     slow_ms=args.slow_ms, hang_rate=args.hang_rate)
+    STUB_LATENCY_MS = args.latency_ms
+    STUB_CORPUS_LATENCY_MS = args.corpus_latency_ms
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,130 @@
+"""
+Admission control for calls on a single replica.
+
+A call takes a slot when Twilio hits the webhook (``try_reserve``) and the
+reservation is turned into an active slot once the media stream connects
+(``claim``). Reservations expire if the stream never arrives, so abandoned
+rings cannot leak capacity.
+
+Reservations live in this replica's memory (or, under serve.py, its
+registry file), so this assumes the platform routes a call's /ws stream to
+the replica that answered its webhook. If they land on different replicas,
+the stream is claimed as an unreserved call on the second one. That can be
+rejected with 1013 when it is full. Meanwhile the first replica carries a
+phantom reservation until ``reservation_ttl`` runs out, which shows up as
+``expired_reservations``. Keep ADMISSION_RESERVATION_TTL short (the stream
+normally connects within a few seconds) to bound that.
+"""
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Set
+from xml.sax.saxutils import quoteattr
+
+from loguru import logger
+
+BUSY_TWIML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="alice">We're sorry, all of our lines are busy right now. Please try calling back in a few minutes.</Say>
+    <Hangup/>
+</Response>'''
+
+@lru_cache(maxsize=16)
+def hold_twiml(retry_url: str, attempt: int, hold_seconds: int) -> str:
+    """TwiML that holds the caller briefly and then re-requests the webhook"""
+    say = '<Say voice="alice">All of our lines are busy. Please hold and we will be right with you.</Say>' if attempt == 1 else ''
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    {say}
+    <Pause length="{hold_seconds}"/>
+    <Redirect method="POST">{retry_url}?attempt={attempt}</Redirect>
+</Response>'''
+
+@lru_cache(maxsize=16)
+def stream_twiml(websocket_url: str) -> str:
+    """TwiML that connects the call to our media stream websocket"""
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Connect>
+        <Stream url={quoteattr(websocket_url)} />
+    </Connect>
+    <Pause length="40"/>
+</Response>'''
+
+class AdmissionController:
+    """Concurrency budget shared by the webhook and the media stream endpoint"""
+
+    def __init__(self, max_concurrent_calls: int, reservation_ttl: float = 30.0):
+        self.max_concurrent_calls = max_concurrent_calls
+        self.reservation_ttl = reservation_ttl
+        self._reservations: Dict[str, float] = {}
+        self._active: Set[str] = set()
+        self.admitted = 0
+        self.rejected = 0
+        self.held = 0
+        self.expired_reservations = 0
+
+    @property
+    def slots_in_use(self) -> int:
+        return len(self._active) + len(self._reservations)
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for call_sid, expires_at in list(self._reservations.items()):
+            if expires_at <= now:
+                del self._reservations[call_sid]
+                self.expired_reservations += 1
+                logger.warning(f"Reservation for call {call_sid} expired before its stream connected")
+
+    def try_reserve(self, call_sid: Optional[str]) -> bool:
+        """Reserve a slot for a ringing call; False means the replica is full"""
+        self._purge_expired()
+        if call_sid and (call_sid in self._reservations or call_sid in self._active):
+            return True
+        if self.slots_in_use >= self.max_concurrent_calls:
+            return False
+        if call_sid:
+            self._reservations[call_sid] = time.monotonic() + self.reservation_ttl
+        return True
+
+    def claim(self, call_sid: Optional[str], reserved_only: bool = False) -> Optional[str]:
+        """Turn a reservation into an active slot when the media stream starts
+
+        Returns the slot key to pass to ``release``, or None if the replica is
+        full (or, with ``reserved_only``, the call was never reserved).
+        """
+        self._purge_expired()
+        if call_sid and call_sid in self._reservations:
+            del self._reservations[call_sid]
+        elif reserved_only or self.slots_in_use >= self.max_concurrent_calls:
+            self.rejected += 1
+            return None
+        slot = call_sid or f"stream-{self.admitted}"
+        self._active.add(slot)
+        self.admitted += 1
+        return slot
+
+    def record_held(self) -> None:
+        self.held += 1
+
+    def record_rejected(self) -> None:
+        self.rejected += 1
+
+    def release(self, slot: Optional[str]) -> None:
+        """Free the slot held by a finished call"""
+        if slot is None:
+            return
+        self._active.discard(slot)
+        self._reservations.pop(slot, None)
+
+    def stats(self) -> dict:
+        self._purge_expired()
+        return {
+            "max_concurrent_calls": self.max_concurrent_calls,
+            "active_calls": len(self._active),
+            "reserved_slots": len(self._reservations),
+            "utilisation": round(self.slots_in_use / self.max_concurrent_calls, 3) if self.max_concurrent_calls else 1.0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "held": self.held,
+            "expired_reservations": self.expired_reservations,
+        }
@@ -0,0 +1,169 @@
+"""
+Pre-rendered 8 kHz mu-law audio for fixed utterances.
+
+The greeting and other fixed phrases (busy, error, goodbye) are synthesized
+once through the shared Cartesia connections, written to disk and mapped
+back in with mmap. Playing one is then just a matter of pushing 20 ms
+media messages to Twilio, with no model or TTS round-trip. Since the audio
+never passes the pipeline's recording tap, play_to_twilio puts it on the
+call recording's agent track itself.
+
+Entries are keyed by text, voice, model and speed so changing any of them
+produces a fresh rendering instead of replaying stale audio.
+"""
+import base64
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from call_recorder import AGENT, CallRecording
+from tts_pool import CartesiaConnectionManager, TTSConnectionError
+from twilio_protocol import TwilioMessageEncoder
+
+SAMPLE_RATE = 8000
+FRAME_BYTES = SAMPLE_RATE // 50  # 20 ms of 8-bit mu-law
+
+def default_phrases(restaurant_name: str) -> Dict[str, str]:
+    """Fixed utterances, overridable from the environment"""
+    return {
+        "greeting": os.getenv(
+            "GREETING_TEXT",
+            f"Hi, thanks for calling {restaurant_name}! How can I help you today?"
+        ),
+        "busy": os.getenv(
+            "BUSY_TEXT",
+            "I'm sorry, all of our lines are busy right now. Please call back in a few minutes."
+        ),
+        "error": os.getenv(
+            "ERROR_TEXT",
+            "I'm sorry, I'm having some trouble right now. Please call back later."
+        ),
+        "goodbye": os.getenv(
+            "GOODBYE_TEXT",
+            "I'm sorry, I need to end the call now. Please call us back and we'll be happy to help. Goodbye!"
+        ),
+    }
+
+class CachedPhrase:
+    """A rendered phrase backed by a read-only memory map"""
+
+    def __init__(self, name: str, text: str, path: str):
+        self.name = name
+        self.text = text
+        self.path = path
+        with open(path, "rb") as f:
+            self._audio = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._payloads: Optional[List[str]] = None
+
+    @property
+    def duration_seconds(self) -> float:
+        return len(self._audio) / SAMPLE_RATE
+
+    def ulaw(self) -> memoryview:
+        """The rendered 8 kHz mu-law, without copying it out of the map"""
+        return memoryview(self._audio)
+
+    def payloads(self) -> List[str]:
+        """Base64 media payloads, one per 20 ms frame, encoded once per process"""
+        if self._payloads is None:
+            view = memoryview(self._audio)
+            self._payloads = [
+                base64.b64encode(view[offset:offset + FRAME_BYTES]).decode()
+                for offset in range(0, len(view), FRAME_BYTES)
+            ]
+        return self._payloads
+
+class PhraseAudioCache:
+    """Disk-backed cache of fixed phrases rendered as 8 kHz mu-law"""
+
+    def __init__(self, cache_dir: str, voice_id: str, model: str, speed: Optional[float]):
+        self.cache_dir = cache_dir
+        self.voice_id = voice_id
+        self.model = model
+        self.speed = speed
+        self._phrases: Dict[str, CachedPhrase] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, text: str) -> str:
+        key = hashlib.sha256(
+            json.dumps([text, self.voice_id, self.model, self.speed]).encode()
+        ).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{key}.ulaw")
+
+    def get(self, name: str) -> Optional[CachedPhrase]:
+        return self._phrases.get(name)
+
+    async def warm(self, manager: CartesiaConnectionManager, phrases: Dict[str, str]) -> None:
+        """Load every phrase from disk, rendering any that are missing"""
+        for name, text in phrases.items():
+            path = self._path(text)
+            try:
+                if not os.path.exists(path):
+                    await self._render(manager, text, path)
+                    logger.info(f"Rendered '{name}' phrase to {path}")
+                self._phrases[name] = CachedPhrase(name, text, path)
+            except Exception as e:
+                logger.error(f"Failed to prepare cached '{name}' phrase: {e}")
+
+    async def _render(self, manager: CartesiaConnectionManager, text: str, path: str) -> None:
+        voice = {"mode": "id", "id": self.voice_id}
+        if self.speed is not None:
+            voice["__experimental_controls"] = {"speed": self.speed}
+        context = await manager.open_context({
+            "transcript": text,
+            "continue": False,
+            "model_id": self.model,
+            "voice": voice,
+            "output_format": {"container": "raw", "encoding": "pcm_mulaw", "sample_rate": SAMPLE_RATE},
+        })
+
+        chunks = []
+        while True:
+            message = await context.queue.get()
+            if message["type"] == "chunk":
+                chunks.append(base64.b64decode(message["data"]))
+            elif message["type"] == "done":
+                break
+            elif message["type"] == "disconnected":
+                raise TTSConnectionError(message.get("error"))
+            else:
+                raise RuntimeError(f"Cartesia error: {message.get('error')}")
+
+        audio = b"".join(chunks)
+        if not audio:
+            raise RuntimeError("Cartesia returned no audio")
+
+        # Write-then-rename so a crash never leaves a truncated entry behind
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+async def play_to_twilio(websocket, stream_sid: str, phrase: CachedPhrase,
+                         recording: Optional[CallRecording] = None) -> None:
+    """Send a cached phrase straight to the Twilio media stream (and the call's agent track)"""
+    messages = TwilioMessageEncoder(stream_sid)
+    if recording is not None:
+        recording.write_ulaw(AGENT, phrase.ulaw())
+    for payload in phrase.payloads():
+        await websocket.send_text(messages.media_b64(payload))
+    await websocket.send_text(messages.mark(f"phrase-{phrase.name}"))
+
+_cache: Optional[PhraseAudioCache] = None
+
+def get_phrase_cache() -> PhraseAudioCache:
+    """Get or create the process-wide phrase cache"""
+    global _cache
+    if _cache is None:
+        speed = os.getenv("CARTESIA_SPEED")
+        _cache = PhraseAudioCache(
+            cache_dir=os.getenv("AUDIO_CACHE_DIR", "./audio-cache"),
+            voice_id=os.getenv("CARTESIA_VOICE_ID", "79a125e8-cd45-4c13-8a67-188112f4dd22"),
+            model=os.getenv("CARTESIA_MODEL", "sonic-english"),
+            speed=float(speed) if speed else None,
+        )
+    return _cache
@@ -0,0 +1,235 @@
+"""
+Allocation-free audio codec for the Twilio media path.
+
+Every 20 ms Twilio frame is mu-law expanded and resampled 8k -> 16k on the
+way in, and resampled and mu-law compressed on the way out. pipecat's
+helpers do that with audioop/soxr calls that each return a fresh bytes
+object, several times per frame. This module does the same work with
+numpy lookup tables, a stateful polyphase resampler and buffers that are
+allocated once per call, so the steady state only allocates what leaves
+the codec (the bytes a frame has to own).
+
+    decoder = UlawDecoder(out_rate=16000)
+    pcm16k = decoder.decode(payload)        # int16 view, valid until next call
+
+    encoder = UlawEncoder()
+    ulaw = encoder.encode(pcm_bytes, 16000) # uint8 view, valid until next call
+
+Views returned by the codecs are reused on the next call; copy them (or
+call ``.tobytes()``) if they need to live longer.
+"""
+from math import gcd
+from typing import Optional, Union
+
+import numpy as np
+
+TWILIO_SAMPLE_RATE = 8000
+
+def _build_decode_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+def _build_encode_table() -> np.ndarray:
+    # Indexed by the int16 sample reinterpreted as uint16; bit exact with audioop.lin2ulaw
+    samples = np.arange(65536, dtype=np.int32).astype(np.uint16).view(np.int16).astype(np.int32)
+    value = samples >> 2
+    mask = np.where(value < 0, 0x7F, 0xFF)
+    value = np.minimum(np.abs(value), 8159) + 0x21
+    segment = np.zeros_like(value)
+    for bound in (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF):
+        segment += value > bound
+    code = (segment << 4) | ((value >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    code = np.where(segment > 7, 0x7F, code)
+    return (code ^ mask).astype(np.uint8)
+
+ULAW_DECODE_TABLE = _build_decode_table()
+ULAW_ENCODE_TABLE = _build_encode_table()
+
+def ulaw_decode(ulaw: Union[bytes, np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """mu-law bytes -> int16 samples"""
+    codes = np.frombuffer(ulaw, dtype=np.uint8) if isinstance(ulaw, (bytes, bytearray, memoryview)) else ulaw
+    return np.take(ULAW_DECODE_TABLE, codes, out=out)
+
+def ulaw_encode(pcm: Union[bytes, np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """int16 samples -> mu-law bytes"""
+    samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    return np.take(ULAW_ENCODE_TABLE, samples.view(np.uint16), out=out)
+
+def design_lowpass(num_taps: int, cutoff: float, gain: float = 1.0, beta: float = 8.0) -> np.ndarray:
+    """Kaiser-windowed sinc; ``cutoff`` is a fraction of the sample rate (0 - 0.5)"""
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, beta)
+    return (taps * (gain / taps.sum())).astype(np.float32)
+
+class PolyphaseResampler:
+    """Streaming rational resampler that carries filter state across frames
+
+    The prototype low-pass filter is split into ``up`` phases so the zero
+    stuffed samples are never multiplied. Integer ratios (8k <-> 16k,
+    24k -> 8k) run as one matrix product per frame into preallocated
+    buffers; other ratios fall back to a gather that allocates.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, taps_per_phase: int = 16, max_frame: int = 4800):
+        divisor = gcd(in_rate, out_rate)
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.max_frame = max_frame
+
+        # One column per phase, each reversed so a window dot column is the convolution
+        length = taps_per_phase * max(self.up, self.down)
+        length += -length % self.up
+        self.taps = length // self.up
+        prototype = design_lowpass(length, 0.5 / max(self.up, self.down), gain=self.up)
+        self._phases = np.ascontiguousarray(prototype.reshape(self.taps, self.up)[::-1])
+
+        # History (taps - 1 samples) followed by room for the next frame
+        self._history = self.taps - 1
+        self._buffer = np.zeros(self._history + max_frame, dtype=np.float32)
+        self.max_output = max_frame * self.up // self.down + self.up + 1
+        self._float_out = np.empty(self.max_output, dtype=np.float32)
+        self._int_out = np.empty_like(self._float_out, dtype=np.int16)
+        self._interp = np.empty((max_frame, self.up), dtype=np.float32)
+        # Offset of the next output sample, in upsampled samples, from the start of the next frame
+        self._position = 0
+
+    def reset(self) -> None:
+        self._buffer[:self._history] = 0
+        self._position = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample int16 (or float) samples; returns an int16 view reused on the next call"""
+        n = len(samples)
+        if n > self.max_frame:
+            raise ValueError(f"Frame of {n} samples exceeds max_frame={self.max_frame}")
+        if self.up == self.down:
+            return samples
+
+        history = self._history
+        self._buffer[history:history + n] = samples
+        windows = np.lib.stride_tricks.sliding_window_view(self._buffer[:history + n], self.taps)
+
+        if self.down == 1:
+            produced = n * self.up
+            np.matmul(windows, self._phases, out=self._interp[:n])
+            result = self._interp[:n].reshape(-1)
+        elif self.up == 1:
+            start = self._position
+            produced = len(range(start, n, self.down))
+            np.matmul(windows[start::self.down], self._phases[:, 0], out=self._float_out[:produced])
+            result = self._float_out[:produced]
+            self._position = start + produced * self.down - n
+        else:
+            positions = np.arange(self._position, n * self.up, self.down)
+            produced = len(positions)
+            rows, phases = np.divmod(positions, self.up)
+            result = np.einsum("ij,ji->i", windows[rows], self._phases[:, phases])
+            self._position = self._position + produced * self.down - n * self.up
+
+        # Keep the tail as history for the next frame
+        self._buffer[:history] = self._buffer[n:n + history]
+
+        out = self._int_out[:produced]
+        np.clip(result, -32768, 32767, out=self._float_out[:produced])
+        np.rint(self._float_out[:produced], out=self._float_out[:produced])
+        out[:] = self._float_out[:produced]
+        return out
+
+class AudioRingBuffer:
+    """Fixed-capacity int16 FIFO; writes and reads copy into preallocated storage"""
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self._read = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, samples: np.ndarray) -> int:
+        """Append samples, dropping the oldest on overflow; returns samples dropped"""
+        n = len(samples)
+        dropped = max(0, self._size + n - self.capacity)
+        if n >= self.capacity:
+            self._data[:] = samples[n - self.capacity:]
+            self._read, self._size = 0, self.capacity
+            return dropped
+        if dropped:
+            self._read = (self._read + dropped) % self.capacity
+            self._size -= dropped
+        start = (self._read + self._size) % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:n - first] = samples[first:]
+        self._size += n
+        return dropped
+
+    def skip(self, n: int) -> None:
+        """Discard the oldest ``n`` samples"""
+        n = min(n, self._size)
+        self._read = (self._read + n) % self.capacity
+        self._size -= n
+
+    def clear(self) -> None:
+        self._read = 0
+        self._size = 0
+
+    def peek(self, out: np.ndarray) -> int:
+        """Like read() but leaves the samples in the buffer"""
+        n = min(len(out), self._size)
+        first = min(n, self.capacity - self._read)
+        out[:first] = self._data[self._read:self._read + first]
+        out[first:n] = self._data[:n - first]
+        return n
+
+    def read(self, out: np.ndarray) -> int:
+        """Fill ``out`` with up to len(out) samples; returns how many were read"""
+        n = self.peek(out)
+        self._read = (self._read + n) % self.capacity
+        self._size -= n
+        return n
+
+class UlawDecoder:
+    """Twilio mu-law payloads -> int16 PCM at the pipeline sample rate"""
+
+    def __init__(self, out_rate: int = 16000, max_frame: int = 1600):
+        self._pcm = np.empty(max_frame, dtype=np.int16)
+        self._resampler = PolyphaseResampler(TWILIO_SAMPLE_RATE, out_rate, max_frame=max_frame)
+
+    def decode(self, ulaw: Union[bytes, np.ndarray]) -> np.ndarray:
+        n = len(ulaw)
+        pcm = ulaw_decode(ulaw, out=self._pcm[:n])
+        return self._resampler.process(pcm)
+
+class UlawEncoder:
+    """int16 PCM at any rate -> Twilio mu-law payloads
+
+    Resamplers are created per input rate the first time it is seen (TTS
+    output and cached phrases can differ) and then reused.
+    """
+
+    def __init__(self, max_frame: int = 4800):
+        self.max_frame = max_frame
+        self._resamplers = {}
+
+    def encode(self, pcm: Union[bytes, np.ndarray], in_rate: int) -> np.ndarray:
+        samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+        if len(samples) > self.max_frame:
+            # Oversized frames are rare (pipecat chunks TTS output); split them and pay for the join
+            return np.concatenate([
+                self.encode(samples[i:i + self.max_frame], in_rate).copy()
+                for i in range(0, len(samples), self.max_frame)
+            ])
+        entry = self._resamplers.get(in_rate)
+        if entry is None:
+            resampler = PolyphaseResampler(in_rate, TWILIO_SAMPLE_RATE, max_frame=self.max_frame)
+            entry = self._resamplers[in_rate] = (resampler, np.empty(resampler.max_output, dtype=np.uint8))
+        resampler, ulaw = entry
+        out = resampler.process(samples)
+        return ulaw_encode(out, out=ulaw[:len(out)])
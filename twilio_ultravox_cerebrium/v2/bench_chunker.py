@@ -0,0 +1,89 @@
+"""
+Time to first TTS audio with clause chunking vs sentence aggregation.
+
+    python bench_chunker.py --token-ms 25 --tts-ttfb-ms 150
+
+Streams typical replies (under 50 words, with times, prices and booking
+codes) token by token at the model's decode rate and notes when each mode
+would hand its first text to TTS:
+
+sentence  pipecat's default: wait for text that ends a sentence
+clause    ClauseChunker (TEXT_CHUNKING=clause)
+
+First audio is that moment plus the TTS time to first byte, counted from
+the first model token. Also prints the chunks, so splits inside numbers
+or codes are easy to spot.
+"""
+import argparse
+import re
+
+from text_chunker import ClauseChunker
+
+REPLIES = [
+    "Sure, I can help with that. We have a table for four at 7:30 p.m. on Friday, by the window. Shall I book it?",
+    "Great, you're all set for Saturday at 6:45 p.m. Your booking code is AB-4821, and we'll hold the table for fifteen minutes.",
+    "Our hours are Monday through Sunday, 11 AM to 10 PM, and the kitchen closes at 9:30.",
+    "The tasting menu is $85 per person, or $1,250 for a private room of up to 12 guests.",
+    "Of course. Could I get a name and phone number for the reservation?",
+    "I'm sorry, we're fully booked at 8 tonight; I do have 8:45 or 9:15 available, would either of those work?",
+    "Your confirmation number is 4, 8, 2, 1. Is there anything else I can help you with today?",
+    "Yes, we have vegetarian and gluten-free options, including a mushroom risotto and a grilled vegetable plate.",
+]
+
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s*$")
+_TOKEN = re.compile(r"\s*[A-Za-z']+|\s*\d+|\s*[^\sA-Za-z\d]")
+
+def first_chunk_tokens(tokens, mode: str, min_chars: int):
+    """Index of the token at which the first text goes to TTS, and every chunk"""
+    first = None
+    chunks = []
+    if mode == "clause":
+        chunker = ClauseChunker(min_chars=min_chars)
+        for i, token in enumerate(tokens):
+            ready = chunker.push(token)
+            if ready and first is None:
+                first = i
+            chunks += ready
+        tail = chunker.flush()
+    else:
+        text = ""
+        for i, token in enumerate(tokens):
+            text += token
+            # pipecat only needs the sentence punctuation itself
+            if _SENTENCE_END.search(text) and not re.search(r"(?:\b[A-Za-z]|\b[ap]\.m|Dr|Mr|Mrs|St)\.$", text):
+                if first is None:
+                    first = i
+                chunks.append(text.strip())
+                text = ""
+        tail = text.strip() or None
+    if tail:
+        chunks.append(tail)
+    return (len(tokens) - 1 if first is None else first), chunks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token-ms", type=float, default=25.0, help="model time per token")
+    parser.add_argument("--tts-ttfb-ms", type=float, default=150.0)
+    parser.add_argument("--min-chars", type=int, default=12)
+    parser.add_argument("--show-chunks", action="store_true")
+    args = parser.parse_args()
+
+    results = {"sentence": [], "clause": []}
+    for reply in REPLIES:
+        tokens = _TOKEN.findall(reply)
+        for mode in results:
+            index, chunks = first_chunk_tokens(tokens, mode, args.min_chars)
+            results[mode].append(index * args.token_ms + args.tts_ttfb_ms)
+            if args.show_chunks:
+                print(f"{mode:<9} {chunks}")
+
+    print(f"{'reply':<6} {'sentence':>10} {'clause':>10}")
+    for i in range(len(REPLIES)):
+        print(f"{i:<6} {results['sentence'][i]:>8.0f}ms {results['clause'][i]:>8.0f}ms")
+    for mode, values in results.items():
+        ordered = sorted(values)
+        print(f"{mode:<9} first audio mean {sum(values) / len(values):6.0f}ms  p50 {ordered[len(ordered) // 2]:6.0f}ms"
+              f"  max {ordered[-1]:6.0f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the audio_codec media path against the stock serializer path.
+
+    python bench_codec.py --seconds 20
+
+Both directions are measured per 20 ms Twilio frame, including the JSON and
+base64 work the serializer does around the audio:
+
+  inbound   Twilio media JSON -> 16 kHz PCM bytes for the pipeline
+  outbound  16 kHz PCM from TTS (40 ms chunks) -> Twilio media JSON
+
+The stock path is what pipecat's TwilioFrameSerializer does per frame:
+audioop mu-law conversion plus a one-shot resample (soxr when installed,
+as in pipecat, otherwise audioop.ratecv with fresh state every frame).
+Results are frames per second of CPU time on one core.
+"""
+import argparse
+import audioop
+import base64
+import json
+import time
+
+import numpy as np
+
+from audio_codec import UlawDecoder, UlawEncoder
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+TWILIO_RATE = 8000
+PIPELINE_RATE = 16000
+
+def resample_one_shot(pcm: bytes, in_rate: int, out_rate: int) -> bytes:
+    if soxr is not None:
+        audio = np.frombuffer(pcm, dtype=np.int16)
+        return soxr.resample(audio, in_rate, out_rate, quality="VHQ").astype(np.int16).tobytes()
+    return audioop.ratecv(pcm, 2, 1, in_rate, out_rate, None)[0]
+
+def stock_inbound(message: str) -> bytes:
+    payload = base64.b64decode(json.loads(message)["media"]["payload"])
+    return resample_one_shot(audioop.ulaw2lin(payload, 2), TWILIO_RATE, PIPELINE_RATE)
+
+def stock_outbound(pcm: bytes, stream_sid: str) -> str:
+    ulaw = audioop.lin2ulaw(resample_one_shot(pcm, PIPELINE_RATE, TWILIO_RATE), 2)
+    payload = base64.b64encode(ulaw).decode("utf-8")
+    return json.dumps({"event": "media", "streamSid": stream_sid, "media": {"payload": payload}})
+
+def make_inputs(seconds: float, stream_sid: str):
+    t = np.arange(int(seconds * PIPELINE_RATE)) / PIPELINE_RATE
+    speech = (np.sin(2 * np.pi * 180 * t) * 0.3 * (np.sin(2 * np.pi * 2 * t) > 0) * 32767).astype(np.int16)
+    ulaw = audioop.lin2ulaw(speech[::2].tobytes(), 2)
+    inbound = [
+        json.dumps({
+            "event": "media",
+            "streamSid": stream_sid,
+            "media": {"track": "inbound", "chunk": str(i), "timestamp": str(i * 20),
+                      "payload": base64.b64encode(ulaw[i * 160:(i + 1) * 160]).decode()},
+        })
+        for i in range(len(ulaw) // 160)
+    ]
+    chunk = PIPELINE_RATE * 2 * 40 // 1000
+    pcm = speech.tobytes()
+    outbound = [pcm[i:i + chunk] for i in range(0, len(pcm) - chunk + 1, chunk)]
+    return inbound, outbound
+
+def measure(label: str, fn, items, frames_per_item: int) -> None:
+    fn(items[0])  # warm up tables and lazily built state
+    started = time.process_time()
+    for item in items:
+        fn(item)
+    cpu = time.process_time() - started
+    frames = len(items) * frames_per_item
+    print(f"{label:<24} {frames / cpu:>12,.0f} frames/s/core {cpu / frames * 1e6:>8.1f} us/frame")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20.0, help="audio per direction")
+    args = parser.parse_args()
+
+    stream_sid = "MZ" + "0" * 32
+    inbound, outbound = make_inputs(args.seconds, stream_sid)
+    print(f"resampler for the stock path: {'soxr (VHQ)' if soxr else 'audioop.ratecv'}")
+
+    decoder = UlawDecoder(out_rate=PIPELINE_RATE)
+    encoder = UlawEncoder()
+
+    def codec_inbound(message: str) -> bytes:
+        payload = base64.b64decode(json.loads(message)["media"]["payload"])
+        return decoder.decode(payload).tobytes()
+
+    def codec_outbound(pcm: bytes) -> str:
+        payload = base64.b64encode(encoder.encode(pcm, PIPELINE_RATE)).decode("ascii")
+        return json.dumps({"event": "media", "streamSid": stream_sid, "media": {"payload": payload}})
+
+    measure("inbound  stock", stock_inbound, inbound, 1)
+    measure("inbound  audio_codec", codec_inbound, inbound, 1)
+    measure("outbound stock", lambda pcm: stock_outbound(pcm, stream_sid), outbound, 2)
+    measure("outbound audio_codec", codec_outbound, outbound, 2)
+
+if __name__ == "__main__":
+    main()
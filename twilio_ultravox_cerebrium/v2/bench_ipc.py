@@ -0,0 +1,103 @@
+"""
+Benchmark the worker <-> inference daemon path with the CPU stand-in model.
+
+    python bench_ipc.py --turns 2000 --concurrency 16 --audio-seconds 3
+
+Starts an InferenceServer over TinyStandInModel (no prefill or step delay,
+so only the transport is measured) in a child process, then pushes turns
+through RemoteInferenceScheduler twice: once with the shared-memory rings
+and once with everything inline on the socket. Reports turns/s, time to
+first token and worker CPU per turn. A final check kills and restarts the
+daemon and confirms the client reconnects.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from inference_ipc import InferenceServer, RemoteInferenceScheduler
+from inference_scheduler import InferenceScheduler, TinyStandInModel
+
+MESSAGES = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "<|audio|>\n"}]
+
+def run_daemon(socket_path: str, tokens: int) -> None:
+    async def serve():
+        model = TinyStandInModel(step_ms=0, per_sequence_ms=0, prefill_ms_per_audio_second=0,
+                                 prefill_ms_per_prompt_token=0, reply_tokens=(tokens, tokens))
+        server = InferenceServer(InferenceScheduler(model, max_wait_ms=1), socket_path)
+        await server.start()
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+def start_daemon(socket_path: str, tokens: int) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=run_daemon, args=(socket_path, tokens), daemon=True)
+    process.start()
+    return process
+
+async def measure(label: str, client: RemoteInferenceScheduler, turns: int, concurrency: int, audio: np.ndarray) -> None:
+    first_tokens = []
+    remaining = turns
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            request = client.submit(MESSAGES, audio=audio, max_tokens=64)
+            first = None
+            async for _ in request.tokens():
+                if first is None:
+                    first = time.perf_counter() - started
+            first_tokens.append(first)
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    first_tokens.sort()
+    print(f"{label:<14} {turns / wall:>8,.0f} turns/s  first token p50 {first_tokens[len(first_tokens) // 2] * 1000:6.2f}ms "
+          f"p99 {first_tokens[int(len(first_tokens) * 0.99)] * 1000:6.2f}ms  worker cpu {cpu / turns * 1e6:7.1f}us/turn")
+
+async def run(args) -> None:
+    socket_path = os.path.join(tempfile.mkdtemp(), "inference.sock")
+    daemon = start_daemon(socket_path, args.tokens)
+    audio = np.random.uniform(-0.1, 0.1, int(16000 * args.audio_seconds)).astype(np.float32)
+
+    for label, shared_memory in (("socket only", False), ("shared memory", True)):
+        client = RemoteInferenceScheduler(socket_path, shared_memory=shared_memory)
+        await client.connect(timeout=30)
+        await measure(label, client, args.turns, args.concurrency, audio)
+        await client.stop()
+
+    client = RemoteInferenceScheduler(socket_path)
+    await client.connect(timeout=30)
+    daemon.kill()
+    daemon.join()
+    await asyncio.sleep(0.2)
+    down = client.connected
+    restarted = time.perf_counter()
+    daemon = start_daemon(socket_path, args.tokens)
+    while not client.connected:
+        await asyncio.sleep(0.05)
+    reply = [t async for t in client.submit(MESSAGES, audio=audio).tokens()]
+    print(f"daemon restart: connected while down={down}, reconnected in {time.perf_counter() - restarted:.2f}s, "
+          f"reply of {len(reply)} tokens")
+    await client.stop()
+    daemon.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument("--tokens", type=int, default=20, help="reply length in tokens")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
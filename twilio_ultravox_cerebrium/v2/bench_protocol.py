@@ -0,0 +1,84 @@
+"""
+Microbenchmark the Twilio message codec against json + base64.
+
+    python bench_protocol.py --messages 200000
+
+inbound   media message text -> mu-law payload bytes
+          current: json.loads + base64.b64decode
+          twilio_protocol: TwilioMessageDecoder.decode into its buffer
+outbound  mu-law payload -> media message text
+          current: base64.b64encode + json.dumps
+          twilio_protocol: TwilioMessageEncoder.media
+
+Messages are shaped like Twilio's (compact JSON, 160 byte payloads). One in
+a hundred inbound messages is a mark, to keep the fallback path honest.
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+from twilio_protocol import TwilioMessageDecoder, TwilioMessageEncoder
+
+STREAM_SID = "MZ" + "0" * 32
+
+def make_inbound(count: int):
+    messages = []
+    for i in range(count):
+        if i % 100 == 99:
+            event = {"event": "mark", "sequenceNumber": str(i), "streamSid": STREAM_SID, "mark": {"name": "m"}}
+        else:
+            event = {
+                "event": "media",
+                "sequenceNumber": str(i),
+                "media": {"track": "inbound", "chunk": str(i), "timestamp": str(i * 20),
+                          "payload": base64.b64encode(os.urandom(160)).decode()},
+                "streamSid": STREAM_SID,
+            }
+        messages.append(json.dumps(event, separators=(",", ":")))
+    return messages
+
+def current_inbound(message: str):
+    event = json.loads(message)
+    if event["event"] == "media":
+        return base64.b64decode(event["media"]["payload"])
+    return event
+
+def current_outbound(payload: bytes) -> str:
+    return json.dumps({
+        "event": "media",
+        "streamSid": STREAM_SID,
+        "media": {"payload": base64.b64encode(payload).decode("utf-8")},
+    })
+
+def measure(label: str, fn, items) -> float:
+    started = time.process_time()
+    for item in items:
+        fn(item)
+    cpu = time.process_time() - started
+    print(f"{label:<28} {len(items) / cpu:>12,.0f} msgs/s/core {cpu / len(items) * 1e6:>7.2f} us/msg")
+    return cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    inbound = make_inbound(args.messages)
+    payloads = [os.urandom(160) for _ in range(min(args.messages, 5000))] * max(1, args.messages // 5000)
+
+    decoder = TwilioMessageDecoder()
+    encoder = TwilioMessageEncoder(STREAM_SID)
+    for message in inbound[:100]:
+        assert decoder.decode(message)[0] == json.loads(message)["event"]
+
+    before = measure("inbound  json+base64", current_inbound, inbound)
+    after = measure("inbound  twilio_protocol", decoder.decode, inbound)
+    print(f"{'':<28} {before / after:>12.1f}x")
+    before = measure("outbound json+base64", current_outbound, payloads)
+    after = measure("outbound twilio_protocol", encoder.media, payloads)
+    print(f"{'':<28} {before / after:>12.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Event-loop cost of call recording: ring buffer taps vs writing from the loop.
+
+    python bench_recorder.py --calls 50 --seconds 10 --slow-disk-ms 0
+
+Runs --calls simulated calls on one event loop. Each call sends a 20 ms
+caller frame (16 kHz) every 20 ms and a 2 s burst of agent TTS audio
+(24 kHz, 40 ms frames) every 4 s. A probe task sleeps 5 ms at a time and
+records how late it wakes up, which is the delay every other call on the
+replica sees. Modes:
+
+off     no recording
+inline  each frame appended to a file from the event loop (the naive tap)
+ring    CallRecording + RecordingWriter (CALL_RECORDING=1)
+
+--slow-disk-ms makes every write to disk take that long: every frame for
+inline, every drain of the writer thread for ring. Inline then stalls the
+loop. The ring drops and counts frames, its memory stays at the
+preallocated size, and the loop is unaffected. The ring mode also checks
+that each finalized WAV is as long as its call, and that the cached
+greeting each call opens with (played around TTS, via write_ulaw) is on
+the agent track.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from audio_codec import ulaw_encode
+from call_recorder import AGENT, CALLER, CallRecording, RecordingWriter
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--calls", type=int, default=50)
+parser.add_argument("--seconds", type=float, default=10.0)
+parser.add_argument("--buffer-seconds", type=float, default=10.0)
+parser.add_argument("--flush-interval", type=float, default=0.5)
+parser.add_argument("--slow-disk-ms", type=float, default=0.0, help="extra time per writer drain")
+parser.add_argument("--modes", default="off,inline,ring")
+args = parser.parse_args()
+
+CALLER_FRAME = (np.random.default_rng(0).normal(0, 3000, 320)).astype(np.int16).tobytes()
+AGENT_FRAME = (np.random.default_rng(1).normal(0, 3000, 960)).astype(np.int16).tobytes()
+# 1.5 s of a 440 Hz tone as 8 kHz mu-law, standing in for the cached greeting
+GREETING = ulaw_encode((3000 * np.sin(2 * np.pi * 440 * np.arange(12000) / 8000)).astype(np.int16)).tobytes()
+
+class SlowRecording(CallRecording):
+    def drain(self) -> int:
+        if args.slow_disk_ms and self._head != self._tail:
+            time.sleep(args.slow_disk_ms / 1000)
+        return super().drain()
+
+class InlineRecording:
+    """Append every frame to a file straight from the event loop"""
+
+    def __init__(self, path: str):
+        self._files = [open(f"{path}.caller.pcm", "wb"), open(f"{path}.agent.pcm", "wb")]
+
+    def write(self, track: int, audio: bytes, sample_rate: int, num_channels: int = 1) -> bool:
+        if args.slow_disk_ms:
+            time.sleep(args.slow_disk_ms / 1000)
+        self._files[track].write(audio)
+        self._files[track].flush()
+        return True
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+
+async def simulated_call(recording, tap_times: list, until: float) -> None:
+    if isinstance(recording, CallRecording):
+        recording.write_ulaw(AGENT, GREETING)
+
+    async def caller():
+        next_frame = time.monotonic()
+        while next_frame < until:
+            if recording is not None:
+                started = time.perf_counter()
+                recording.write(CALLER, CALLER_FRAME, 16000)
+                tap_times.append(time.perf_counter() - started)
+            next_frame += 0.02
+            await asyncio.sleep(max(0.0, next_frame - time.monotonic()))
+
+    async def agent():
+        await asyncio.sleep(np.random.uniform(0, 4))
+        while time.monotonic() + 2 < until:
+            # TTS delivers faster than real time: 2 s of audio over ~0.5 s
+            for _ in range(50):
+                if recording is not None:
+                    started = time.perf_counter()
+                    recording.write(AGENT, AGENT_FRAME, 24000)
+                    tap_times.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(min(3.5, max(0.0, until - time.monotonic())))
+
+    await asyncio.gather(caller(), agent())
+
+async def probe(lags: list, until: float) -> None:
+    while time.monotonic() < until:
+        started = time.monotonic()
+        await asyncio.sleep(0.005)
+        lags.append(time.monotonic() - started - 0.005)
+
+def wav_seconds(path: str) -> float:
+    with open(path, "rb") as f:
+        header = f.read(58)
+    channels, rate = struct.unpack_from("<HI", header, 22)
+    data_bytes = struct.unpack_from("<I", header, 54)[0]
+    return data_bytes / channels / rate
+
+def greeting_recorded(path: str) -> bool:
+    """The greeting starts within the first 100 ms of the agent (right) channel"""
+    with open(path, "rb") as f:
+        agent = f.read()[59::2]
+    return 0 <= agent.find(GREETING, 0, 800 + len(GREETING)) < 800
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+async def run(mode: str, directory: str) -> None:
+    writer = None
+    if mode == "ring":
+        writer = RecordingWriter(directory, flush_interval=args.flush_interval, buffer_seconds=args.buffer_seconds)
+        recordings = [writer.add(SlowRecording(f"call{i}", directory, args.buffer_seconds)) for i in range(args.calls)]
+    elif mode == "inline":
+        recordings = [InlineRecording(os.path.join(directory, f"inline{i}")) for i in range(args.calls)]
+    else:
+        recordings = [None] * args.calls
+
+    tap_times, lags = [], []
+    started = time.monotonic()
+    until = started + args.seconds
+    await asyncio.gather(probe(lags, until), *(simulated_call(r, tap_times, until) for r in recordings))
+
+    line = (f"{mode:<7} loop lag p50={percentile(lags, 0.5) * 1000:6.2f} ms  p99={percentile(lags, 0.99) * 1000:6.2f} ms"
+            f"  max={max(lags) * 1000:7.2f} ms")
+    if tap_times:
+        line += (f" | tap p50={percentile(tap_times, 0.5) * 1e6:6.1f} us  p99={percentile(tap_times, 0.99) * 1e6:7.1f} us"
+                 f"  mean={statistics.mean(tap_times) * 1e6:6.1f} us")
+    print(line)
+
+    if mode == "inline":
+        for recording in recordings:
+            recording.close()
+    if writer is not None:
+        frames = sum(r.frames for r in recordings)
+        dropped = sum(r.dropped_frames for r in recordings)
+        memory = sum(r.memory_bytes for r in recordings)
+        for recording in recordings:
+            writer.close(recording)
+        stop_started = time.monotonic()
+        await asyncio.to_thread(writer.stop, 120)
+        lengths = [wav_seconds(r.path) for r in recordings if os.path.exists(r.path)]
+        print(f"        {frames:,} frames recorded, {dropped:,} dropped ({dropped / max(frames + dropped, 1):.1%}), "
+              f"ring memory {memory / 2**20:.1f} MiB for {args.calls} calls, "
+              f"finalize {time.monotonic() - stop_started:.2f}s")
+        if lengths:
+            greetings = sum(greeting_recorded(r.path) for r in recordings if os.path.exists(r.path))
+            print(f"        {len(lengths)} WAVs, {min(lengths):.2f}-{max(lengths):.2f}s long for {args.seconds:.2f}s calls, "
+                  f"greeting on the agent track in {greetings}")
+
+def main():
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(run(mode, directory))
+
+if __name__ == "__main__":
+    main()
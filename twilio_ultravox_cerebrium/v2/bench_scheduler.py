@@ -0,0 +1,107 @@
+"""
+Simulated benchmark of the cross-call inference scheduler on CPU.
+
+    python bench_scheduler.py --concurrency 1 2 4 8 16 --duration 10
+
+Each simulated call alternates between the caller talking (think time) and
+a model turn with 0.5-4 s of audio. The TinyStandInModel stands in for the
+GPU: every decode step costs roughly the same whether it serves one
+sequence or eight, like a memory-bound decoder. Compares running every
+turn on its own (batch size 1, what the pipelines did before) against
+dynamic batching, reporting throughput and time-to-first-token.
+
+Every turn carries the same long system prompt. Pass --prefix-cache to
+reuse its prefilled KV state across calls and report the prefill saved.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from inference_scheduler import InferenceScheduler, TinyStandInModel
+from prefix_cache import PrefixKVCache
+
+# Stand-in for the restaurant prompt built in bot.py (~600 tokens)
+SYSTEM_PROMPT = "You are a helpful AI assistant taking phone calls for our restaurant. " * 35
+
+def percentile(samples, q):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def simulate(concurrency: int, duration: float, max_batch_size: int, max_wait_ms: float, seed: int,
+                   use_prefix_cache: bool):
+    prefix_cache = PrefixKVCache(max_bytes=512 * 1024 * 1024) if use_prefix_cache else None
+    scheduler = InferenceScheduler(
+        TinyStandInModel(seed=seed, prefix_cache=prefix_cache),
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        max_concurrent_batches=1,
+    )
+    rng = random.Random(seed)
+    ttft, turn_times = [], []
+    tokens = 0
+    deadline = time.monotonic() + duration
+
+    async def call():
+        nonlocal tokens
+        await asyncio.sleep(rng.uniform(0, 1.0))
+        while time.monotonic() < deadline:
+            # Only the length of the audio matters to the stand-in model
+            audio = range(int(rng.uniform(0.5, 4.0) * 16000))
+            started = time.monotonic()
+            request = scheduler.submit(
+                [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": "<|audio|>\n"}],
+                audio=audio,
+            )
+            first = None
+            async for _ in request.tokens():
+                if first is None:
+                    first = time.monotonic() - started
+                tokens += 1
+            ttft.append(first)
+            turn_times.append(time.monotonic() - started)
+            await asyncio.sleep(rng.uniform(1.0, 3.0))
+
+    await asyncio.gather(*(call() for _ in range(concurrency)))
+    stats = scheduler.stats()
+    await scheduler.stop()
+    return {
+        "turns_per_s": len(turn_times) / duration,
+        "tokens_per_s": tokens / duration,
+        "ttft_p50": percentile(ttft, 0.5),
+        "ttft_p95": percentile(ttft, 0.95),
+        "turn_p95": percentile(turn_times, 0.95),
+        "mean_batch": stats["mean_batch_size"],
+        "queue_wait_p50": stats["queue_wait_p50_ms"],
+        "prefix_cache": stats["prefix_cache"],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--prefix-cache", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'calls':>5} {'mode':<10} {'turns/s':>8} {'tok/s':>8} {'ttft p50':>9} {'ttft p95':>9} "
+          f"{'turn p95':>9} {'batch':>6} {'wait p50':>9}")
+    for concurrency in args.concurrency:
+        for mode, batch, wait in (("unbatched", 1, 0.0), ("batched", args.max_batch_size, args.max_wait_ms)):
+            r = await simulate(concurrency, args.duration, batch, wait, args.seed, args.prefix_cache)
+            print(
+                f"{concurrency:>5} {mode:<10} {r['turns_per_s']:>8.2f} {r['tokens_per_s']:>8.1f} "
+                f"{r['ttft_p50'] * 1000:>7.0f}ms {r['ttft_p95'] * 1000:>7.0f}ms {r['turn_p95'] * 1000:>7.0f}ms "
+                f"{r['mean_batch']:>6.2f} {r['queue_wait_p50'] or 0:>7.1f}ms"
+            )
+            if r["prefix_cache"]:
+                cache = r["prefix_cache"]
+                print(f"{'':>16} prefix cache hit rate {cache['hit_rate']:.0%}, "
+                      f"prefill saved {cache['prefill_seconds_saved']:.2f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
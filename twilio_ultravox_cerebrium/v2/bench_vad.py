@@ -0,0 +1,87 @@
+"""
+Benchmark per-call SileroVADAnalyzer against the shared VAD engine.
+
+    python bench_vad.py --streams 1 4 16 --seconds 10
+
+For each stream count this reports the resident memory added per call and
+the VAD CPU time per 20 ms frame. Each simulated call feeds 20 ms frames of
+16 kHz audio from its own thread, the same way the transport hands audio to
+the analyzer from its executor.
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+
+from vad import SharedSileroVADAnalyzer, get_vad_engine
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE // 50  # 20 ms
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def make_audio(seconds: float, seed: int) -> bytes:
+    """Speech-like test signal: bursts of noisy harmonics separated by silence"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voiced = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float32)
+    tone = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t)
+    signal = voiced * tone * 0.3 + rng.normal(0, 0.01, t.shape)
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16).tobytes()
+
+def run(factory, streams: int, seconds: float):
+    before = rss_bytes()
+    analyzers = [factory() for _ in range(streams)]
+    for analyzer in analyzers:
+        analyzer.set_sample_rate(SAMPLE_RATE)
+    per_call_memory = (rss_bytes() - before) / streams
+
+    audio = [make_audio(seconds, seed) for seed in range(streams)]
+    frame_bytes = FRAME_SAMPLES * 2
+    cpu_times = [0.0] * streams
+
+    def feed(index: int):
+        analyzer = analyzers[index]
+        data = audio[index]
+        start = time.thread_time()
+        for offset in range(0, len(data) - frame_bytes + 1, frame_bytes):
+            analyzer.analyze_audio(data[offset:offset + frame_bytes])
+        cpu_times[index] = time.thread_time() - start
+
+    threads = [threading.Thread(target=feed, args=(i,)) for i in range(streams)]
+    wall = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    frames = streams * int(seconds * 50)
+    return per_call_memory, sum(cpu_times) / frames, wall
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    # Load the shared model up front so its one-off cost is not billed to calls
+    get_vad_engine()
+
+    print(f"{'analyzer':<12} {'streams':>7} {'memory/call':>12} {'cpu/frame':>10} {'wall':>8}")
+    for streams in args.streams:
+        for name, factory in (("per-call", SileroVADAnalyzer), ("shared", SharedSileroVADAnalyzer)):
+            memory, cpu_per_frame, wall = run(factory, streams, args.seconds)
+            print(
+                f"{name:<12} {streams:>7} {memory / 1024:>9.0f} KiB "
+                f"{cpu_per_frame * 1e6:>7.1f} us {wall:>7.2f}s"
+            )
+    print(f"shared engine: {get_vad_engine().stats()}")
+
+if __name__ == "__main__":
+    main()
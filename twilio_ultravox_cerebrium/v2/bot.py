@@ -2,108 +2,138 @@ import os
 import sys
 import asyncio
 from typing import Optional
+import numpy as np
 from loguru import logger
-from pipecat.frames.frames import LLMMessagesFrame, EndFrame
+from pipecat.frames.frames import LLMMessagesFrame, LLMMessagesUpdateFrame, EndFrame
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
-from pipecat.services.ultravox.stt import UltravoxSTTService
-from pipecat.services.cartesia import CartesiaTTSService
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.transports.network.fastapi_websocket import (
     FastAPIWebsocketTransport,
     FastAPIWebsocketParams,
 )
-from pipecat.serializers.twilio import TwilioFrameSerializer
+
+from vad import SharedSileroVADAnalyzer, get_vad_engine
+from twilio_serializer import FastTwilioFrameSerializer
+from tts_pool import SharedCartesiaTTSService, get_tts_manager
+from audio_cache import default_phrases, get_phrase_cache, play_to_twilio
+from inference_scheduler import InferenceScheduler, UltravoxModelBackend
+from inference_ipc import RemoteInferenceScheduler
+from turn_processor import UltravoxTurnProcessor
+from text_chunker import ClauseAggregator
+from prefix_cache import PrefixKVCache
+from startup import StartupTracker, download_weights, prefetch_safetensors
+from metrics import CallMetrics, LatencyTap
+from call_recorder import AGENT, CALLER, CallRecording, RecordingTap
+from stub_services import create_stub_model, create_stub_tts, enabled_stubs
 
 # Configure logging
 logger.remove()
 logger.add(
     sys.stderr,
+    enqueue=True,
     level=os.getenv("LOG_LEVEL", "INFO"),
     format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
 )
 
-# Global Ultravox processor - initialized once when container starts
-_ultravox_processor: Optional[UltravoxSTTService] = None
+# Services replaced by CPU stand-ins for load testing (VOICE_AGENT_STUBS)
+STUBS = enabled_stubs()
+if STUBS:
+    logger.warning(f"Running with stub services: {sorted(STUBS)}")
+
+# Multi-worker mode (serve.py): the model lives in a separate process behind this socket
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+
+# Global Ultravox model - initialized once when container starts
+_ultravox_model = None
 _model_load_lock = asyncio.Lock()
 
-async def get_ultravox_processor() -> UltravoxSTTService:
-    """Get or create the Ultravox processor singleton"""
-    global _ultravox_processor
+async def get_ultravox_model():
+    """Get or create the Ultravox model singleton"""
+    global _ultravox_model
     
-    if _ultravox_processor is not None:
-        return _ultravox_processor
+    if _ultravox_model is not None:
+        return _ultravox_model
     
     async with _model_load_lock:
-        if _ultravox_processor is not None:
-            return _ultravox_processor
+        if _ultravox_model is not None:
+            return _ultravox_model
             
         try:
             logger.info("Loading Ultravox model...")
             
-            # Verify required environment variables
+            # Verify required environment variables (huggingface_hub reads HF_TOKEN itself)
             hf_token = os.getenv("HF_TOKEN")
             if not hf_token:
                 raise ValueError("HF_TOKEN environment variable is required")
             
-            # Load the model
-            _ultravox_processor = UltravoxSTTService(
+            # Load the model with vLLM prefix caching for the shared system prompt.
+            # Construction is slow and synchronous, so keep it off the event loop.
+            from ultravox_model import PrefixCachingUltravoxModel
+            _ultravox_model = await asyncio.to_thread(
+                PrefixCachingUltravoxModel,
                 model_name=os.getenv("ULTRAVOX_MODEL", "fixie-ai/ultravox-v0_4_1-llama-3_1-8b"),
-                hf_token=hf_token,
-                temperature=float(os.getenv("ULTRAVOX_TEMPERATURE", "0.7")),
-                max_tokens=int(os.getenv("ULTRAVOX_MAX_TOKENS", "200")),
             )
             
             logger.info("Ultravox model loaded successfully")
-            return _ultravox_processor
+            return _ultravox_model
             
         except Exception as e:
             logger.error(f"Failed to load Ultravox model: {e}")
             raise RuntimeError(f"Model loading failed: {e}")
 
-async def create_voice_agent(websocket_client, stream_sid: str):
-    """Create and run the voice agent pipeline"""
-    
-    try:
-        # Get the Ultravox processor
-        ultravox_processor = await get_ultravox_processor()
-        
-        # Configure WebSocket transport for Twilio
-        transport = FastAPIWebsocketTransport(
-            websocket=websocket_client,
-            params=FastAPIWebsocketParams(
-                audio_out_enabled=True,
-                add_wav_header=False,
-                vad_enabled=True,
-                vad_analyzer=SileroVADAnalyzer(),
-                vad_audio_passthrough=True,
-                serializer=TwilioFrameSerializer(stream_sid),
-            ),
-        )
+_inference_scheduler = None
 
-        # Configure Cartesia TTS service
-        cartesia_api_key = os.getenv("CARTESIA_API_KEY")
-        if not cartesia_api_key:
-            raise ValueError("CARTESIA_API_KEY environment variable is required")
-            
-        tts = CartesiaTTSService(
-            api_key=cartesia_api_key,
-            voice_id=os.getenv("CARTESIA_VOICE_ID", "79a125e8-cd45-4c13-8a67-188112f4dd22"),
-            model=os.getenv("CARTESIA_MODEL", "sonic-english"),
-            # Additional TTS configuration
-            speed=float(os.getenv("CARTESIA_SPEED", "1.0")),
+async def create_local_inference_scheduler() -> InferenceScheduler:
+    """Scheduler over the model (or its stub) loaded into this process"""
+    if "llm" in STUBS:
+        # The stand-in simulates prefix reuse; the vLLM engine caches prefixes itself
+        backend = create_stub_model(
+            PrefixKVCache(max_bytes=int(float(os.getenv("PREFIX_CACHE_MAX_MB", "512")) * 1024 * 1024))
         )
+    else:
+        backend = UltravoxModelBackend(await get_ultravox_model())
+    return InferenceScheduler(
+        backend,
+        max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8")),
+        max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "15")),
+    )
 
-        # Restaurant-specific system message
-        restaurant_name = os.getenv("RESTAURANT_NAME", "our restaurant")
-        restaurant_address = os.getenv("RESTAURANT_ADDRESS", "downtown")
-        restaurant_hours = os.getenv("RESTAURANT_HOURS", "Monday through Sunday, 11 AM to 10 PM")
-        
-        initial_messages = [
-            {
-                "role": "system",
-                "content": f"""You are a helpful AI assistant taking phone calls for {restaurant_name}. 
+async def get_inference_scheduler():
+    """Get or create the scheduler that batches turns from all calls onto the model
+
+    With INFERENCE_SOCKET set this is a client for the model-owner process,
+    connected during warm-up.
+    """
+    global _inference_scheduler
+    
+    if _inference_scheduler is None:
+        if INFERENCE_SOCKET:
+            _inference_scheduler = RemoteInferenceScheduler(
+                INFERENCE_SOCKET, shared_memory=os.getenv("INFERENCE_SHARED_MEMORY", "1") != "0"
+            )
+        else:
+            _inference_scheduler = await create_local_inference_scheduler()
+    return _inference_scheduler
+
+def inference_available() -> bool:
+    """False while the model-owner process is out of reach (multi-worker mode)"""
+    return not INFERENCE_SOCKET or (_inference_scheduler is not None and _inference_scheduler.connected)
+
+def get_inference_stats() -> Optional[dict]:
+    """Scheduler and prefix cache counters, once the scheduler exists"""
+    return _inference_scheduler.stats() if _inference_scheduler is not None else None
+
+def build_initial_messages() -> list:
+    """Restaurant-specific system message shared by every call (and the warm-up)"""
+    restaurant_name = os.getenv("RESTAURANT_NAME", "our restaurant")
+    restaurant_address = os.getenv("RESTAURANT_ADDRESS", "downtown")
+    restaurant_hours = os.getenv("RESTAURANT_HOURS", "Monday through Sunday, 11 AM to 10 PM")
+    
+    return [
+        {
+            "role": "system",
+            "content": f"""You are a helpful AI assistant taking phone calls for {restaurant_name}. 
 
 IMPORTANT INSTRUCTIONS:
 - Keep all responses under 50 words for natural conversation flow
@@ -123,14 +153,85 @@ For reservations, always collect: name, date, time, party size, and phone number
 For takeout orders, always get their name and phone number.
 
 Be friendly, professional, and efficient. Ask one question at a time."""
-            }
-        ]
+        }
+    ]
+
+async def create_voice_agent(websocket_client, stream_sid: str, serializer: Optional[FastTwilioFrameSerializer] = None,
+                             recording: Optional[CallRecording] = None):
+    """Create and run the voice agent pipeline
+
+    ``recording`` (CALL_RECORDING=1) belongs to the caller, which also plays
+    the goodbye and error phrases into it and closes it after the call.
+    """
+    
+    # "clause" hands TTS each clause as it completes; "sentence" leaves pipecat's sentence aggregation
+    text_chunking = os.getenv("TEXT_CHUNKING", "clause")
+    call_metrics = CallMetrics(stream_sid, text_chunking)
+    try:
+        # Turns from every call are batched onto the shared Ultravox model
+        scheduler = await get_inference_scheduler()
+        
+        # Configure WebSocket transport for Twilio
+        vad_analyzer = SharedSileroVADAnalyzer()
+        transport = FastAPIWebsocketTransport(
+            websocket=websocket_client,
+            params=FastAPIWebsocketParams(
+                audio_out_enabled=True,
+                add_wav_header=False,
+                vad_enabled=True,
+                vad_analyzer=vad_analyzer,
+                vad_audio_passthrough=True,
+                serializer=serializer or FastTwilioFrameSerializer(stream_sid),
+            ),
+        )
+
+        # Configure Cartesia TTS over the replica's shared, already-open connections
+        tts_kwargs = {"aggregate_sentences": False} if text_chunking == "clause" else {}
+        if "tts" in STUBS:
+            tts = create_stub_tts(**tts_kwargs)
+        else:
+            tts = SharedCartesiaTTSService(
+                manager=get_tts_manager(),
+                voice_id=os.getenv("CARTESIA_VOICE_ID", "79a125e8-cd45-4c13-8a67-188112f4dd22"),
+                model=os.getenv("CARTESIA_MODEL", "sonic-english"),
+                # Additional TTS configuration
+                speed=float(os.getenv("CARTESIA_SPEED", "1.0")),
+                **tts_kwargs
+            )
+
+        restaurant_name = os.getenv("RESTAURANT_NAME", "our restaurant")
+        initial_messages = build_initial_messages()
+
+        # Per-call model stage; the model itself is shared through the scheduler
+        ultravox_processor = UltravoxTurnProcessor(
+            scheduler,
+            initial_messages,
+            temperature=float(os.getenv("ULTRAVOX_TEMPERATURE", "0.7")),
+            max_tokens=int(os.getenv("ULTRAVOX_MAX_TOKENS", "200")),
+            call_metrics=call_metrics,
+            # Start replies on a short pause instead of VAD's confirmed stop (0 = off)
+            vad_analyzer=vad_analyzer,
+            speculative_silence_ms=float(os.getenv("SPECULATIVE_SILENCE_MS", "0")),
+        )
+
+        # Clause-sized text for TTS instead of whole sentences
+        chunker = [ClauseAggregator(min_chars=int(os.getenv("TEXT_CHUNK_MIN_CHARS", "12")))] if text_chunking == "clause" else []
+        # Opt-in (CALL_RECORDING=1): the taps only copy into a per-call ring, a thread writes the files
+        record_caller = [RecordingTap(recording, CALLER)] if recording else []
+        record_agent = [RecordingTap(recording, AGENT)] if recording else []
 
         # Create the pipeline with Ultravox (STT+LLM) and Cartesia (TTS)
+        # The taps timestamp each stage of a turn for /metrics
         pipeline = Pipeline([
             transport.input(),        # Audio input from Twilio
+            *record_caller,           # Caller track (CALL_RECORDING=1)
+            LatencyTap(call_metrics), # VAD end of speech, interruptions
             ultravox_processor,       # Ultravox handles both STT and LLM processing
+            LatencyTap(call_metrics), # First model token
+            *chunker,                 # Clause boundaries (TEXT_CHUNKING=clause)
             tts,                      # Cartesia TTS for speech synthesis
+            *record_agent,            # Agent track (CALL_RECORDING=1)
+            LatencyTap(call_metrics), # First TTS audio, bot started speaking (upstream)
             transport.output(),       # Audio output to Twilio
         ])
 
@@ -150,6 +251,19 @@ Be friendly, professional, and efficient. Ask one question at a time."""
             """Handle client connection - start the conversation"""
             logger.info(f"Client connected to voice agent for stream {stream_sid}")
             
+            # Play the pre-rendered greeting if we have one and record it in the
+            # model context as if the assistant had said it
+            greeting = get_phrase_cache().get("greeting")
+            if greeting is not None:
+                try:
+                    await play_to_twilio(websocket_client, stream_sid, greeting, recording)
+                    await task.queue_frames([LLMMessagesUpdateFrame(
+                        initial_messages + [{"role": "assistant", "content": greeting.text}]
+                    )])
+                    return
+                except Exception as e:
+                    logger.error(f"Error playing cached greeting, falling back to generated one: {e}")
+            
             # Send initial greeting
             greeting_messages = initial_messages + [
                 {
@@ -193,22 +307,60 @@ Be friendly, professional, and efficient. Ask one question at a time."""
         logger.error(f"Error in voice agent pipeline: {e}")
         raise
     finally:
+        call_metrics.finish()
         logger.info(f"Voice agent pipeline ended for stream {stream_sid}")
 
-# Pre-warm the model when the module is imported (for Cerebrium)
-async def _prewarm_model():
-    """Pre-warm the model during container startup"""
-    try:
-        await get_ultravox_processor()
-        logger.info("Model pre-warming completed")
-    except Exception as e:
-        logger.error(f"Model pre-warming failed: {e}")
+async def warm_up_model(tracker: StartupTracker, scheduler_factory=get_inference_scheduler) -> InferenceScheduler:
+    """Download, load and warm the model (the download, weight_load and warmup phases)"""
+    model_name = os.getenv("ULTRAVOX_MODEL", "fixie-ai/ultravox-v0_4_1-llama-3_1-8b")
+    with tracker.phase("download"):
+        weight_files = [] if "llm" in STUBS else await asyncio.to_thread(download_weights, model_name)
+    
+    with tracker.phase("weight_load") as phase:
+        phase["bytes"] = await asyncio.to_thread(prefetch_safetensors, weight_files)
+        scheduler = await scheduler_factory()
+    
+    with tracker.phase("warmup"):
+        # One synthetic turn with the real system prompt: compiles kernels,
+        # allocates KV cache and primes the prefix cache for the first caller
+        silence = np.zeros(16000, dtype=np.float32)
+        request = scheduler.submit(
+            build_initial_messages() + [{"role": "user", "content": "<|audio|>\n"}],
+            audio=silence,
+            max_tokens=8,
+        )
+        async for _ in request.tokens():
+            pass
+    return scheduler
 
-# Only pre-warm in production (when running on Cerebrium)
-if os.getenv("CEREBRIUM_PROJECT_ID"):
-    import asyncio
+async def warm_up_replica(tracker: StartupTracker):
+    """Load everything a call needs, in phases, and mark the replica ready
+
+    Runs as a background task after the app starts so /health answers
+    straight away while /ready stays failing until the first call would be fast.
+    In multi-worker mode the model owner does the model phases; a worker
+    only waits for it (the model_server phase).
+    """
     try:
-        asyncio.get_event_loop().run_until_complete(_prewarm_model())
-    except RuntimeError:
-        # If no event loop is running, create one
-        asyncio.run(_prewarm_model())
+        if INFERENCE_SOCKET:
+            with tracker.phase("model_server"):
+                scheduler = await get_inference_scheduler()
+                await scheduler.connect()
+        else:
+            await warm_up_model(tracker)
+        
+        with tracker.phase("vad"):
+            await asyncio.to_thread(get_vad_engine)
+        
+        with tracker.phase("tts"):
+            if "tts" not in STUBS:
+                # start() only logs connections that fail to open; don't go ready without one
+                await get_tts_manager().wait_ready()
+                await get_phrase_cache().warm(
+                    get_tts_manager(),
+                    default_phrases(os.getenv("RESTAURANT_NAME", "our restaurant"))
+                )
+        
+        tracker.mark_ready()
+    except Exception as e:
+        logger.error(f"Replica warm-up failed: {e}")
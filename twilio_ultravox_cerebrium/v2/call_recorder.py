@@ -0,0 +1,371 @@
+"""
+Opt-in call recording that never blocks the event loop (CALL_RECORDING=1).
+
+Two RecordingTaps copy audio into a ring buffer that belongs to the call:
+one after the input transport (the caller) and one after TTS (the agent).
+The buffer has a fixed number of fixed-size slots, allocated when the call
+starts, so a tap only copies samples into numpy storage and bumps an
+index. It never writes files, encodes, allocates or takes a lock. When the
+ring is full the frame is dropped and counted. A slow disk costs gaps in
+the recording, not latency on the call, and memory stays bounded.
+
+One writer thread per process serves every call. Every ``flush_interval``
+seconds it drains each ring and appends each track to fixed-size raw PCM
+segment files, with one write per track per drain. Slots carry the time
+they were captured, so a track that went quiet (the agent between replies)
+is padded with silence and both tracks stay on the call's timeline. On
+hangup the thread drains the ring one last time and writes
+``<stream_sid>.wav``: 8 kHz stereo mu-law (caller left, agent right), the
+format Twilio streams in. Then it deletes the segments. If that fails the
+segments are kept.
+
+The agent track is what TTS produced, so a reply the caller interrupted is
+recorded in full. Cached phrases (greeting, goodbye, error) skip TTS and go
+straight to Twilio, so play_to_twilio hands them to ``write_ulaw`` instead:
+the phrase's mu-law bytes are kept by reference with the time playback
+started, and laid over the agent track when the WAV is written.
+"""
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.frames.frames import Frame, InputAudioRawFrame, TTSAudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from audio_codec import TWILIO_SAMPLE_RATE, PolyphaseResampler, ulaw_encode
+from metrics import RECORDING_BYTES, RECORDING_DROPPED_FRAMES, RECORDING_TAP_TIME
+
+CALLER, AGENT = 0, 1
+TRACK_NAMES = ("caller", "agent")
+# Quiet longer than this (per track) becomes silence in the recording
+_GAP_SLACK_SECONDS = 0.2
+_ULAW_SILENCE = 0xFF
+_WAVE_FORMAT_MULAW = 7
+
+class _SegmentWriter:
+    """Appends one track's raw int16 PCM to numbered segment files"""
+
+    def __init__(self, prefix: str, segment_bytes: int):
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.paths: List[str] = []
+        self._file = None
+        self._written = 0
+
+    def write(self, samples: np.ndarray) -> int:
+        data = memoryview(samples).cast("B")
+        offset = 0
+        while offset < len(data):
+            if self._file is None or self._written >= self.segment_bytes:
+                self._roll()
+            n = min(len(data) - offset, self.segment_bytes - self._written)
+            self._file.write(data[offset:offset + n])
+            self._written += n
+            offset += n
+        return len(data)
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = f"{self.prefix}.{len(self.paths):04d}.pcm"
+        self.paths.append(path)
+        self._file = open(path, "wb")
+        self._written = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        self.close()
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class CallRecording:
+    """Per-call single-producer ring (event loop) drained by the writer thread
+
+    The producer fills a slot, then advances ``_head``; the consumer only
+    reads slots below the head and advances ``_tail`` after it has written
+    them, so neither side ever waits for the other.
+    """
+
+    def __init__(self, stream_sid: str, directory: str, buffer_seconds: float = 10.0,
+                 slot_samples: int = 480, sample_rate_hint: int = 24000, segment_bytes: int = 1 << 20):
+        self.stream_sid = stream_sid
+        self.path = os.path.join(directory, f"{stream_sid}.wav")
+        self.slot_samples = slot_samples
+        self.slots = max(8, int(buffer_seconds * sample_rate_hint / slot_samples))
+        self._audio = np.zeros((self.slots, slot_samples), dtype=np.int16)
+        self._lengths = np.zeros(self.slots, dtype=np.int32)
+        self._tracks = np.zeros(self.slots, dtype=np.int8)
+        self._times = np.zeros(self.slots, dtype=np.float64)
+        self._head = 0
+        self._tail = 0
+
+        self._started = time.monotonic()
+        self._rates = [0, 0]
+        self._cursors = [0, 0]
+        self._segments = [_SegmentWriter(os.path.join(directory, f"{stream_sid}.{name}"), segment_bytes)
+                          for name in TRACK_NAMES]
+        # (track, seconds since start, 8 kHz mu-law) for cached phrases
+        self._phrases: List[tuple] = []
+        self.closed = False
+        self.duration = 0.0
+        self.failed = False
+        self.frames = 0
+        self.dropped_frames = 0
+        self.bytes_written = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._audio.nbytes + self._lengths.nbytes + self._tracks.nbytes + self._times.nbytes
+
+    def write(self, track: int, audio: bytes, sample_rate: int, num_channels: int = 1) -> bool:
+        """Copy a frame into the ring (event loop side); False if it was dropped"""
+        if self.closed or self.failed:
+            return False
+        rate = self._rates[track]
+        if rate == 0:
+            self._rates[track] = rate = sample_rate
+        samples = np.frombuffer(audio, dtype=np.int16)
+        if num_channels > 1:
+            samples = samples[::num_channels]
+        needed = -(-len(samples) // self.slot_samples)
+        if rate != sample_rate or self._head - self._tail + needed > self.slots:
+            self.dropped_frames += 1
+            RECORDING_DROPPED_FRAMES.inc()
+            return False
+
+        now = time.monotonic() - self._started
+        size = self.slot_samples
+        for i in range(needed):
+            chunk = samples[i * size:(i + 1) * size]
+            slot = self._head % self.slots
+            self._audio[slot, :len(chunk)] = chunk
+            self._lengths[slot] = len(chunk)
+            self._tracks[slot] = track
+            self._times[slot] = now
+            self._head += 1
+        self.frames += 1
+        return True
+
+    def write_ulaw(self, track: int, ulaw) -> bool:
+        """Place 8 kHz mu-law (a cached phrase) on a track from now on; no copy is made"""
+        if self.closed or self.failed:
+            return False
+        self._phrases.append((track, time.monotonic() - self._started, ulaw))
+        self.frames += 1
+        return True
+
+    def close(self) -> None:
+        """Stop capturing; the recording runs until now even if the end was dropped"""
+        self.duration = time.monotonic() - self._started
+        self.closed = True
+
+    def drain(self) -> int:
+        """Append everything captured so far to the segment files (writer thread side)"""
+        head, tail = self._head, self._tail
+        if head == tail or self.failed:
+            return 0
+        parts: Dict[int, list] = {CALLER: [], AGENT: []}
+        for i in range(tail, head):
+            slot = i % self.slots
+            track = int(self._tracks[slot])
+            rate = self._rates[track]
+            gap = int(self._times[slot] * rate) - self._cursors[track]
+            if gap > _GAP_SLACK_SECONDS * rate:
+                parts[track].append(np.zeros(gap, dtype=np.int16))
+                self._cursors[track] += gap
+            n = int(self._lengths[slot])
+            # No copy: the producer cannot reuse this slot until _tail moves past it
+            parts[track].append(self._audio[slot, :n])
+            self._cursors[track] += n
+
+        written = 0
+        try:
+            for track, arrays in parts.items():
+                if arrays:
+                    written += self._segments[track].write(np.concatenate(arrays))
+        except OSError as e:
+            self.failed = True
+            logger.error(f"Recording {self.stream_sid} failed, dropping the rest of the call: {e}")
+        self._tail = head
+        self.bytes_written += written
+        RECORDING_BYTES.inc(written)
+        return written
+
+    def _track_ulaw(self, track: int, length: int) -> np.ndarray:
+        """A track's segments as 8 kHz mu-law, padded with silence to ``length``"""
+        out = np.full(length, _ULAW_SILENCE, dtype=np.uint8)
+        rate = self._rates[track]
+        if rate:
+            resampler = PolyphaseResampler(rate, TWILIO_SAMPLE_RATE, max_frame=rate)
+            position = 0
+            for path in self._segments[track].paths:
+                samples = np.fromfile(path, dtype=np.int16)
+                for start in range(0, len(samples), rate):
+                    ulaw = ulaw_encode(resampler.process(samples[start:start + rate]))
+                    n = min(len(ulaw), length - position)
+                    out[position:position + n] = ulaw[:n]
+                    position += n
+        # A phrase is what the caller heard from then on, even over TTS audio it replaced
+        for phrase_track, at, ulaw in self._phrases:
+            if phrase_track == track:
+                start = int(at * TWILIO_SAMPLE_RATE)
+                n = max(0, min(len(ulaw), length - start))
+                out[start:start + n] = np.frombuffer(ulaw, dtype=np.uint8, count=n)
+        return out
+
+    def finalize(self) -> Optional[str]:
+        """Write the stereo WAV and remove the segments; returns the WAV path"""
+        self.drain()
+        for segments in self._segments:
+            segments.close()
+        if self.failed or not self.frames:
+            return None
+        length = max([int(self.duration * TWILIO_SAMPLE_RATE)]
+                     + [int(np.ceil(cursor * TWILIO_SAMPLE_RATE / rate))
+                        for cursor, rate in zip(self._cursors, self._rates) if rate]
+                     + [int(at * TWILIO_SAMPLE_RATE) + len(ulaw) for _, at, ulaw in self._phrases])
+        stereo = np.empty(length * 2, dtype=np.uint8)
+        stereo[0::2] = self._track_ulaw(CALLER, length)
+        stereo[1::2] = self._track_ulaw(AGENT, length)
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_mulaw_wav_header(channels=2, frames=length))
+            stereo.tofile(f)
+        os.replace(tmp, self.path)
+        for segments in self._segments:
+            segments.remove()
+        return self.path
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames,
+            "bytes_written": self.bytes_written,
+            "buffered_slots": self._head - self._tail,
+            "slots": self.slots,
+            "failed": self.failed,
+        }
+
+def _mulaw_wav_header(channels: int, frames: int) -> bytes:
+    """RIFF header for 8-bit mu-law (non-PCM formats need the fact chunk)"""
+    data_bytes = frames * channels
+    fmt = struct.pack("<HHIIHHH", _WAVE_FORMAT_MULAW, channels, TWILIO_SAMPLE_RATE,
+                      TWILIO_SAMPLE_RATE * channels, channels, 8, 0)
+    return (b"RIFF" + struct.pack("<I", 4 + (8 + len(fmt)) + 12 + (8 + data_bytes)) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"fact" + struct.pack("<II", 4, frames)
+            + b"data" + struct.pack("<I", data_bytes))
+
+class RecordingWriter:
+    """Process-wide thread that drains every call's ring and finalizes recordings"""
+
+    def __init__(self, directory: str, flush_interval: float = 0.5, buffer_seconds: float = 10.0,
+                 segment_bytes: int = 1 << 20):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buffer_seconds = buffer_seconds
+        self.segment_bytes = segment_bytes
+        self.recordings: Dict[str, CallRecording] = {}
+        self.finished = 0
+        self._closing: "queue.SimpleQueue[CallRecording]" = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, stream_sid: str) -> CallRecording:
+        return self.add(CallRecording(stream_sid, self.directory, self.buffer_seconds,
+                                      segment_bytes=self.segment_bytes))
+
+    def add(self, recording: CallRecording) -> CallRecording:
+        """Start draining a recording (the thread starts with the first one)"""
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="call-recorder", daemon=True)
+            self._thread.start()
+        self.recordings[recording.stream_sid] = recording
+        return recording
+
+    def close(self, recording: CallRecording) -> None:
+        """Stop capturing and finalize in the background; returns immediately"""
+        recording.close()
+        self._closing.put(recording)
+
+    def _finish(self, recording: CallRecording) -> None:
+        try:
+            path = recording.finalize()
+            if path:
+                logger.info(f"Recording saved to {path} ({recording.dropped_frames} frames dropped)")
+        except Exception as e:
+            logger.error(f"Could not finalize recording {recording.stream_sid}, segments kept: {e}")
+        self.recordings.pop(recording.stream_sid, None)
+        self.finished += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            for recording in list(self.recordings.values()):
+                recording.drain()
+            while True:
+                try:
+                    self._finish(self._closing.get_nowait())
+                except queue.Empty:
+                    break
+        for recording in list(self.recordings.values()):
+            self._finish(recording)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Finalize whatever is still open and stop the thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.recordings),
+            "finished": self.finished,
+            "dropped_frames": sum(r.dropped_frames for r in self.recordings.values()),
+        }
+
+_writer: Optional[RecordingWriter] = None
+
+def get_recording_writer() -> Optional[RecordingWriter]:
+    """The replica's recording writer, or None unless CALL_RECORDING is on"""
+    global _writer
+    if _writer is None and os.getenv("CALL_RECORDING", "0") == "1":
+        _writer = RecordingWriter(
+            directory=os.getenv("RECORDING_DIR", "recordings"),
+            flush_interval=float(os.getenv("RECORDING_FLUSH_INTERVAL", "0.5")),
+            buffer_seconds=float(os.getenv("RECORDING_BUFFER_SECONDS", "10")),
+            segment_bytes=int(float(os.getenv("RECORDING_SEGMENT_MB", "1")) * 1024 * 1024),
+        )
+    return _writer
+
+class RecordingTap(FrameProcessor):
+    """Pass-through stage that copies one track's audio into the call's ring"""
+
+    def __init__(self, recording: CallRecording, track: int, **kwargs):
+        super().__init__(**kwargs)
+        self._recording = recording
+        self._track = track
+        self._frame_type = InputAudioRawFrame if track == CALLER else TTSAudioRawFrame
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, self._frame_type) and direction == FrameDirection.DOWNSTREAM:
+            started = time.perf_counter()
+            self._recording.write(self._track, frame.audio, frame.sample_rate, frame.num_channels)
+            RECORDING_TAP_TIME.observe(time.perf_counter() - started)
+
+        await self.push_frame(frame, direction)
@@ -0,0 +1,510 @@
+"""
+Warm-replica planning from historical call arrivals.
+
+    python capacity_planner.py plan --logs logs/*.log --json schedule.json
+    python capacity_planner.py simulate --logs logs/*.log
+    python capacity_planner.py simulate --synthetic-weeks 6
+
+A static ``min_replicas``/``scaling_buffer`` pays for idle GPUs at 3 AM and
+still cold-starts (~40 s) at the 5 PM rush. This learns how many calls
+arrive in each 15-minute slot of the week from the ``Call arrival`` and
+``Call ended`` lines main.py logs. Recent weeks count for more, and
+neighbouring slots are smoothed. It turns that into a warm replica count
+per slot:
+
+- one replica once the expected cold-start hits in the slot cost more than
+  keeping it warm (``--cold-start-cost``, in GPU-hours per hit)
+- more while the chance that an arriving call finds every warm slot busy
+  is above ``--target`` (calls in progress are Poisson with mean = arrival
+  rate x mean call duration)
+- at least ``--min-open-replicas`` while the restaurant is open
+  (RESTAURANT_HOURS), from ``--open-lead-minutes`` before opening
+- raised one cold start ahead of each increase, so replicas are ready
+  when the demand arrives
+
+``plan`` prints the schedule as a list of changes and can write it as JSON
+for whatever applies ``min_replicas`` on a timer. ``simulate`` fits the
+planner on all but the last ``--test-weeks`` of a trace, replays those
+weeks against both the static scaling config and the planned schedule, and
+reports cold-start hits against GPU-hours, hour by hour. Logs are read in
+restaurant-local time (``--tz`` / RESTAURANT_TIMEZONE).
+"""
+import argparse
+import glob
+import heapq
+import json
+import math
+import os
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+SLOT_MINUTES = 15
+DAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+DEFAULT_CALL_SECONDS = 180.0
+
+_ARRIVAL = re.compile(r"Call arrival call_sid=(\S+) epoch=([\d.]+) outcome=(\w+)")
+_ENDED = re.compile(r"Call ended call_sid=(\S+) .*?duration=([\d.]+)s")
+
+@dataclass
+class CallRecord:
+    call_sid: str
+    arrival: float
+    duration: Optional[float] = None
+
+def parse_call_logs(lines: Iterable[str]) -> List[CallRecord]:
+    """Calls from main.py log lines; a held call's retries count once"""
+    calls: Dict[str, CallRecord] = {}
+    for line in lines:
+        match = _ARRIVAL.search(line)
+        if match:
+            call_sid = match.group(1)
+            if call_sid not in calls:
+                calls[call_sid] = CallRecord(call_sid, float(match.group(2)))
+            continue
+        match = _ENDED.search(line)
+        if match and match.group(1) in calls:
+            calls[match.group(1)].duration = float(match.group(2))
+    return sorted(calls.values(), key=lambda call: call.arrival)
+
+# Opening hours
+
+_DAY = re.compile(r"\b(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?", re.IGNORECASE)
+_DAY_RANGE = re.compile(r"^\s*(-|–|to|through|thru)\s*$", re.IGNORECASE)
+_TIME = re.compile(r"(\d{1,2})(?::(\d{2}))?\s*([ap])\.?\s*m\b\.?|\bnoon\b|\bmidnight\b", re.IGNORECASE)
+
+def _minutes(match: re.Match) -> int:
+    text = match.group(0).lower()
+    if text == "noon":
+        return 12 * 60
+    if text == "midnight":
+        return 0
+    hour = int(match.group(1)) % 12 + (12 if match.group(3).lower() == "p" else 0)
+    return hour * 60 + int(match.group(2) or 0)
+
+def _days(text: str) -> List[int]:
+    tokens = list(_DAY.finditer(text))
+    days: List[int] = []
+    i = 0
+    while i < len(tokens):
+        start = [d[:3] for d in DAY_NAMES].index(tokens[i].group(1).lower())
+        if i + 1 < len(tokens) and _DAY_RANGE.match(text[tokens[i].end():tokens[i + 1].start()]):
+            end = [d[:3] for d in DAY_NAMES].index(tokens[i + 1].group(1).lower())
+            days.extend((start + k) % 7 for k in range((end - start) % 7 + 1))
+            i += 2
+        else:
+            days.append(start)
+            i += 1
+    return days
+
+def parse_opening_hours(text: str) -> Dict[int, List[Tuple[int, int]]]:
+    """Weekday -> [(open minute, close minute)] from text like RESTAURANT_HOURS
+
+    Understands "Monday through Sunday, 11 AM to 10 PM" and
+    "Mon-Fri 11am-10pm; Sat-Sun 10am-11pm". Hours that run past midnight
+    continue on the next day.
+    """
+    hours: Dict[int, List[Tuple[int, int]]] = {day: [] for day in range(7)}
+    for part in re.split(r"[;\n|]", text):
+        times = list(_TIME.finditer(part))
+        if len(times) < 2:
+            continue
+        opens, closes = _minutes(times[0]), _minutes(times[1])
+        for day in _days(part[:times[0].start()]) or range(7):
+            if closes <= opens:
+                hours[day].append((opens, 24 * 60))
+                if closes:
+                    hours[(day + 1) % 7].append((0, closes))
+            else:
+                hours[day].append((opens, closes))
+    return hours
+
+def is_open(hours: Dict[int, List[Tuple[int, int]]], weekday: int, minute: int) -> bool:
+    return any(opens <= minute < closes for opens, closes in hours[weekday])
+
+# Arrival model
+
+class ArrivalModel:
+    """Expected arrivals per (weekday, slot), recency weighted and smoothed"""
+
+    def __init__(self, tz: ZoneInfo, slot_minutes: int = SLOT_MINUTES, half_life_weeks: float = 4.0):
+        self.tz = tz
+        self.slot_minutes = slot_minutes
+        self.slots = 24 * 60 // slot_minutes
+        self.half_life_weeks = half_life_weeks
+        self.expected = [[0.0] * self.slots for _ in range(7)]
+        self.mean_duration = DEFAULT_CALL_SECONDS
+
+    def slot_of(self, moment: datetime) -> int:
+        return (moment.hour * 60 + moment.minute) // self.slot_minutes
+
+    def fit(self, calls: List[CallRecord]) -> "ArrivalModel":
+        if not calls:
+            return self
+        counts: Dict[date, List[int]] = defaultdict(lambda: [0] * self.slots)
+        for call in calls:
+            local = datetime.fromtimestamp(call.arrival, self.tz)
+            counts[local.date()][self.slot_of(local)] += 1
+
+        # Every day in the observed span counts, including days without calls
+        first = datetime.fromtimestamp(calls[0].arrival, self.tz).date()
+        last = datetime.fromtimestamp(calls[-1].arrival, self.tz).date()
+        weights = [0.0] * 7
+        totals = [[0.0] * self.slots for _ in range(7)]
+        day = first
+        while day <= last:
+            weight = 0.5 ** ((last - day).days / 7 / self.half_life_weeks)
+            weekday = day.weekday()
+            weights[weekday] += weight
+            if day in counts:
+                for slot, count in enumerate(counts[day]):
+                    totals[weekday][slot] += weight * count
+            day += timedelta(days=1)
+
+        # Smooth across neighbouring slots (the week wraps around)
+        week = [totals[d][s] / weights[d] if weights[d] else 0.0 for d in range(7) for s in range(self.slots)]
+        n = len(week)
+        smoothed = [0.25 * week[i - 1] + 0.5 * week[i] + 0.25 * week[(i + 1) % n] for i in range(n)]
+        self.expected = [smoothed[d * self.slots:(d + 1) * self.slots] for d in range(7)]
+
+        durations = [call.duration for call in calls if call.duration]
+        if durations:
+            self.mean_duration = sum(durations) / len(durations)
+        return self
+
+    def offered_load(self, weekday: int, slot: int) -> float:
+        """Mean calls in progress (Erlangs)"""
+        return self.expected[weekday][slot] / (self.slot_minutes * 60) * self.mean_duration
+
+def _poisson_capacity(load: float, target: float) -> int:
+    """Smallest k with P(N >= k) <= target for N ~ Poisson(load)"""
+    k, term, cdf = 0, math.exp(-load), 0.0
+    while 1.0 - cdf > target:
+        cdf += term
+        k += 1
+        term *= load / k
+    return k
+
+# Planner
+
+@dataclass
+class WarmPoolPlanner:
+    model: ArrivalModel
+    opening_hours: Dict[int, List[Tuple[int, int]]]
+    calls_per_replica: int = 1
+    cold_start_seconds: float = 40.0
+    cold_start_cost: float = 2.0
+    target: float = 0.05
+    min_open_replicas: int = 1
+    open_lead_minutes: int = 15
+    max_replicas: int = 3
+
+    def _needed(self, weekday: int, slot: int) -> int:
+        model = self.model
+        slot_hours = model.slot_minutes / 60
+        replicas = 0
+        if model.expected[weekday][slot] * self.cold_start_cost >= slot_hours:
+            capacity = _poisson_capacity(model.offered_load(weekday, slot), self.target)
+            replicas = max(1, math.ceil(capacity / self.calls_per_replica))
+        minute = slot * model.slot_minutes
+        lead = self.open_lead_minutes
+        if is_open(self.opening_hours, weekday, minute) or is_open(
+                self.opening_hours, (weekday + (minute + lead) // 1440) % 7, (minute + lead) % 1440):
+            replicas = max(replicas, self.min_open_replicas)
+        return min(replicas, self.max_replicas)
+
+    def recommend(self) -> List[List[int]]:
+        """Warm replicas to hold from the start of each (weekday, slot)"""
+        slots = self.model.slots
+        needed = [self._needed(d, s) for d in range(7) for s in range(slots)]
+        # Raise ahead of demand so the extra replicas are warm when it arrives
+        ahead = math.ceil(self.cold_start_seconds / (self.model.slot_minutes * 60))
+        n = len(needed)
+        week = [max(needed[(i + k) % n] for k in range(ahead + 1)) for i in range(n)]
+        return [week[d * slots:(d + 1) * slots] for d in range(7)]
+
+    def floor_at(self, schedule: List[List[int]]) -> Callable[[float], int]:
+        def floor(epoch: float) -> int:
+            local = datetime.fromtimestamp(epoch, self.model.tz)
+            return schedule[local.weekday()][self.model.slot_of(local)]
+        return floor
+
+def schedule_changes(schedule: List[List[int]], slot_minutes: int = SLOT_MINUTES) -> Dict[str, List[Tuple[str, int]]]:
+    """Per weekday, the times at which the warm count changes"""
+    changes: Dict[str, List[Tuple[str, int]]] = {}
+    previous = schedule[6][-1]
+    for weekday, slots in enumerate(schedule):
+        day = []
+        for slot, replicas in enumerate(slots):
+            if replicas != previous or slot == 0:
+                minute = slot * slot_minutes
+                day.append((f"{minute // 60:02d}:{minute % 60:02d}", replicas))
+            previous = replicas
+        changes[DAY_NAMES[weekday]] = day
+    return changes
+
+# Simulator
+
+@dataclass
+class _Replica:
+    ready_at: float
+    calls: int = 0
+    idle_since: float = 0.0
+
+@dataclass
+class SimResult:
+    name: str
+    calls: int = 0
+    cold_hits: int = 0
+    rejected: int = 0
+    gpu_seconds: float = 0.0
+    days: float = 0.0
+    hourly_gpu_seconds: List[float] = field(default_factory=lambda: [0.0] * 24)
+    hourly_idle_seconds: List[float] = field(default_factory=lambda: [0.0] * 24)
+    hourly_hits: List[int] = field(default_factory=lambda: [0] * 24)
+
+def simulate(calls: List[CallRecord], name: str, floor: Callable[[float], int], tz: ZoneInfo,
+             calls_per_replica: int = 1, cold_start_seconds: float = 40.0, cooldown_seconds: float = 60.0,
+             buffer: int = 0, max_replicas: int = 3, slot_minutes: int = SLOT_MINUTES,
+             mean_duration: float = DEFAULT_CALL_SECONDS) -> SimResult:
+    """Replay arrivals against a warm floor plus reactive scale-up
+
+    The platform keeps max(floor, replicas in use + buffer) replicas, starts
+    one when a call finds no free warm slot (the call waits out the cold
+    start - a cold-start hit) and releases idle replicas after the cooldown.
+    """
+    result = SimResult(name, calls=len(calls))
+    if not calls:
+        return result
+    start = calls[0].arrival - calls[0].arrival % (slot_minutes * 60)
+    end = max(call.arrival + (call.duration or mean_duration) for call in calls) + cooldown_seconds
+    result.days = (end - start) / 86400
+
+    events: list = []
+    seq = 0
+
+    def push(at: float, kind: str, payload=None):
+        nonlocal seq
+        heapq.heappush(events, (at, seq, kind, payload))
+        seq += 1
+
+    for call in calls:
+        push(call.arrival, "arrival", call)
+    boundary = start
+    while boundary < end:
+        push(boundary, "boundary")
+        boundary += slot_minutes * 60
+    push(end, "end")
+
+    replicas: List[_Replica] = []
+    now = start
+
+    def account(until: float) -> None:
+        t = now
+        while t < until:
+            local = datetime.fromtimestamp(t, tz)
+            hour_end = t + (3600 - local.minute * 60 - local.second - (t % 1))
+            step = min(until, hour_end) - t
+            idle = sum(1 for r in replicas if r.calls == 0)
+            result.gpu_seconds += len(replicas) * step
+            result.hourly_gpu_seconds[local.hour] += len(replicas) * step
+            result.hourly_idle_seconds[local.hour] += idle * step
+            t += step
+
+    def reconcile(t: float) -> None:
+        in_use = sum(1 for r in replicas if r.calls)
+        desired = min(max(floor(t), in_use + buffer), max_replicas)
+        while len(replicas) < desired:
+            replicas.append(_Replica(ready_at=t + cold_start_seconds, idle_since=t + cold_start_seconds))
+        surplus = len(replicas) - desired
+        for replica in sorted(replicas, key=lambda r: r.idle_since):
+            if surplus <= 0:
+                break
+            if replica.calls == 0 and replica.ready_at <= t:
+                if replica.idle_since + cooldown_seconds <= t:
+                    replicas.remove(replica)
+                    surplus -= 1
+                else:
+                    push(replica.idle_since + cooldown_seconds, "expiry")
+
+    while events:
+        at, _, kind, payload = heapq.heappop(events)
+        account(at)
+        now = at
+        if kind == "end":
+            break
+        if kind == "arrival":
+            duration = payload.duration or mean_duration
+            warm = [r for r in replicas if r.ready_at <= at and r.calls < calls_per_replica]
+            if warm:
+                replica = max(warm, key=lambda r: r.calls)
+                begins = at
+            else:
+                starting = [r for r in replicas if r.ready_at > at and r.calls < calls_per_replica]
+                if starting:
+                    replica = min(starting, key=lambda r: r.ready_at)
+                elif len(replicas) < max_replicas:
+                    replica = _Replica(ready_at=at + cold_start_seconds)
+                    replicas.append(replica)
+                else:
+                    result.rejected += 1
+                    continue
+                result.cold_hits += 1
+                result.hourly_hits[datetime.fromtimestamp(at, tz).hour] += 1
+                begins = replica.ready_at
+            replica.calls += 1
+            push(begins + duration, "departure", replica)
+        elif kind == "departure":
+            payload.calls -= 1
+            if payload.calls == 0:
+                payload.idle_since = at
+                push(at + cooldown_seconds, "expiry")
+        reconcile(at)
+    return result
+
+# Traces
+
+def synthetic_calls(weeks: int, hours: Dict[int, List[Tuple[int, int]]], tz: ZoneInfo,
+                    seed: int = 0, peak_calls_per_hour: float = 10.0) -> List[CallRecord]:
+    """A restaurant-shaped trace: lunch and dinner peaks, busier Fri/Sat, a trickle after hours"""
+    rng = random.Random(seed)
+    day = datetime(2024, 1, 1, tzinfo=tz)
+    calls = []
+    for minute_index in range(weeks * 7 * 24 * 60):
+        moment = day + timedelta(minutes=minute_index)
+        minute = moment.hour * 60 + moment.minute
+        if is_open(hours, moment.weekday(), minute):
+            rate = 2.0 + 0.5 * peak_calls_per_hour * math.exp(-((minute - 750) / 50) ** 2)
+            rate += peak_calls_per_hour * math.exp(-((minute - 1050) / 70) ** 2)
+            rate *= 1.4 if moment.weekday() in (4, 5) else 1.0
+        else:
+            rate = 0.2
+        # Poisson arrivals within the minute
+        threshold, k, product = math.exp(-rate / 60), 0, rng.random()
+        while product > threshold:
+            k += 1
+            product *= rng.random()
+        for _ in range(k):
+            arrival = moment.timestamp() + rng.random() * 60
+            duration = rng.lognormvariate(math.log(150), 0.5)
+            calls.append(CallRecord(f"CA{len(calls):08d}", arrival, duration))
+    return calls
+
+def load_calls(args) -> List[CallRecord]:
+    if args.logs:
+        lines = []
+        for pattern in args.logs:
+            for path in sorted(glob.glob(pattern)):
+                with open(path, errors="replace") as f:
+                    lines.extend(f)
+        calls = parse_call_logs(lines)
+        print(f"{len(calls)} calls from {len(args.logs)} log pattern(s)")
+        return calls
+    return synthetic_calls(args.synthetic_weeks, parse_opening_hours(args.hours), ZoneInfo(args.tz), args.seed)
+
+def build_planner(calls: List[CallRecord], args) -> WarmPoolPlanner:
+    tz = ZoneInfo(args.tz)
+    return WarmPoolPlanner(
+        model=ArrivalModel(tz, half_life_weeks=args.half_life_weeks).fit(calls),
+        opening_hours=parse_opening_hours(args.hours),
+        calls_per_replica=args.calls_per_replica,
+        cold_start_seconds=args.cold_start,
+        cold_start_cost=args.cold_start_cost,
+        target=args.target,
+        min_open_replicas=args.min_open_replicas,
+        open_lead_minutes=args.open_lead_minutes,
+        max_replicas=args.max_replicas,
+    )
+
+def cmd_plan(args) -> None:
+    calls = load_calls(args)
+    planner = build_planner(calls, args)
+    schedule = planner.recommend()
+    changes = schedule_changes(schedule)
+    print(f"mean call {planner.model.mean_duration:.0f}s, {args.calls_per_replica} call(s) per replica")
+    for day, day_changes in changes.items():
+        print(f"{day:<10} " + "  ".join(f"{at}->{replicas}" for at, replicas in day_changes))
+    warm_hours = sum(map(sum, schedule)) * SLOT_MINUTES / 60
+    print(f"scheduled warm GPU-hours per week: {warm_hours:.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "timezone": args.tz,
+                "slot_minutes": SLOT_MINUTES,
+                "calls_per_replica": args.calls_per_replica,
+                "changes": {day: dict(day_changes) for day, day_changes in changes.items()},
+                "schedule": {DAY_NAMES[d]: schedule[d] for d in range(7)},
+            }, f, indent=2)
+        print(f"wrote {args.json}")
+
+def cmd_simulate(args) -> None:
+    calls = load_calls(args)
+    if not calls:
+        raise SystemExit("no calls to replay")
+    tz = ZoneInfo(args.tz)
+    split = calls[-1].arrival - args.test_weeks * 7 * 86400
+    train = [call for call in calls if call.arrival < split]
+    test = [call for call in calls if call.arrival >= split]
+    if not train:
+        print("not enough history to hold weeks out; fitting on the replayed trace itself")
+        train = test
+    planner = build_planner(train, args)
+    schedule = planner.recommend()
+    common = dict(tz=tz, calls_per_replica=args.calls_per_replica, cold_start_seconds=args.cold_start,
+                  cooldown_seconds=args.cooldown, max_replicas=args.max_replicas,
+                  mean_duration=planner.model.mean_duration)
+
+    results = [
+        simulate(test, f"static min={args.min_replicas} buffer={args.buffer}",
+                 lambda _: args.min_replicas, buffer=args.buffer, **common),
+        simulate(test, "planned", planner.floor_at(schedule), buffer=0, **common),
+    ]
+    print(f"replaying {len(test)} calls over {results[0].days:.1f} days "
+          f"(fitted on {len(train)} calls), cold start {args.cold_start:.0f}s")
+    print(f"{'policy':<26} {'cold hits':>10} {'hit rate':>9} {'rejected':>9} {'GPU-h':>8} {'GPU-h/day':>10}")
+    for r in results:
+        print(f"{r.name:<26} {r.cold_hits:>10} {r.cold_hits / max(r.calls, 1):>8.1%} {r.rejected:>9} "
+              f"{r.gpu_seconds / 3600:>8.1f} {r.gpu_seconds / 3600 / max(r.days, 1e-9):>10.1f}")
+
+    print("\nhour   " + "".join(f"{r.name[:22]:>30}" for r in results))
+    print("       " + "".join(f"{'idle GPU-h':>14}{'cold hits':>16}" for _ in results))
+    for hour in range(24):
+        print(f"{hour:02d}:00  " + "".join(
+            f"{r.hourly_idle_seconds[hour] / 3600:>14.1f}{r.hourly_hits[hour]:>16}" for r in results))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["plan", "simulate"])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--logs", nargs="+", help="log files (globs) with main.py's call lines")
+    source.add_argument("--synthetic-weeks", type=int, default=6, help="generate a trace instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tz", default=os.getenv("RESTAURANT_TIMEZONE", "UTC"))
+    parser.add_argument("--hours", default=os.getenv("RESTAURANT_HOURS", "Monday through Sunday, 11 AM to 10 PM"))
+    parser.add_argument("--half-life-weeks", type=float, default=4.0)
+    parser.add_argument("--calls-per-replica", type=int, default=int(os.getenv("MAX_CONCURRENT_CALLS", "1")))
+    parser.add_argument("--cold-start", type=float, default=40.0, help="seconds")
+    parser.add_argument("--cold-start-cost", type=float, default=2.0, help="GPU-hours one cold-start hit is worth")
+    parser.add_argument("--target", type=float, default=0.05, help="acceptable chance a call finds no warm slot")
+    parser.add_argument("--min-open-replicas", type=int, default=1)
+    parser.add_argument("--open-lead-minutes", type=int, default=15)
+    parser.add_argument("--max-replicas", type=int, default=3)
+    parser.add_argument("--json", help="plan: write the schedule here")
+    # The current static config (cerebrium.toml [cerebrium.scaling]) for comparison
+    parser.add_argument("--min-replicas", type=int, default=1)
+    parser.add_argument("--buffer", type=int, default=1, help="scaling_buffer")
+    parser.add_argument("--cooldown", type=float, default=60.0)
+    parser.add_argument("--test-weeks", type=int, default=1, help="simulate: weeks held out for the replay")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        cmd_plan(args)
+    else:
+        cmd_simulate(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Drain state machine for scale-down.
+
+When the platform sends SIGTERM the replica moves through:
+
+    serving -> draining -> drained
+
+While draining it admits no new calls and /ready fails, so the platform
+stops routing to it, but calls already in progress carry on. If they are
+still going when the deadline passes, each call is asked to hang up (the
+websocket endpoint plays the cached goodbye before closing). Once no calls
+are left the replica is drained and the normal shutdown can proceed.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+
+SERVING = "serving"
+DRAINING = "draining"
+DRAINED = "drained"
+
+class DrainController:
+    """Tracks live calls and walks the replica from serving to drained"""
+
+    def __init__(self, timeout_seconds: float, hangup_grace_seconds: float = 15.0):
+        self.timeout_seconds = timeout_seconds
+        self.hangup_grace_seconds = hangup_grace_seconds
+        self.state = SERVING
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.calls_at_start = 0
+        self.forced_hangups = 0
+        self._hangups: Dict[str, asyncio.Event] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def draining(self) -> bool:
+        return self.state != SERVING
+
+    def register(self, call_id: str) -> asyncio.Event:
+        """Track a live call; the returned event is set when it should hang up"""
+        hangup = asyncio.Event()
+        self._hangups[call_id] = hangup
+        self._idle.clear()
+        return hangup
+
+    def unregister(self, call_id: str) -> None:
+        self._hangups.pop(call_id, None)
+        if not self._hangups:
+            self._idle.set()
+
+    def begin(self) -> bool:
+        """Stop taking calls; False if a drain is already under way"""
+        if self.draining:
+            return False
+        self.state = DRAINING
+        self.started_at = time.monotonic()
+        self.calls_at_start = len(self._hangups)
+        logger.info(f"Draining: {self.calls_at_start} call(s) in progress, deadline {self.timeout_seconds:.0f}s")
+        return True
+
+    async def run(self) -> None:
+        """Wait for calls to finish, hang up the rest at the deadline"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.forced_hangups = len(self._hangups)
+            logger.warning(f"Drain deadline reached, hanging up {self.forced_hangups} call(s)")
+            for hangup in self._hangups.values():
+                hangup.set()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=self.hangup_grace_seconds)
+            except asyncio.TimeoutError:
+                logger.error(f"{len(self._hangups)} call(s) still open after hang-up")
+
+        self.state = DRAINED
+        self.finished_at = time.monotonic()
+        logger.info(f"Drained in {self.finished_at - self.started_at:.1f}s "
+                    f"({self.calls_at_start - self.forced_hangups} finished, {self.forced_hangups} hung up)")
+
+    def stats(self) -> dict:
+        stats = {"state": self.state, "active_calls": len(self._hangups)}
+        if self.started_at is not None:
+            end = self.finished_at or time.monotonic()
+            stats.update({
+                "elapsed_seconds": round(end - self.started_at, 1),
+                "deadline_in_seconds": max(0.0, round(self.started_at + self.timeout_seconds - end, 1)),
+                "calls_at_start": self.calls_at_start,
+                "forced_hangups": self.forced_hangups,
+            })
+        return stats
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Cartesia TTS websocket.
+
+Speaks enough of the Cartesia streaming protocol (context_id multiplexing,
+chunk/done messages, cancel) to exercise tts_pool.py offline:
+
+    python fake_tts_server.py --port 9100                 # serve
+    python fake_tts_server.py --check --calls 16          # serve + drive the manager
+
+Point the agent at it with CARTESIA_WS_URL=ws://127.0.0.1:9100/tts/websocket.
+``--drop-every N`` closes each connection after N requests so reconnects
+and retries can be observed.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import struct
+import time
+
+import websockets
+
+CHUNK_MS = 20
+
+def tone(sample_rate: int, milliseconds: int, phase: int = 0) -> bytes:
+    samples = sample_rate * milliseconds // 1000
+    return struct.pack(
+        f"<{samples}h",
+        *(int(8000 * math.sin(2 * math.pi * 220 * (phase + i) / sample_rate)) for i in range(samples))
+    )
+
+class FakeCartesiaServer:
+    def __init__(self, first_byte_ms: float, realtime_factor: float, drop_every: int):
+        self.first_byte_ms = first_byte_ms
+        self.realtime_factor = realtime_factor
+        self.drop_every = drop_every
+        self.connections = 0
+        self.requests = 0
+
+    async def handler(self, ws, *args):
+        self.connections += 1
+        cancelled = set()
+        tasks = set()
+        served = 0
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                context_id = message.get("context_id")
+                if message.get("cancel"):
+                    cancelled.add(context_id)
+                    continue
+                self.requests += 1
+                served += 1
+                task = asyncio.create_task(self._speak(ws, message, cancelled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if self.drop_every and served >= self.drop_every:
+                    await asyncio.sleep(self.first_byte_ms / 2000)
+                    await ws.close()
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _speak(self, ws, message: dict, cancelled: set):
+        context_id = message["context_id"]
+        sample_rate = message["output_format"]["sample_rate"]
+        # Roughly 15 characters per second of speech
+        duration_ms = max(CHUNK_MS, int(len(message["transcript"]) / 15 * 1000))
+        await asyncio.sleep(self.first_byte_ms / 1000)
+        for offset in range(0, duration_ms, CHUNK_MS):
+            if context_id in cancelled:
+                return
+            chunk = tone(sample_rate, CHUNK_MS, offset * sample_rate // 1000)
+            await ws.send(json.dumps({
+                "type": "chunk",
+                "context_id": context_id,
+                "data": base64.b64encode(chunk).decode(),
+                "done": False,
+                "status_code": 206,
+            }))
+            await asyncio.sleep(CHUNK_MS / 1000 / self.realtime_factor)
+        await ws.send(json.dumps({"type": "done", "context_id": context_id, "done": True, "status_code": 206}))
+
+async def check(port: int, calls: int, utterances: int) -> None:
+    """Drive the shared connection manager with concurrent simulated calls"""
+    from tts_pool import CartesiaConnectionManager, TTSConnectionError
+
+    manager = CartesiaConnectionManager("fake-key", url=f"ws://127.0.0.1:{port}/tts/websocket")
+    setup_started = time.monotonic()
+    await manager.start()
+    print(f"manager warm in {(time.monotonic() - setup_started) * 1000:.1f} ms")
+
+    request = {
+        "transcript": "Thank you for calling, how can I help you today?",
+        "continue": False,
+        "model_id": "sonic-english",
+        "voice": {"mode": "id", "id": "fake"},
+        "output_format": {"container": "raw", "encoding": "pcm_s16le", "sample_rate": 16000},
+    }
+    failures = 0
+
+    async def call(index: int):
+        nonlocal failures
+        for _ in range(utterances):
+            for attempt in range(2):
+                try:
+                    context = await manager.open_context(request)
+                    while True:
+                        message = await context.queue.get()
+                        if message["type"] == "disconnected":
+                            raise TTSConnectionError(message["error"])
+                        if message["type"] in ("done", "error"):
+                            break
+                    manager.record_ttfb(context.time_to_first_byte)
+                    break
+                except TTSConnectionError:
+                    manager.retries += 1
+                    if attempt == 1:
+                        failures += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    print(f"{calls} calls x {utterances} utterances in {time.monotonic() - started:.2f}s, failures={failures}")
+    print(json.dumps(manager.stats(), indent=2))
+    await manager.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--first-byte-ms", type=float, default=80.0)
+    parser.add_argument("--realtime-factor", type=float, default=4.0, help="how much faster than real time audio is streamed")
+    parser.add_argument("--drop-every", type=int, default=0)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--calls", type=int, default=16)
+    parser.add_argument("--utterances", type=int, default=5)
+    args = parser.parse_args()
+
+    server = FakeCartesiaServer(args.first_byte_ms, args.realtime_factor, args.drop_every)
+    async with websockets.serve(server.handler, "127.0.0.1", args.port):
+        if args.check:
+            await check(args.port, args.calls, args.utterances)
+            print(f"server saw {server.connections} connections, {server.requests} requests")
+        else:
+            print(f"Fake Cartesia listening on ws://127.0.0.1:{args.port}/tts/websocket")
+            await asyncio.Future()
+
+if __name__ == "__main__":
+    asyncio.run(main())
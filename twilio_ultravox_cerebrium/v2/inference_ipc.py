@@ -0,0 +1,408 @@
+"""
+Inference over a local socket and shared memory.
+
+One process owns the GPU: it loads Ultravox and runs the InferenceScheduler
+(inference_server.py, under serve.py or as a standalone daemon). Web
+workers do the websocket, VAD and codec work and send each caller turn to
+it. RemoteInferenceScheduler has the scheduler's submit/cancel/stats
+interface and hands back ordinary TurnRequests, so the turn processor
+cannot tell the model lives in another process; turns from every worker
+still land in the same batches.
+
+Control messages go over a Unix socket: an 8-byte prefix (header and body
+lengths, big-endian), a JSON header and an optional binary body. Audio and
+tokens go through a pair of shm_ring rings per worker, created by the
+worker and mapped by the daemon during the hello handshake:
+
+    worker -> owner   {"op": "hello", "audio_ring", "token_ring"}
+                      {"op": "submit", "id", "messages", "sample_rate", "temperature", "max_tokens"}
+                          audio is already in the audio ring, or inline as the body
+                      {"op": "cancel", "id"}
+                      {"op": "stats"}
+    owner -> worker   {"op": "hello", "shm"}
+                      {"op": "tokens"}    doorbell: read the token ring
+                      {"id", "token", "wait"} / {"id", "done": true, "error"}
+                          inline, only while the token ring is full
+                      {"op": "stats", "stats"}
+
+Token records carry the queue wait on a turn's first token. One doorbell
+covers every token written in the same event loop pass, so a batch step
+costs one socket write per worker instead of one per turn.
+
+If the daemon restarts, workers fail the turns in flight and reconnect with
+backoff; a web worker restarting does not touch the loaded model.
+"""
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from inference_scheduler import InferenceScheduler, TurnRequest
+from shm_ring import ShmRing
+
+_PREFIX = struct.Struct(">II")
+
+# Ring record kinds
+AUDIO, TOKEN, DONE, ERROR = 1, 2, 3, 4
+
+def encode_message(header: dict, body=b"") -> bytes:
+    data = json.dumps(header, separators=(",", ":")).encode()
+    return _PREFIX.pack(len(data), len(body)) + data + bytes(body)
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    header_size, body_size = _PREFIX.unpack(await reader.readexactly(_PREFIX.size))
+    header = json.loads(await reader.readexactly(header_size))
+    body = await reader.readexactly(body_size) if body_size else b""
+    return header, body
+
+def default_shm_dir() -> str:
+    return os.getenv("INFERENCE_SHM_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+class _WorkerLink:
+    """Daemon side of one worker connection"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.audio_ring: Optional[ShmRing] = None
+        self.token_ring: Optional[ShmRing] = None
+        self.requests: Dict[int, TurnRequest] = {}
+        self.relays: set = set()
+        # Audio records read from the ring ahead of their submit message
+        self.audio: Dict[int, np.ndarray] = {}
+        self._doorbell_pending = False
+
+    def attach(self, audio_path: str, token_path: str) -> bool:
+        try:
+            self.audio_ring = ShmRing(audio_path)
+            self.token_ring = ShmRing(token_path)
+        except OSError as e:
+            logger.warning(f"Worker rings not mapped, falling back to the socket: {e}")
+            self.audio_ring = self.token_ring = None
+            return False
+        return True
+
+    def take_audio(self, request_id: int) -> Optional[np.ndarray]:
+        for kind, record_id, _, payload in self.audio_ring.read():
+            if kind == AUDIO:
+                self.audio[record_id] = np.frombuffer(payload, dtype=np.float32).copy()
+        self.audio_ring.release()
+        return self.audio.pop(request_id, None)
+
+    def send(self, header: dict) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(encode_message(header))
+
+    def emit(self, kind: int, request_id: int, text: str = "", wait: Optional[float] = None) -> None:
+        """Queue a token or end-of-turn for the worker, through the ring when there is room"""
+        value = -1.0 if wait is None else wait
+        if self.token_ring is not None and self.token_ring.write(kind, request_id, text.encode(), value):
+            if not self._doorbell_pending:
+                self._doorbell_pending = True
+                asyncio.get_running_loop().call_soon(self.ring_doorbell)
+            return
+        # Ring full: whatever is already in it must reach the worker first
+        self.ring_doorbell()
+        if kind == TOKEN:
+            self.send({"id": request_id, "token": text, "wait": wait})
+        else:
+            self.send({"id": request_id, "done": True, "error": text if kind == ERROR else None})
+
+    def ring_doorbell(self) -> None:
+        if self._doorbell_pending:
+            self._doorbell_pending = False
+            self.send({"op": "tokens"})
+
+    def close(self) -> None:
+        for ring in (self.audio_ring, self.token_ring):
+            if ring is not None:
+                ring.close()
+        self.audio_ring = self.token_ring = None
+
+class InferenceServer:
+    """Serves a local InferenceScheduler to worker processes"""
+
+    def __init__(self, scheduler: InferenceScheduler, socket_path: str):
+        self.scheduler = scheduler
+        self.socket_path = socket_path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._links: set = set()
+
+    @property
+    def clients(self) -> int:
+        return len(self._links)
+
+    @property
+    def turns_in_flight(self) -> int:
+        return sum(len(link.requests) for link in self._links)
+
+    async def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.scheduler.start()
+        self._server = await asyncio.start_unix_server(self._serve_client, path=self.socket_path)
+        logger.info(f"Inference server listening on {self.socket_path}")
+
+    async def wait_for_workers(self, timeout: float, turns_only: bool = False) -> None:
+        """Wait until every worker has disconnected (they leave once drained),
+        or with ``turns_only`` just until no turn is in flight"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and (self.turns_in_flight if turns_only else self.clients):
+            await asyncio.sleep(0.5)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for link in list(self._links):
+            link.writer.close()
+        await self.scheduler.stop()
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        link = _WorkerLink(writer)
+        self._links.add(link)
+        try:
+            while True:
+                header, body = await read_message(reader)
+                op = header.get("op")
+                if op == "submit":
+                    if body:
+                        audio = np.frombuffer(body, dtype=np.float32).copy()
+                    else:
+                        audio = link.take_audio(header["id"]) if header.get("audio") == "shm" else None
+                    request = self.scheduler.submit(
+                        header["messages"], audio=audio, sample_rate=header["sample_rate"],
+                        temperature=header["temperature"], max_tokens=header["max_tokens"],
+                    )
+                    link.requests[header["id"]] = request
+                    relay = asyncio.create_task(self._relay(link, header["id"], request))
+                    link.relays.add(relay)
+                    relay.add_done_callback(link.relays.discard)
+                elif op == "cancel":
+                    request = link.requests.get(header["id"])
+                    if request is not None:
+                        self.scheduler.cancel(request)
+                elif op == "hello":
+                    shm = link.attach(header["audio_ring"], header["token_ring"])
+                    link.send({"op": "hello", "shm": shm})
+                elif op == "stats":
+                    link.send({"op": "stats", "stats": self.scheduler.stats()})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._links.discard(link)
+            # The worker went away; its turns have nobody to stream to
+            for request in link.requests.values():
+                self.scheduler.cancel(request)
+            for relay in list(link.relays):
+                relay.cancel()
+            link.close()
+            writer.close()
+
+    async def _relay(self, link: _WorkerLink, request_id: int, request: TurnRequest) -> None:
+        error = None
+        first = True
+        try:
+            async for token in request.tokens():
+                link.emit(TOKEN, request_id, token, request.queue_wait if first else None)
+                first = False
+                await link.writer.drain()
+        except Exception as e:
+            error = str(e)
+        finally:
+            link.requests.pop(request_id, None)
+        if not link.writer.is_closing():
+            link.emit(ERROR if error else DONE, request_id, error or "")
+
+class RemoteInferenceScheduler:
+    """InferenceScheduler stand-in that forwards turns to the model-owner process"""
+
+    def __init__(self, socket_path: str, stats_interval: float = 1.0, shared_memory: bool = True,
+                 audio_ring_bytes: int = 8 * 1024 * 1024, token_ring_bytes: int = 1024 * 1024,
+                 max_backoff: float = 5.0):
+        self.socket_path = socket_path
+        self.stats_interval = stats_interval
+        self.shared_memory = shared_memory
+        self.audio_ring_bytes = audio_ring_bytes
+        self.token_ring_bytes = token_ring_bytes
+        self.max_backoff = max_backoff
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._audio_ring: Optional[ShmRing] = None
+        self._token_ring: Optional[ShmRing] = None
+        self._requests: Dict[int, TurnRequest] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stats: dict = {}
+        self._stopping = False
+        self.requests = 0
+        self.reconnects = 0
+        self.inline_audio = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self, timeout: Optional[float] = None) -> None:
+        """Connect to the model owner, retrying until it is up (it may still be loading)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                await self._open()
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if deadline is not None and time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.5)
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._poll_stats())]
+
+    async def _open(self) -> None:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        if not self.shared_memory:
+            self._reader, self._writer = reader, writer
+            logger.info(f"Connected to inference server at {self.socket_path} (socket only)")
+            return
+        prefix = os.path.join(default_shm_dir(), f"voice-agent-{os.getpid()}-{self.reconnects}")
+        audio_ring = ShmRing(prefix + "-audio", self.audio_ring_bytes)
+        token_ring = ShmRing(prefix + "-tokens", self.token_ring_bytes)
+        try:
+            writer.write(encode_message({"op": "hello", "audio_ring": audio_ring.path, "token_ring": token_ring.path}))
+            header, _ = await read_message(reader)
+        except Exception:
+            writer.close()
+            audio_ring.close()
+            token_ring.close()
+            raise
+        finally:
+            # Both sides have mapped them (or never will); the names are no longer needed
+            audio_ring.unlink()
+            token_ring.unlink()
+        if header.get("shm"):
+            self._audio_ring, self._token_ring = audio_ring, token_ring
+        else:
+            audio_ring.close()
+            token_ring.close()
+            self._audio_ring = self._token_ring = None
+        self._reader, self._writer = reader, writer
+        logger.info(f"Connected to inference server at {self.socket_path} "
+                    f"({'shared memory' if self._audio_ring else 'socket only'})")
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+        self._fail_outstanding(RuntimeError("Inference client stopped"))
+
+    def submit(self, messages: List[dict], audio=None, sample_rate: int = 16000,
+               temperature: float = 0.7, max_tokens: int = 200) -> TurnRequest:
+        """Send a turn to the model owner; iterate ``request.tokens()`` for the reply"""
+        request = TurnRequest(messages, audio, sample_rate, temperature, max_tokens)
+        self.requests += 1
+        if not self.connected:
+            request.finish(ConnectionError("Inference server not connected"))
+            return request
+        header = {
+            "op": "submit", "id": request.id, "messages": messages, "sample_rate": sample_rate,
+            "temperature": temperature, "max_tokens": max_tokens,
+        }
+        body = b""
+        if audio is not None:
+            samples = np.ascontiguousarray(audio, dtype=np.float32)
+            if self._audio_ring is not None and self._audio_ring.write(AUDIO, request.id, samples):
+                header["audio"] = "shm"
+            else:
+                body = memoryview(samples).cast("B")
+                self.inline_audio += 1
+        self._requests[request.id] = request
+        self._writer.write(encode_message(header, body))
+        return request
+
+    def cancel(self, request: TurnRequest) -> None:
+        """Stop generating for a turn; the owner still sends its end-of-turn"""
+        if request.cancelled:
+            return
+        request.cancelled = True
+        if self.connected and request.id in self._requests:
+            self._writer.write(encode_message({"op": "cancel", "id": request.id}))
+
+    def stats(self) -> dict:
+        return dict(self._stats, remote=self.socket_path, connected=self.connected,
+                    shared_memory=self._audio_ring is not None, outstanding=len(self._requests),
+                    reconnects=self.reconnects, inline_audio=self.inline_audio)
+
+    def _fail_outstanding(self, error: Exception) -> None:
+        for request in self._requests.values():
+            request.finish(error)
+        self._requests.clear()
+
+    def _deliver(self, kind: int, request_id: int, text: str, wait: Optional[float]) -> None:
+        request = self._requests.get(request_id)
+        if request is None:
+            return
+        if kind == TOKEN:
+            if wait is not None:
+                request.started_at = request.enqueued_at + wait
+            request.push(text)
+        else:
+            del self._requests[request_id]
+            request.finish(RuntimeError(text) if kind == ERROR else None)
+
+    def _drain_token_ring(self) -> None:
+        for kind, request_id, value, payload in self._token_ring.read():
+            self._deliver(kind, request_id, bytes(payload).decode(), value if value >= 0 else None)
+        self._token_ring.release()
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                header, _ = await read_message(self._reader)
+                op = header.get("op")
+                if op == "tokens":
+                    self._drain_token_ring()
+                elif op == "stats":
+                    self._stats = header["stats"]
+                elif "token" in header:
+                    self._deliver(TOKEN, header["id"], header["token"], header.get("wait"))
+                elif header.get("done"):
+                    error = header.get("error")
+                    self._deliver(ERROR if error else DONE, header["id"], error or "", None)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.error(f"Lost connection to inference server: {e!r}")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+            self._fail_outstanding(ConnectionError("Inference server connection lost"))
+            for ring in (self._audio_ring, self._token_ring):
+                if ring is not None:
+                    ring.close()
+            self._audio_ring = self._token_ring = None
+        if not self._stopping:
+            asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 0.1
+        while not self._stopping:
+            await asyncio.sleep(delay)
+            try:
+                self.reconnects += 1
+                await self._open()
+            except (OSError, asyncio.IncompleteReadError) as e:
+                # Includes a server that accepts and then drops the hello while restarting
+                delay = min(delay * 2, self.max_backoff)
+                logger.warning(f"Inference server unavailable ({e!r}), retrying in {delay:.1f}s")
+                continue
+            self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._poll_stats())]
+            return
+
+    async def _poll_stats(self) -> None:
+        while self.connected:
+            self._writer.write(encode_message({"op": "stats"}))
+            await asyncio.sleep(self.stats_interval)
@@ -0,0 +1,371 @@
+"""
+Cross-call micro-batching in front of the shared Ultravox model.
+
+Every call's pipeline submits its turns here instead of driving the model
+directly. The scheduler collects turns that arrive within ``max_wait_ms`` of
+each other (up to ``max_batch_size``), orders them shortest-first so quick
+replies are not stuck behind long monologues, and runs them as one batch.
+Tokens are streamed back to each call as soon as the backend produces them.
+
+Backends only need ``generate_batch``: the real one feeds the vLLM engine
+inside pipecat's UltravoxModel, the tiny stand-in lets the scheduler be
+benchmarked on a CPU-only box (see bench_scheduler.py). A batch holds one of
+``max_concurrent_batches`` slots while it runs. Backends that batch
+continuously (vLLM) give the slot back once every turn in the batch has
+streamed its first token, so new turns join the engine's running batch
+instead of waiting for the slowest reply.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from prefix_cache import KV_BYTES_PER_TOKEN, PrefixKVCache, estimate_tokens, split_prompt_prefix
+
+_DONE = object()
+
+class TurnRequest:
+    """One model turn for one call"""
+
+    _ids = itertools.count()
+
+    def __init__(self, messages: List[dict], audio, sample_rate: int, temperature: float, max_tokens: int):
+        self.id = next(self._ids)
+        self.messages = messages
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+        self.finished = False
+        # Set by the first token or by finish, whichever comes first
+        self.first_token = asyncio.Event()
+        self._tokens: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def audio_seconds(self) -> float:
+        if self.audio is None:
+            return 0.0
+        return len(self.audio) / self.sample_rate
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return self.started_at - self.enqueued_at
+
+    def push(self, token: str) -> None:
+        self.first_token.set()
+        if not self.cancelled:
+            self._tokens.put_nowait(token)
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        self.first_token.set()
+        self._tokens.put_nowait(error if error is not None else _DONE)
+
+    async def tokens(self) -> AsyncIterator[str]:
+        """Stream generated text back to the call"""
+        while True:
+            item = await self._tokens.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+class InferenceBackend:
+    """Runs a batch of turns; must call ``push``/``finish`` on every request"""
+
+    prefix_cache: Optional[PrefixKVCache] = None
+    # The backend admits new turns into a batch that is already decoding
+    continuous_batching = False
+
+    async def generate_batch(self, batch: List[TurnRequest]) -> None:
+        raise NotImplementedError
+
+    def prefix_cache_stats(self) -> Optional[dict]:
+        return self.prefix_cache.stats() if self.prefix_cache is not None else None
+
+class InferenceScheduler:
+    """Dynamic batching with a bounded wait window and shortest-turn-first ordering"""
+
+    def __init__(
+        self,
+        backend: InferenceBackend,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 15.0,
+        max_concurrent_batches: int = 2,
+        starvation_ms: float = 500.0,
+    ):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.starvation = starvation_ms / 1000.0
+        self._pending: List[TurnRequest] = []
+        self._has_work = asyncio.Event()
+        self._batch_slots = asyncio.Semaphore(max_concurrent_batches)
+        self._loop_task: Optional[asyncio.Task] = None
+        # Running batch task -> its turns, so stop() can finish them
+        self._running: Dict[asyncio.Task, List[TurnRequest]] = {}
+        self._stopping = False
+
+        self.requests = 0
+        self.batches = 0
+        self._queue_waits: Deque[float] = deque(maxlen=1000)
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._schedule_loop())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._has_work.set()
+        for task in [self._loop_task, *self._running]:
+            if task is not None:
+                task.cancel()
+        # A cancelled batch (or one cancelled before it ran) never finishes its
+        # turns, and their consumers would wait on tokens() forever
+        stopped = [*self._pending, *(r for batch in self._running.values() for r in batch)]
+        for request in stopped:
+            request.finish(RuntimeError("Inference scheduler stopped"))
+        self._pending.clear()
+        self._loop_task = None
+
+    def submit(self, messages: List[dict], audio=None, sample_rate: int = 16000,
+               temperature: float = 0.7, max_tokens: int = 200) -> TurnRequest:
+        """Queue a turn; iterate ``request.tokens()`` for the reply"""
+        self.start()
+        request = TurnRequest(messages, audio, sample_rate, temperature, max_tokens)
+        self._pending.append(request)
+        self.requests += 1
+        self._has_work.set()
+        return request
+
+    def cancel(self, request: TurnRequest) -> None:
+        """Stop generating for a turn (e.g. the caller interrupted)"""
+        if request.cancelled:
+            return
+        request.cancelled = True
+        if request in self._pending:
+            self._pending.remove(request)
+            request.finish()
+
+    def _select_batch(self) -> List[TurnRequest]:
+        now = time.monotonic()
+        # Shortest turn first, but never let a long turn wait past the starvation limit
+        self._pending.sort(key=lambda r: (now - r.enqueued_at < self.starvation, r.audio_seconds, r.id))
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        return batch
+
+    async def _schedule_loop(self) -> None:
+        while not self._stopping:
+            await self._has_work.wait()
+            if not self._pending:
+                self._has_work.clear()
+                continue
+
+            # Hold the window open for more turns, measured from the oldest waiting turn
+            deadline = min(r.enqueued_at for r in self._pending) + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._has_work.clear()
+                try:
+                    await asyncio.wait_for(self._has_work.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            await self._batch_slots.acquire()
+            batch = self._select_batch()
+            if not self._pending:
+                self._has_work.clear()
+            if not batch:
+                self._batch_slots.release()
+                continue
+
+            task = asyncio.create_task(self._execute(batch))
+            self._running[task] = batch
+            task.add_done_callback(lambda done: self._running.pop(done, None))
+
+    async def _execute(self, batch: List[TurnRequest]) -> None:
+        started = time.monotonic()
+        for request in batch:
+            request.started_at = started
+            self._queue_waits.append(started - request.enqueued_at)
+        self.batches += 1
+        generation = asyncio.ensure_future(self.backend.generate_batch(batch))
+        holding_slot = True
+        try:
+            if self.backend.continuous_batching:
+                # Prefill is done once every turn streams; decoding carries on
+                # in the engine alongside whatever batch takes the slot next
+                first_tokens = asyncio.gather(*(r.first_token.wait() for r in batch))
+                await asyncio.wait({generation, first_tokens}, return_when=asyncio.FIRST_COMPLETED)
+                first_tokens.cancel()
+                self._batch_slots.release()
+                holding_slot = False
+            await generation
+        except Exception as e:
+            logger.error(f"Inference batch of {len(batch)} failed: {e}")
+            for request in batch:
+                request.finish(e)
+        finally:
+            if not generation.done():
+                generation.cancel()
+            if holding_slot:
+                self._batch_slots.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._queue_waits)
+        return {
+            "pending": len(self._pending),
+            "running_batches": len(self._running),
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queue_wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+            "queue_wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+            "prefix_cache": self.backend.prefix_cache_stats(),
+        }
+
+def _chunk_text(chunk) -> str:
+    """UltravoxModel.generate yields OpenAI-style JSON chunks; accept plain text too"""
+    if not isinstance(chunk, str):
+        return ""
+    try:
+        data = json.loads(chunk)
+    except ValueError:
+        return chunk
+    if isinstance(data, dict):
+        choices = data.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
+    return chunk
+
+class UltravoxModelBackend(InferenceBackend):
+    """Runs a batch on the shared pipecat UltravoxModel
+
+    All turns in the batch are started together so the vLLM engine behind
+    the model schedules them into the same forward passes. The engine keeps
+    batching continuously, so later batches join those passes as soon as
+    this one is past prefill.
+    """
+
+    continuous_batching = True
+
+    def __init__(self, model):
+        self._model = model
+
+    def prefix_cache_stats(self) -> Optional[dict]:
+        # The engine owns the prefix KV blocks; PrefixCachingUltravoxModel counts its cached tokens
+        stats = getattr(self._model, "prefix_cache_stats", None)
+        return stats() if stats is not None else None
+
+    async def _generate_one(self, request: TurnRequest) -> None:
+        try:
+            generator = self._model.generate(
+                messages=request.messages,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens,
+                audio=request.audio,
+            )
+            try:
+                async for chunk in generator:
+                    if request.cancelled:
+                        break
+                    text = _chunk_text(chunk)
+                    if text:
+                        request.push(text)
+            finally:
+                # Closing the generator aborts the request inside the engine
+                await generator.aclose()
+            request.finish()
+        except Exception as e:
+            request.finish(e)
+
+    async def generate_batch(self, batch: List[TurnRequest]) -> None:
+        await asyncio.gather(*(self._generate_one(r) for r in batch))
+
+class TinyStandInModel(InferenceBackend):
+    """CPU stand-in that behaves like a memory-bound decoder
+
+    A decode step costs ``step_ms`` plus a little per sequence in the batch,
+    which is why batching pays off on a GPU. Prefill costs grow with the
+    amount of audio in the turn. Replies are drawn from a small vocabulary.
+    """
+
+    VOCAB = (
+        "sure", "we", "have", "a", "table", "for", "two", "at", "seven", "thirty",
+        "tonight", "what", "name", "should", "I", "put", "it", "under", "thanks", "great",
+    )
+
+    def __init__(self, step_ms: float = 20.0, per_sequence_ms: float = 1.0,
+                 prefill_ms_per_audio_second: float = 15.0, prefill_ms_per_prompt_token: float = 0.1,
+                 reply_tokens: tuple = (15, 40), seed: int = 0,
+                 prefix_cache: Optional[PrefixKVCache] = None):
+        self.step = step_ms / 1000.0
+        self.per_sequence = per_sequence_ms / 1000.0
+        self.prefill_per_second = prefill_ms_per_audio_second / 1000.0
+        self.prefill_per_token = prefill_ms_per_prompt_token / 1000.0
+        self.prefix_cache = prefix_cache
+        self.reply_tokens = reply_tokens
+        self._random = random.Random(seed)
+        # Batches that run at the same time still share one simulated device
+        self._device = asyncio.Lock()
+
+    async def prefill(self, batch: List[TurnRequest]) -> None:
+        prompt_tokens = 0
+        for request in batch:
+            prefix, rest = split_prompt_prefix(request.messages)
+            prompt_tokens += sum(estimate_tokens(m["content"]) for m in rest)
+            if not prefix:
+                continue
+            prefix_tokens = estimate_tokens(prefix)
+            if self.prefix_cache is None:
+                prompt_tokens += prefix_tokens
+            elif self.prefix_cache.lookup(prefix) is None:
+                started = time.monotonic()
+                async with self._device:
+                    await asyncio.sleep(prefix_tokens * self.prefill_per_token)
+                self.prefix_cache.insert(
+                    prefix, None, prefix_tokens * KV_BYTES_PER_TOKEN, time.monotonic() - started
+                )
+
+        async with self._device:
+            await asyncio.sleep(
+                sum(r.audio_seconds for r in batch) * self.prefill_per_second
+                + prompt_tokens * self.prefill_per_token
+            )
+
+    async def generate_batch(self, batch: List[TurnRequest]) -> None:
+        await self.prefill(batch)
+        remaining = {
+            r.id: min(r.max_tokens, self._random.randint(*self.reply_tokens)) for r in batch
+        }
+        active = list(batch)
+        while active:
+            async with self._device:
+                await asyncio.sleep(self.step + self.per_sequence * len(active))
+            still_active = []
+            for request in active:
+                if request.cancelled:
+                    request.finish()
+                    continue
+                request.push(self._random.choice(self.VOCAB) + " ")
+                remaining[request.id] -= 1
+                if remaining[request.id] <= 0:
+                    request.finish()
+                else:
+                    still_active.append(request)
+            active = still_active
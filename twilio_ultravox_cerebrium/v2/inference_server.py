@@ -0,0 +1,69 @@
+"""
+Inference daemon: the process that owns the model.
+
+    python inference_server.py --socket /tmp/voice-agent/inference.sock
+    python inference_server.py --stub     # TinyStandInModel, CPU only
+
+Downloads, loads and warms the model (the same phases a single-process
+replica runs), then serves turns from web workers over the socket and
+shared-memory rings (see inference_ipc.py). serve.py starts it alongside
+the workers, or it can run on its own so the web workers can be restarted
+(or crash) without reloading weights: they reconnect with backoff and
+report unready meanwhile.
+
+The socket only appears once the model is warm. On SIGTERM it keeps
+serving until the workers have drained and disconnected, so a signal sent
+to the whole process group does not cut calls off mid-turn; SIGINT only
+waits for the turns in flight.
+"""
+import argparse
+import asyncio
+import os
+import signal
+
+from loguru import logger
+
+async def serve(socket_path: str, drain_timeout: float) -> None:
+    # bot reads VOICE_AGENT_STUBS at import, after --stub has set it
+    from bot import create_local_inference_scheduler, warm_up_model
+    from inference_ipc import InferenceServer
+    from startup import StartupTracker
+
+    stopping = asyncio.Event()
+    stop_signal = []
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda sig=sig: (stop_signal.append(sig), stopping.set()))
+
+    tracker = StartupTracker()
+    scheduler = await warm_up_model(tracker, create_local_inference_scheduler)
+    server = InferenceServer(scheduler, socket_path)
+    await server.start()
+    logger.info(f"Inference server ready: {tracker.stats()['phases']}")
+
+    await stopping.wait()
+    if stop_signal[0] == signal.SIGINT:
+        logger.info(f"Inference server stopping after {server.turns_in_flight} turn(s) in flight")
+        await server.wait_for_workers(drain_timeout, turns_only=True)
+    else:
+        logger.info(f"Inference server stopping, waiting for {server.clients} worker(s) to disconnect")
+        await server.wait_for_workers(drain_timeout)
+    await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET", "/tmp/voice-agent/inference.sock"))
+    parser.add_argument("--stub", action="store_true", help="serve TinyStandInModel instead of Ultravox")
+    args = parser.parse_args()
+
+    if args.stub:
+        stubs = {s for s in os.getenv("VOICE_AGENT_STUBS", "").split(",") if s}
+        os.environ["VOICE_AGENT_STUBS"] = ",".join(sorted(stubs | {"llm"}))
+    os.makedirs(os.path.dirname(args.socket) or ".", exist_ok=True)
+
+    # Workers get DRAIN_TIMEOUT_SECONDS plus the goodbye; give them a little longer
+    drain_timeout = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "120")) + 30
+    asyncio.run(serve(args.socket, drain_timeout))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+Synthetic Twilio media-stream load test for the /ws endpoint.
+
+Each simulated call does what Twilio does: posts the webhook (so admission
+control reserves a slot), opens the media websocket, sends ``connected`` and
+``start``, then streams 8 kHz mu-law audio as 20 ms ``media`` messages in
+real time - recorded speech for each caller turn, silence in between -
+and finally ``stop``.
+
+Per level it reports:
+  - turn latency: end of caller speech to the first agent audio frame
+  - dropped frames: gaps in the agent's outbound audio while it is speaking
+  - late frames: caller frames this client could not send on time
+  - loop lag: this process's event loop, and the server's as seen by a
+    /health probe (the probe is served by the same loop as the calls)
+  - memory: server RSS growth per concurrent call (local servers only)
+
+Run against a local replica with the CPU stand-ins (no GPU, no API keys):
+
+    python loadtest.py --spawn --audio caller.wav --sweep 1,2,4,8,16
+
+``--spawn`` starts ``uvicorn main:app`` with ``VOICE_AGENT_STUBS=all``; use
+``--spawn-real`` to keep the real model and TTS. The sweep stops at the
+first level that misses ``--slo-ms`` (p95 turn latency) or drops more than
+``--max-drop-rate`` of the agent's audio, and prints the last level that
+passed as the call ceiling for ``replica_concurrency``.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+import wave
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import aiohttp
+
+FRAME_SECONDS = 0.02
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+ULAW_SILENCE = b"\xff" * FRAME_BYTES
+# A gap this long between agent frames, mid-reply, is an underrun
+GAP_THRESHOLD = 0.06
+# This much quiet from the agent ends its reply
+REPLY_END_SECONDS = 0.8
+
+def _linear_to_ulaw(sample: int) -> int:
+    """G.711 mu-law, bit exact with audioop.lin2ulaw"""
+    value = sample >> 2
+    mask = 0xFF
+    if value < 0:
+        value, mask = -value, 0x7F
+    value = min(value, 8159) + 0x21
+    segment = max(0, value.bit_length() - 6)
+    if segment > 7:
+        return 0x7F ^ mask
+    return ((segment << 4) | ((value >> (segment + 1)) & 0x0F)) ^ mask
+
+def pcm16_to_ulaw(pcm: bytes) -> bytes:
+    samples = memoryview(pcm).cast("h")
+    return bytes(_linear_to_ulaw(s) for s in samples)
+
+def load_audio(path: str) -> bytes:
+    """Caller speech as 8 kHz mu-law: a .wav (16-bit PCM, 8 kHz, mono) or raw .ulaw"""
+    if not path.endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+    with wave.open(path, "rb") as w:
+        if w.getframerate() != 8000 or w.getnchannels() != 1 or w.getsampwidth() != 2:
+            raise SystemExit(f"{path}: need 16-bit mono 8 kHz WAV (or a raw .ulaw file)")
+        return pcm16_to_ulaw(w.readframes(w.getnframes()))
+
+def synthetic_speech(seconds: float = 1.5) -> bytes:
+    """Voiced buzz with syllable-rate envelope; Silero may not treat it as speech"""
+    rate = 8000
+    pcm = bytearray()
+    for i in range(int(seconds * rate)):
+        t = i / rate
+        envelope = 0.5 * (1 - math.cos(2 * math.pi * 4 * t))
+        value = sum(math.sin(2 * math.pi * 140 * h * t) / h for h in range(1, 8))
+        pcm += int(6000 * envelope * value).to_bytes(2, "little", signed=True)
+    return pcm16_to_ulaw(bytes(pcm))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+@dataclass
+class CallResult:
+    admitted: bool = False
+    completed: bool = False
+    error: Optional[str] = None
+    greeting_latency: Optional[float] = None
+    turn_latencies: List[float] = field(default_factory=list)
+    unanswered_turns: int = 0
+    agent_frames: int = 0
+    dropped_frames: int = 0
+    late_frames: int = 0
+    clears: int = 0
+
+class SimulatedCall:
+    """One Twilio call: webhook, handshake, real-time media, stop"""
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str, speech: bytes,
+                 turns: int, listen_seconds: float):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.speech = speech
+        self.turns = turns
+        self.listen_seconds = listen_seconds
+        self.call_sid = "CA" + uuid.uuid4().hex
+        self.stream_sid = "MZ" + uuid.uuid4().hex
+        self.result = CallResult()
+
+        self._started_at = 0.0
+        self._speech_ended_at: Optional[float] = None
+        self._last_agent_frame: Optional[float] = None
+        self._replying = False
+
+    async def run(self) -> CallResult:
+        try:
+            async with self.session.post(f"{self.base_url}/", data={"CallSid": self.call_sid}) as response:
+                twiml = await response.text()
+            if "<Stream" not in twiml:
+                return self.result
+            self.result.admitted = True
+
+            ws_url = self.base_url.replace("http", "ws", 1) + "/ws"
+            async with self.session.ws_connect(ws_url, max_msg_size=0) as ws:
+                await ws.send_str(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await ws.send_str(json.dumps({
+                    "event": "start",
+                    "sequenceNumber": "1",
+                    "start": {
+                        "accountSid": "AC" + "0" * 32,
+                        "streamSid": self.stream_sid,
+                        "callSid": self.call_sid,
+                        "tracks": ["inbound"],
+                        "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                        "customParameters": {},
+                    },
+                    "streamSid": self.stream_sid,
+                }))
+                self._started_at = time.monotonic()
+                receiver = asyncio.create_task(self._receive(ws))
+                try:
+                    await self._send(ws)
+                    self.result.completed = True
+                finally:
+                    receiver.cancel()
+        except Exception as e:
+            self.result.error = f"{type(e).__name__}: {e}"
+        return self.result
+
+    async def _send(self, ws) -> None:
+        sequence = 2
+        next_at = time.monotonic()
+
+        async def send_frame(payload: bytes) -> None:
+            nonlocal sequence, next_at
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > FRAME_SECONDS:
+                self.result.late_frames += 1
+            chunk = sequence - 1
+            await ws.send_str(json.dumps({
+                "event": "media",
+                "sequenceNumber": str(sequence),
+                "media": {
+                    "track": "inbound",
+                    "chunk": str(chunk),
+                    "timestamp": str(int(chunk * FRAME_SECONDS * 1000)),
+                    "payload": base64.b64encode(payload).decode(),
+                },
+                "streamSid": self.stream_sid,
+            }))
+            sequence += 1
+            next_at += FRAME_SECONDS
+
+        async def listen(max_seconds: float) -> None:
+            """Send silence until the agent has replied and gone quiet"""
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                await send_frame(ULAW_SILENCE)
+                if (self._last_agent_frame is not None and not self._replying
+                        and (self._speech_ended_at is None or self._last_agent_frame > self._speech_ended_at)):
+                    return
+
+        # Wait for the greeting before the caller speaks
+        await listen(self.listen_seconds)
+
+        for _ in range(self.turns):
+            for offset in range(0, len(self.speech), FRAME_BYTES):
+                await send_frame(self.speech[offset:offset + FRAME_BYTES].ljust(FRAME_BYTES, b"\xff"))
+            self._speech_ended_at = time.monotonic()
+            answered_before = len(self.result.turn_latencies)
+            await listen(self.listen_seconds)
+            if len(self.result.turn_latencies) == answered_before:
+                self.result.unanswered_turns += 1
+
+        await ws.send_str(json.dumps({"event": "stop", "streamSid": self.stream_sid}))
+
+    async def _receive(self, ws) -> None:
+        watchdog = asyncio.create_task(self._watch_reply_end())
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                event = json.loads(message.data)
+                kind = event.get("event")
+                if kind == "media":
+                    self._on_agent_frame(time.monotonic())
+                elif kind == "clear":
+                    self.result.clears += 1
+        finally:
+            watchdog.cancel()
+
+    def _on_agent_frame(self, now: float) -> None:
+        self.result.agent_frames += 1
+        if not self._replying:
+            self._replying = True
+            if self._speech_ended_at is None:
+                if self.result.greeting_latency is None:
+                    self.result.greeting_latency = now - self._started_at
+            elif self._last_agent_frame is None or self._last_agent_frame < self._speech_ended_at:
+                self.result.turn_latencies.append(now - self._speech_ended_at)
+        elif now - self._last_agent_frame > GAP_THRESHOLD:
+            self.result.dropped_frames += round((now - self._last_agent_frame) / FRAME_SECONDS) - 1
+        self._last_agent_frame = now
+
+    async def _watch_reply_end(self) -> None:
+        while True:
+            await asyncio.sleep(0.1)
+            if self._replying and time.monotonic() - self._last_agent_frame > REPLY_END_SECONDS:
+                self._replying = False
+
+class LoopLagMonitor:
+    """Oversleep of a 10 ms timer on this process's event loop"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.monotonic() - started - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+class ServerProbe:
+    """Samples /health latency (server loop lag) and server RSS while a level runs"""
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str, pid: Optional[int], interval: float = 0.25):
+        self.session = session
+        self.url = base_url.rstrip("/") + "/health"
+        self.pid = pid
+        self.interval = interval
+        self.latencies: List[float] = []
+        self.peak_rss: Optional[int] = None
+        self.peak_connections = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                async with self.session.get(self.url) as response:
+                    health = await response.json()
+                self.latencies.append(time.monotonic() - started)
+                self.peak_connections = max(self.peak_connections, health.get("active_connections", 0))
+            except Exception:
+                pass
+            rss = read_rss(self.pid)
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+def read_rss(pid: Optional[int]) -> Optional[int]:
+    """Resident set size in bytes (Linux)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+async def run_level(args, session: aiohttp.ClientSession, speech: bytes, calls: int, pid: Optional[int]) -> dict:
+    baseline_rss = read_rss(pid)
+    loop_lag = LoopLagMonitor()
+    probe = ServerProbe(session, args.url, pid)
+    loop_lag.start()
+    probe.start()
+
+    async def start_call(index: int) -> CallResult:
+        await asyncio.sleep(index * args.ramp / max(calls, 1) + random.uniform(0, FRAME_SECONDS))
+        return await SimulatedCall(session, args.url, speech, args.turns, args.listen).run()
+
+    try:
+        results = await asyncio.gather(*(start_call(i) for i in range(calls)))
+    finally:
+        loop_lag.stop()
+        probe.stop()
+
+    latencies = [lat for r in results for lat in r.turn_latencies]
+    greetings = [r.greeting_latency for r in results if r.greeting_latency is not None]
+    agent_frames = sum(r.agent_frames for r in results)
+    dropped = sum(r.dropped_frames for r in results)
+    errors = [r.error for r in results if r.error]
+    memory_per_call = None
+    if baseline_rss is not None and probe.peak_rss is not None and probe.peak_connections:
+        memory_per_call = (probe.peak_rss - baseline_rss) / probe.peak_connections
+
+    return {
+        "calls": calls,
+        "admitted": sum(r.admitted for r in results),
+        "completed": sum(r.completed for r in results),
+        "errors": errors,
+        "turns": len(latencies),
+        "unanswered": sum(r.unanswered_turns for r in results),
+        "greeting_p50": percentile(greetings, 0.5),
+        "turn_p50": percentile(latencies, 0.5),
+        "turn_p95": percentile(latencies, 0.95),
+        "turn_max": max(latencies) if latencies else None,
+        "drop_rate": dropped / (agent_frames + dropped) if agent_frames + dropped else 0.0,
+        "dropped_frames": dropped,
+        "late_frames": sum(r.late_frames for r in results),
+        "client_lag_max": max(loop_lag.samples) if loop_lag.samples else None,
+        "server_probe_p50": percentile(probe.latencies, 0.5),
+        "server_probe_p99": percentile(probe.latencies, 0.99),
+        "server_probe_max": max(probe.latencies) if probe.latencies else None,
+        "rss_per_call_mb": None if memory_per_call is None else memory_per_call / 1e6,
+    }
+
+def print_level(level: dict) -> None:
+    rss = "-" if level["rss_per_call_mb"] is None else f"{level['rss_per_call_mb']:.1f}"
+    print(
+        f"{level['calls']:>5} {level['admitted']:>8} {level['turns']:>5} {level['unanswered']:>5}"
+        f" {ms(level['greeting_p50']):>8} {ms(level['turn_p50']):>8} {ms(level['turn_p95']):>8} {ms(level['turn_max']):>8}"
+        f" {level['drop_rate'] * 100:>6.2f}% {level['late_frames']:>5}"
+        f" {ms(level['client_lag_max']):>7} {ms(level['server_probe_p99']):>9} {ms(level['server_probe_max']):>9} {rss:>8}"
+    )
+    for error in level["errors"][:3]:
+        print(f"      error: {error}")
+
+def spawn_server(args, max_calls: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    if not args.spawn_real:
+        env["VOICE_AGENT_STUBS"] = "all"
+    env.setdefault("CEREBRIUM_PROJECT_ID", "loadtest")
+    env["MAX_CONCURRENT_CALLS"] = str(max_calls)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    port = args.url.rsplit(":", 1)[-1].split("/")[0]
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", port],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+async def wait_until_ready(session: aiohttp.ClientSession, base_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(base_url.rstrip("/") + "/ready") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise SystemExit(f"Server at {base_url} was not ready after {timeout:.0f}s")
+
+async def main_async(args) -> None:
+    levels = [int(n) for n in args.sweep.split(",")] if args.sweep else [args.calls]
+    if args.audio:
+        speech = load_audio(args.audio)
+    else:
+        print("No --audio given, using synthetic speech (the VAD may not trigger on it)")
+        speech = synthetic_speech()
+
+    server = spawn_server(args, max(levels)) if args.spawn or args.spawn_real else None
+    pid = server.pid if server else args.server_pid
+    try:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_until_ready(session, args.url, args.ready_timeout)
+            print(f"{'calls':>5} {'admitted':>8} {'turns':>5} {'unans':>5} {'greet50':>8} {'turn50':>8} {'turn95':>8}"
+                  f" {'turnmax':>8} {'drops':>7} {'late':>5} {'lag_max':>7} {'srv_p99':>9} {'srv_max':>9} {'MB/call':>8}")
+            ceiling = None
+            for calls in levels:
+                level = await run_level(args, session, speech, calls, pid)
+                print_level(level)
+                ok = (
+                    level["admitted"] == calls
+                    and level["turn_p95"] is not None
+                    and level["turn_p95"] * 1000 <= args.slo_ms
+                    and level["drop_rate"] <= args.max_drop_rate
+                )
+                if not ok:
+                    break
+                ceiling = calls
+            if args.sweep:
+                print(f"\nCall ceiling (p95 turn <= {args.slo_ms:.0f}ms, drops <= {args.max_drop_rate:.1%}): {ceiling or 'none'}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="server base URL")
+    parser.add_argument("--calls", type=int, default=4, help="concurrent calls (single level)")
+    parser.add_argument("--sweep", help="comma separated concurrency levels, e.g. 1,2,4,8")
+    parser.add_argument("--turns", type=int, default=3, help="caller turns per call")
+    parser.add_argument("--audio", help="caller speech: 8 kHz mono 16-bit .wav or raw .ulaw")
+    parser.add_argument("--listen", type=float, default=8.0, help="max seconds to wait for each reply")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which calls start")
+    parser.add_argument("--slo-ms", type=float, default=1500.0, help="p95 turn latency budget")
+    parser.add_argument("--max-drop-rate", type=float, default=0.01, help="tolerated share of dropped agent frames")
+    parser.add_argument("--spawn", action="store_true", help="start a local server with stub services")
+    parser.add_argument("--spawn-real", action="store_true", help="start a local server with the real services")
+    parser.add_argument("--server-pid", type=int, help="pid of an already running local server, for memory")
+    parser.add_argument("--ready-timeout", type=float, default=600.0, help="seconds to wait for /ready")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,36 @@
+import time
+_import_started = time.monotonic()
+
 import json
 import os
 import asyncio
 import signal
+import sys
 from typing import Dict, Any, Optional
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from urllib.parse import parse_qs
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from loguru import logger
 from dotenv import load_dotenv
 
 # Import the bot logic
-from bot import create_voice_agent
+from bot import create_voice_agent, get_inference_stats, inference_available, warm_up_replica
+from admission import AdmissionController, BUSY_TWIML, hold_twiml, stream_twiml
+from tts_pool import get_tts_manager
+from startup import StartupTracker
+from metrics import REGISTRY, render_counter, render_gauge, render_metrics, snapshot as metrics_snapshot
+from shared_state import SharedAdmissionController, WorkerStatsBoard
+from twilio_protocol import TwilioMessageEncoder, parse_control
+from twilio_serializer import FastTwilioFrameSerializer
+from audio_cache import get_phrase_cache, play_to_twilio
+from drain import DrainController
+from call_recorder import CallRecording, get_recording_writer
+from watchdog import LoopWatchdog
+
+# Startup phases (import, download, weight_load, warmup, vad, tts) and readiness
+startup_tracker = StartupTracker()
+startup_tracker.record("import", time.monotonic() - _import_started)
 
 # Load environment variables
 load_dotenv()
@@ -22,10 +42,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Configure logging
+# Configure logging. enqueue=True hands each message to loguru's writer thread,
+# so a slow stdout (a busy log shipper) cannot stall the event loop mid-call
 logger.remove()
 logger.add(
-    lambda msg: print(msg, end=""),
+    sys.stdout,
+    enqueue=True,
     level=os.getenv("LOG_LEVEL", "INFO"),
     format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
 )
@@ -39,21 +61,231 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global state for graceful shutdown
-shutdown_event = asyncio.Event()
+# Event loop lag watchdog and per-call loop time; /admin/* needs ADMIN_TOKEN
+watchdog = LoopWatchdog(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")) / 1000,
+    block_threshold=float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000,
+    slow_step=float(os.getenv("LOOP_SLOW_STEP_MS", "20")) / 1000,
+    profile_calls=os.getenv("LOOP_CALL_PROFILING", "1") != "0",
+)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+PROFILE_MAX_SECONDS = 60
+
+# Live media streams, keyed by stream SID
 active_connections: Dict[str, WebSocket] = {}
 
+# SIGTERM starts a drain: no new calls, /ready fails, calls in progress get up
+# to DRAIN_TIMEOUT_SECONDS to finish before they hear the goodbye and are closed.
+# Keep it below the platform's termination grace period.
+drain = DrainController(timeout_seconds=float(os.getenv("DRAIN_TIMEOUT_SECONDS", "120")))
+
+# Admission control - every call needs a slot before it gets a media stream
+MAX_CONCURRENT_CALLS = int(os.getenv("MAX_CONCURRENT_CALLS", "1"))
+HOLD_RETRY_ATTEMPTS = int(os.getenv("HOLD_RETRY_ATTEMPTS", "3"))
+HOLD_RETRY_SECONDS = int(os.getenv("HOLD_RETRY_SECONDS", "5"))
+# Under serve.py several workers share one replica's slots through a registry file
+CALL_REGISTRY_PATH = os.getenv("CALL_REGISTRY_PATH")
+if CALL_REGISTRY_PATH:
+    admission = SharedAdmissionController(
+        CALL_REGISTRY_PATH,
+        max_concurrent_calls=MAX_CONCURRENT_CALLS,
+        reservation_ttl=float(os.getenv("ADMISSION_RESERVATION_TTL", "30"))
+    )
+else:
+    admission = AdmissionController(
+        max_concurrent_calls=MAX_CONCURRENT_CALLS,
+        reservation_ttl=float(os.getenv("ADMISSION_RESERVATION_TTL", "30"))
+    )
+
+# ...and publish their own state so any worker can report on all of them
+WORKER_STATS_DIR = os.getenv("WORKER_STATS_DIR")
+worker_board = WorkerStatsBoard(WORKER_STATS_DIR) if WORKER_STATS_DIR else None
+
+def worker_snapshot() -> dict:
+    return {
+        "ready": startup_tracker.ready,
+        "active_connections": len(active_connections),
+        "drain": drain.stats(),
+        "metrics": metrics_snapshot(),
+    }
+
+def peer_snapshots() -> list:
+    """Snapshots published by the other workers of this replica"""
+    if worker_board is None:
+        return []
+    return [peer for peer in worker_board.collect() if peer["pid"] != os.getpid()]
+
+def _render_replica_metrics():
+    capacity = admission.stats()
+    inference = get_inference_stats() or {}
+    lines = render_gauge("voice_agent_ready", "1 once the replica has finished warming up", int(startup_tracker.ready))
+    lines += render_gauge("voice_agent_capacity_slots", "Concurrent call slots on this replica", capacity["max_concurrent_calls"])
+    lines += render_gauge("voice_agent_reserved_slots", "Slots held for calls that have not connected yet", capacity["reserved_slots"])
+    lines += render_counter("voice_agent_admitted_calls_total", "Calls admitted since start", capacity["admitted"])
+    lines += render_counter("voice_agent_rejected_calls_total", "Calls turned away since start", capacity["rejected"])
+    if "pending" in inference:
+        lines += render_gauge("voice_agent_model_pending_turns", "Turns waiting for the shared model", inference["pending"])
+        lines += render_gauge("voice_agent_model_mean_batch_size", "Mean turns per model batch", inference["mean_batch_size"])
+    prefix_cache = inference.get("prefix_cache") or {}
+    if "hit_rate" in prefix_cache:
+        lines += render_gauge("voice_agent_prefix_cache_hit_rate",
+                              "Share of prompt tokens (engine) or prefixes (stand-in) served from the prefix cache",
+                              prefix_cache["hit_rate"])
+        lines += render_counter("voice_agent_prefix_cache_prefill_saved_seconds_total",
+                                "Prefill time the prefix cache saved, estimated from measured prefill time per token",
+                                prefix_cache["prefill_seconds_saved"])
+    if "cached_tokens" in prefix_cache:
+        lines += render_counter("voice_agent_prefix_cache_cached_tokens_total",
+                                "Prompt tokens the engine served from its prefix cache", prefix_cache["cached_tokens"])
+        lines += render_counter("voice_agent_prefix_cache_prompt_tokens_total",
+                                "Prompt tokens sent to the engine", prefix_cache["prompt_tokens"])
+    return lines
+
+REGISTRY.add_collector(_render_replica_metrics)
+
+@app.on_event("startup")
+async def start_watchdog():
+    if os.getenv("LOOP_WATCHDOG", "1") != "0":
+        watchdog.start(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Warm the replica in the background so /health answers during cold start"""
+    app.state.warm_up_task = asyncio.create_task(warm_up_replica(startup_tracker))
+
+@app.on_event("startup")
+async def start_publishing_worker_stats():
+    if worker_board is None:
+        return
+
+    async def publish():
+        while True:
+            try:
+                worker_board.publish(worker_snapshot())
+            except Exception as e:
+                logger.error(f"Could not publish worker stats: {e}")
+            await asyncio.sleep(1.0)
+
+    app.state.publish_task = asyncio.create_task(publish())
+
+@app.on_event("startup")
+async def install_drain_handler():
+    """Send SIGTERM to the drain instead of straight to uvicorn's shutdown"""
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    def start_drain():
+        if drain.begin():
+            app.state.drain_task = asyncio.create_task(drain_then_shut_down(previous_handler))
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, start_drain)
+
+async def drain_then_shut_down(previous_handler):
+    """Wait out the drain, then hand SIGTERM back so the server shuts down"""
+    await drain.run()
+    asyncio.get_running_loop().remove_signal_handler(signal.SIGTERM)
+    # uvicorn >= 0.29 installs a plain handler, which gets the signal as usual.
+    # Older versions register through the loop (asyncio's wakeup no-op shows up
+    # here instead); the default action then ends the process - no calls are left.
+    if not callable(previous_handler) or getattr(previous_handler, "__module__", "").startswith("asyncio"):
+        previous_handler = signal.SIG_DFL
+    signal.signal(signal.SIGTERM, previous_handler)
+    signal.raise_signal(signal.SIGTERM)
+
+@app.on_event("shutdown")
+async def close_tts_connections():
+    await get_tts_manager().close()
+    if worker_board is not None:
+        worker_board.remove()
+
+@app.on_event("shutdown")
+async def finish_recordings():
+    """Write out recordings of calls that were still open (CALL_RECORDING=1)"""
+    recording_writer = get_recording_writer()
+    if recording_writer is not None:
+        await asyncio.to_thread(recording_writer.stop)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Cerebrium"""
-    return {
+    health = {
         "status": "healthy",
+        "ready": startup_tracker.ready,
         "active_connections": len(active_connections),
+        "capacity": admission.stats(),
+        "startup": startup_tracker.stats(),
+        "drain": drain.stats(),
+        "tts": get_tts_manager().stats(),
+        "inference": get_inference_stats(),
         "service": "twilio-ultravox-agent"
     }
+    health["event_loop"] = watchdog.stats()
+    if get_recording_writer() is not None:
+        health["recording"] = get_recording_writer().stats()
+    if worker_board is not None:
+        workers = [dict(worker_snapshot(), pid=os.getpid())] + peer_snapshots()
+        health["active_connections"] = sum(worker["active_connections"] for worker in workers)
+        health["workers"] = [
+            {"pid": w["pid"], "ready": w["ready"], "active_connections": w["active_connections"], "drain": w["drain"]["state"]}
+            for w in workers
+        ]
+    # A replica whose warm-up failed will never become ready - let the platform restart it
+    if startup_tracker.failed_phase:
+        health["status"] = "unhealthy"
+        return JSONResponse(status_code=503, content=health)
+    # A draining replica is still healthy - failing here would get it killed mid-call
+    if drain.draining:
+        health["status"] = "draining"
+    # Still alive, just unable to take calls until the inference daemon is back
+    elif startup_tracker.ready and not inference_available():
+        health["status"] = "degraded"
+    return health
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint - only passes once a call would hit a warm model"""
+    if drain.draining:
+        return JSONResponse(status_code=503, content={"ready": False, "drain": drain.stats()})
+    if not startup_tracker.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "startup": startup_tracker.stats()}
+        )
+    if not inference_available():
+        return JSONResponse(status_code=503, content={"ready": False, "inference": get_inference_stats()})
+    return {"ready": True}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics - per-stage turn latency, queue wait, interruptions, capacity"""
+    return PlainTextResponse(render_metrics(peer_snapshots()), media_type="text/plain; version=0.0.4")
+
+def require_admin(request: Request):
+    """/admin/* exists only with ADMIN_TOKEN set, and needs it in X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/admin/loop")
+async def admin_loop(request: Request):
+    """Loop lag, recent blocks with the stack that was blocking, loop time per call (this worker)"""
+    require_admin(request)
+    return dict(watchdog.report(), pid=os.getpid())
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10.0, hz: float = 100.0):
+    """Sample this worker's event loop; folded stacks for flamegraph.pl or speedscope"""
+    require_admin(request)
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    hz = min(max(hz, 1.0), 1000.0)
+    try:
+        folded = await asyncio.to_thread(watchdog.profile, seconds, hz)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded, headers={"X-Worker-Pid": str(os.getpid())})
 
 @app.post("/")
-async def start_call(request: dict = None):
+async def start_call(request: Request):
     """Handle incoming Twilio calls and return TwiML"""
     logger.info("POST TwiML request received")
     
@@ -66,19 +298,39 @@ async def start_call(request: dict = None):
             logger.error("CEREBRIUM_PROJECT_ID environment variable not set")
             raise HTTPException(status_code=500, detail="Server configuration error")
         
+        # Twilio posts the call parameters form-encoded
+        form = parse_qs((await request.body()).decode())
+        call_sid = form.get("CallSid", [None])[0]
+        attempt = int(request.query_params.get("attempt", "0"))
+        
+        base_url = f"https://api.cortex.cerebrium.ai/v4/{project_id}/{app_name}"
+        # Key=value lines for capacity_planner.py; a held call's retries repeat its arrival
+        arrival = f"Call arrival call_sid={call_sid} epoch={time.time():.3f}"
+        
+        # A replica that is still warming up (or draining, or has lost its
+        # inference daemon) has no capacity; a held call's retry can land on another replica
+        if (drain.draining or not startup_tracker.ready or not inference_available()
+                or not admission.try_reserve(call_sid)):
+            if attempt < HOLD_RETRY_ATTEMPTS:
+                admission.record_held()
+                logger.info(f"{arrival} outcome=held")
+                logger.warning(f"At capacity, holding call {call_sid} (attempt {attempt + 1}/{HOLD_RETRY_ATTEMPTS})")
+                return HTMLResponse(
+                    content=hold_twiml(f"{base_url}/", attempt + 1, HOLD_RETRY_SECONDS),
+                    media_type="application/xml"
+                )
+            admission.record_rejected()
+            logger.info(f"{arrival} outcome=rejected")
+            logger.warning(f"At capacity, rejecting call {call_sid}")
+            return HTMLResponse(content=BUSY_TWIML, media_type="application/xml")
+        
+        logger.info(f"{arrival} outcome=admitted")
+        
         # Construct the WebSocket URL for Cerebrium deployment
         websocket_url = f"wss://api.cortex.cerebrium.ai/v4/{project_id}/{app_name}/ws"
-        logger.info(f"Directing call to WebSocket: {websocket_url}")
-        
-        twiml_response = f'''<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Connect>
-                <Stream url="{websocket_url}" />
-            </Connect>
-            <Pause length="40"/>
-        </Response>'''
+        logger.info(f"Directing call {call_sid} to WebSocket: {websocket_url}")
         
-        return HTMLResponse(content=twiml_response, media_type="application/xml")
+        return HTMLResponse(content=stream_twiml(websocket_url), media_type="application/xml")
         
     except Exception as e:
         logger.error(f"Error in start_call: {e}")
@@ -94,6 +346,12 @@ async def start_call(request: dict = None):
 async def websocket_endpoint(websocket: WebSocket):
     """Handle WebSocket connections from Twilio"""
     connection_id = None
+    slot = None
+    timeout_task = None
+    call_sid = None
+    stream_sid = None
+    call_started = None
+    recording = None
     
     try:
         await websocket.accept()
@@ -105,16 +363,14 @@ async def websocket_endpoint(websocket: WebSocket):
         )
         
         try:
-            # Get the first two messages from Twilio with timeout
-            start_data = websocket.iter_text()
-            
-            # Wait for first message (should be "connected")
-            first_msg = await asyncio.wait_for(start_data.__anext__(), timeout=10.0)
+            # Get the first two messages from Twilio with timeout. Read them
+            # directly rather than through iter_text(), which would leave an
+            # async generator wrapped around the socket the transport takes over
+            first_msg = await asyncio.wait_for(websocket.receive_text(), timeout=10.0)
             logger.debug(f"First message: {first_msg}")
             
             # Wait for second message with call data
-            call_data_str = await asyncio.wait_for(start_data.__anext__(), timeout=10.0)
-            call_data = json.loads(call_data_str)
+            call_data = parse_control(await asyncio.wait_for(websocket.receive_text(), timeout=10.0))
             logger.info(f"Call data received: {call_data}")
             
             # Extract and validate stream SID
@@ -122,16 +378,44 @@ async def websocket_endpoint(websocket: WebSocket):
                 raise ValueError("Invalid call data: missing streamSid")
                 
             stream_sid = call_data["start"]["streamSid"]
+            call_sid = call_data["start"].get("callSid")
+            
+            # Take the slot reserved by the webhook (or a free one, unless draining)
+            slot = admission.claim(call_sid, reserved_only=drain.draining)
+            if slot is None:
+                logger.warning(f"Rejecting stream {stream_sid}: replica at capacity")
+                timeout_task.cancel()
+                await play_and_close(websocket, stream_sid, "busy", code=1013, reason="At capacity")
+                return
+            
             connection_id = stream_sid
             active_connections[connection_id] = websocket
+            hangup = drain.register(connection_id)
+            call_started = time.time()
             
             logger.info(f"Stream SID: {stream_sid}")
             
             # Cancel timeout task
             timeout_task.cancel()
             
-            # Start the voice agent
-            await create_voice_agent(websocket, stream_sid)
+            # Opt-in (CALL_RECORDING=1); held here so the goodbye and error phrases are recorded too
+            recording_writer = get_recording_writer()
+            recording = recording_writer.open(stream_sid) if recording_writer else None
+            
+            # Start the voice agent; a drain that runs out of time asks us to hang up
+            serializer = FastTwilioFrameSerializer(stream_sid)
+            with watchdog.call(stream_sid):
+                agent = asyncio.create_task(create_voice_agent(websocket, stream_sid, serializer, recording))
+            hangup_requested = asyncio.create_task(hangup.wait())
+            try:
+                await asyncio.wait({agent, hangup_requested}, return_when=asyncio.FIRST_COMPLETED)
+                if agent.done():
+                    agent.result()
+                else:
+                    await hang_up(websocket, stream_sid, serializer, agent, recording)
+            finally:
+                hangup_requested.cancel()
+                agent.cancel()
             
         except asyncio.TimeoutError:
             logger.error("Timeout waiting for Twilio messages")
@@ -146,44 +430,65 @@ async def websocket_endpoint(websocket: WebSocket):
         
     except Exception as e:
         logger.error(f"Error in WebSocket endpoint: {e}")
-        try:
-            await websocket.close(code=1011, reason="Internal error")
-        except:
-            pass
+        await play_and_close(websocket, stream_sid, "error", code=1011, reason="Internal error", recording=recording)
             
     finally:
+        if recording is not None:
+            get_recording_writer().close(recording)
         # Cleanup
         if connection_id and connection_id in active_connections:
             del active_connections[connection_id]
+        if connection_id:
+            drain.unregister(connection_id)
+            watchdog.finish_call(connection_id)
+        admission.release(slot)
         
-        if not timeout_task.cancelled():
+        if timeout_task and not timeout_task.cancelled():
             timeout_task.cancel()
         
+        if call_started is not None:
+            logger.info(f"Call ended call_sid={call_sid} stream_sid={connection_id} "
+                        f"epoch={time.time():.3f} duration={time.time() - call_started:.1f}s")
         logger.info(f"WebSocket connection {connection_id} cleaned up")
 
-async def graceful_shutdown():
-    """Handle graceful shutdown of active connections"""
-    logger.info("Starting graceful shutdown...")
-    shutdown_event.set()
-    
-    # Close all active WebSocket connections
-    for connection_id, websocket in list(active_connections.items()):
-        try:
-            await websocket.close(code=1001, reason="Server shutdown")
-            logger.info(f"Closed connection {connection_id}")
-        except Exception as e:
-            logger.error(f"Error closing connection {connection_id}: {e}")
-    
-    active_connections.clear()
-    logger.info("Graceful shutdown completed")
+async def play_and_close(websocket: WebSocket, stream_sid: Optional[str], name: str, code: int, reason: str,
+                         recording: Optional[CallRecording] = None):
+    """Play a cached phrase (busy, error) into the stream, if there is one, then close it
 
-# Signal handlers for graceful shutdown
-def signal_handler(signum, frame):
-    logger.info(f"Received signal {signum}")
-    asyncio.create_task(graceful_shutdown())
+    The webhook's busy and error TwiML have no stream to play into, so they keep <Say>.
+    A call turned away as busy never had a recording; an error is recorded if the call was.
+    """
+    phrase = get_phrase_cache().get(name)
+    try:
+        if phrase is not None and stream_sid:
+            await play_to_twilio(websocket, stream_sid, phrase, recording)
+            # Twilio plays from its buffer; closing now would cut the phrase off
+            await asyncio.sleep(phrase.duration_seconds)
+        await websocket.close(code=code, reason=reason)
+    except Exception:
+        pass
 
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGINT, signal_handler)
+async def hang_up(websocket: WebSocket, stream_sid: str, serializer: FastTwilioFrameSerializer, agent: asyncio.Task,
+                  recording: Optional[CallRecording] = None):
+    """Say the cached goodbye over a call the drain could not wait for, then close it"""
+    serializer.mute()
+    goodbye = get_phrase_cache().get("goodbye")
+    try:
+        if goodbye is not None:
+            await websocket.send_text(TwilioMessageEncoder(stream_sid).clear())
+            await play_to_twilio(websocket, stream_sid, goodbye, recording)
+            # Twilio plays from its buffer; closing now would cut the goodbye off
+            await asyncio.sleep(goodbye.duration_seconds)
+    except Exception as e:
+        logger.error(f"Error playing goodbye on {stream_sid}: {e}")
+    
+    agent.cancel()
+    await asyncio.gather(agent, return_exceptions=True)
+    try:
+        await websocket.close(code=1001, reason="Server shutdown")
+    except Exception:
+        pass
+    logger.info(f"Hung up {stream_sid} for drain")
 
 if __name__ == "__main__":
     import uvicorn
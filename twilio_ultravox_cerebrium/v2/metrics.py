@@ -0,0 +1,324 @@
+"""
+Per-call latency instrumentation and Prometheus text exposition.
+
+Each call gets a CallMetrics object and a few LatencyTap processors placed
+between the pipeline stages. The taps only timestamp a handful of frame
+types (everything else is passed straight on), and histograms are
+fixed-bucket counters, so the hot path cost is an isinstance check and
+occasionally a bisect.
+
+With several web workers each process keeps its own registry; a worker
+publishes snapshot() and render_metrics() merges the other workers'
+snapshots into its own, so any worker can answer a scrape for the replica.
+
+A turn is measured from the VAD end-of-speech to the moment the output
+transport starts sending audio back to Twilio:
+
+    UserStoppedSpeaking -> first TextFrame -> first TTS audio -> BotStartedSpeaking
+          vad_to_first_token   first_token_to_tts   tts_to_send
+    |------------------------------ turn_latency ------------------------------|
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence
+
+from loguru import logger
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    Frame,
+    StartInterruptionFrame,
+    TextFrame,
+    TTSAudioRawFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+DURATION_BUCKETS = (15, 30, 60, 120, 180, 300, 600, 900, 1800)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Work done inline on the event loop, per frame
+INLINE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 5e-3)
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def render(self, peers: Sequence[dict] = ()) -> List[str]:
+        counts, total, count = list(self.counts), self.sum, self.count
+        for peer in peers:
+            counts = [a + b for a, b in zip(counts, peer["counts"])]
+            total += peer["sum"]
+            count += peer["count"]
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket in zip(self.buckets, counts):
+            cumulative += bucket
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+    def render(self, peers: Sequence[dict] = ()) -> List[str]:
+        value = self.value + sum(peer["value"] for peer in peers)
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {value}"]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Register a callback that renders extra lines at scrape time"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self, peers: Sequence[Dict[str, dict]] = ()) -> str:
+        """Exposition text; peers are snapshot()s from other processes to add in"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render([peer[metric.name] for peer in peers if metric.name in peer]))
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+def render_gauge(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+def render_counter(name: str, help_text: str, value: float) -> List[str]:
+    """A counter kept elsewhere (e.g. in shared admission state), rendered like Counter"""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+REGISTRY = MetricsRegistry()
+
+VAD_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "voice_agent_vad_to_first_token_seconds", "End of caller speech (VAD) to first model token")
+FIRST_TOKEN_TO_TTS = REGISTRY.histogram(
+    "voice_agent_first_token_to_first_tts_byte_seconds", "First model token to first TTS audio byte")
+TTS_TO_SEND = REGISTRY.histogram(
+    "voice_agent_tts_byte_to_twilio_send_seconds", "First TTS audio byte to first audio sent to Twilio")
+TURN_LATENCY = REGISTRY.histogram(
+    "voice_agent_turn_latency_seconds", "End of caller speech to first audio sent to Twilio")
+MODEL_QUEUE_WAIT = REGISTRY.histogram(
+    "voice_agent_model_queue_wait_seconds", "Time a turn waited in the inference scheduler")
+CALL_DURATION = REGISTRY.histogram(
+    "voice_agent_call_duration_seconds", "Duration of finished calls", DURATION_BUCKETS)
+INTERRUPTIONS = REGISTRY.counter(
+    "voice_agent_interruptions_total", "Times a caller interrupted the agent")
+TURNS = REGISTRY.counter(
+    "voice_agent_turns_total", "Completed caller turns")
+SPECULATIONS_COMMITTED = REGISTRY.counter(
+    "voice_agent_speculative_turns_committed_total", "Speculative replies confirmed by the end of the caller's turn")
+SPECULATIONS_CANCELLED = REGISTRY.counter(
+    "voice_agent_speculative_turns_cancelled_total", "Speculative replies dropped because the caller kept talking")
+SPECULATIVE_WASTED_TOKENS = REGISTRY.counter(
+    "voice_agent_speculative_wasted_tokens_total", "Tokens generated for speculative replies that were dropped")
+SPECULATIVE_WASTED_AUDIO = REGISTRY.counter(
+    "voice_agent_speculative_wasted_audio_seconds_total", "Caller audio prefilled for speculative replies that were dropped")
+SPECULATIVE_SAVED = REGISTRY.histogram(
+    "voice_agent_speculative_saved_seconds", "Head start a committed speculative reply had over VAD end of speech")
+LOOP_LAG = REGISTRY.histogram(
+    "voice_agent_event_loop_lag_seconds", "How late the watchdog heartbeat woke up", LOOP_LAG_BUCKETS)
+LOOP_BLOCKS = REGISTRY.counter(
+    "voice_agent_event_loop_blocks_total", "Times the event loop stayed blocked past LOOP_BLOCK_THRESHOLD_MS")
+RECORDING_TAP_TIME = REGISTRY.histogram(
+    "voice_agent_recording_tap_seconds", "Event loop time spent copying one frame into a call recording", INLINE_BUCKETS)
+RECORDING_DROPPED_FRAMES = REGISTRY.counter(
+    "voice_agent_recording_dropped_frames_total", "Audio frames left out of recordings because the ring was full")
+RECORDING_BYTES = REGISTRY.counter(
+    "voice_agent_recording_bytes_written_total", "PCM bytes the recording writer appended to segment files")
+
+# Calls currently in progress, keyed by stream SID
+active_calls: Dict[str, "CallMetrics"] = {}
+
+class CallMetrics:
+    """Turn timestamps and latency history for one call"""
+
+    def __init__(self, stream_sid: str, text_chunking: str = "sentence"):
+        self.stream_sid = stream_sid
+        # How model text reaches TTS ("clause" or "sentence"), so turn logs can be compared
+        self.text_chunking = text_chunking
+        self.started_at = time.monotonic()
+        self.turn_latencies: List[float] = []
+        self.interruptions = 0
+        self.speculations_committed = 0
+        self.speculations_cancelled = 0
+        # A downstream frame passes every tap; only its first sighting counts
+        self._last_frame_id: Optional[int] = None
+        self._reset_turn()
+        active_calls[stream_sid] = self
+
+    def _reset_turn(self) -> None:
+        self.vad_end: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.first_tts_byte: Optional[float] = None
+
+    def _seen(self, frame_id: int) -> bool:
+        if frame_id == self._last_frame_id:
+            return True
+        self._last_frame_id = frame_id
+        return False
+
+    def on_vad_end(self, frame_id: int) -> None:
+        if self._seen(frame_id):
+            return
+        self._reset_turn()
+        self.vad_end = time.monotonic()
+
+    def on_token(self) -> None:
+        if self.vad_end is not None and self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def on_tts_audio(self) -> None:
+        if self.first_token is not None and self.first_tts_byte is None:
+            self.first_tts_byte = time.monotonic()
+
+    def on_queue_wait(self, seconds: float) -> None:
+        MODEL_QUEUE_WAIT.observe(seconds)
+
+    def on_speculation_committed(self, head_start: float) -> None:
+        self.speculations_committed += 1
+        SPECULATIONS_COMMITTED.inc()
+        SPECULATIVE_SAVED.observe(head_start)
+
+    def on_speculation_cancelled(self, tokens: int, audio_seconds: float) -> None:
+        self.speculations_cancelled += 1
+        SPECULATIONS_CANCELLED.inc()
+        SPECULATIVE_WASTED_TOKENS.inc(tokens)
+        SPECULATIVE_WASTED_AUDIO.inc(audio_seconds)
+
+    def on_interruption(self, frame_id: int) -> None:
+        if self._seen(frame_id):
+            return
+        self.interruptions += 1
+        INTERRUPTIONS.inc()
+
+    def on_bot_started_speaking(self) -> None:
+        if self.vad_end is None or self.first_tts_byte is None:
+            return
+        now = time.monotonic()
+        VAD_TO_FIRST_TOKEN.observe(self.first_token - self.vad_end)
+        FIRST_TOKEN_TO_TTS.observe(self.first_tts_byte - self.first_token)
+        TTS_TO_SEND.observe(now - self.first_tts_byte)
+        TURN_LATENCY.observe(now - self.vad_end)
+        TURNS.inc()
+        self.turn_latencies.append(now - self.vad_end)
+        logger.info(
+            f"Turn latency {self.stream_sid}: first audio {(now - self.vad_end) * 1000:.0f}ms "
+            f"({self.text_chunking} chunks; vad->token {(self.first_token - self.vad_end) * 1000:.0f}ms, "
+            f"token->tts {(self.first_tts_byte - self.first_token) * 1000:.0f}ms, "
+            f"tts->send {(now - self.first_tts_byte) * 1000:.0f}ms)"
+        )
+        self._reset_turn()
+
+    def finish(self) -> None:
+        duration = time.monotonic() - self.started_at
+        CALL_DURATION.observe(duration)
+        active_calls.pop(self.stream_sid, None)
+        if self.turn_latencies:
+            ordered = sorted(self.turn_latencies)
+            logger.info(
+                f"Call {self.stream_sid} metrics: duration={duration:.0f}s turns={len(ordered)} "
+                f"turn_p50={ordered[len(ordered) // 2] * 1000:.0f}ms turn_max={ordered[-1] * 1000:.0f}ms "
+                f"interruptions={self.interruptions} chunking={self.text_chunking}"
+                + (f" speculations={self.speculations_committed}/{self.speculations_committed + self.speculations_cancelled}"
+                   if self.speculations_committed or self.speculations_cancelled else "")
+            )
+
+def _call_summaries() -> Dict[str, list]:
+    """stream SID -> [turns, last turn latency or None] for this process's calls"""
+    return {
+        sid: [len(call.turn_latencies), call.turn_latencies[-1] if call.turn_latencies else None]
+        for sid, call in list(active_calls.items())
+    }
+
+def _render_active_calls(calls: Dict[str, list]) -> List[str]:
+    lines = render_gauge("voice_agent_active_calls", "Calls with a running pipeline", len(calls))
+    lines += [
+        "# HELP voice_agent_call_turns Completed turns in an active call",
+        "# TYPE voice_agent_call_turns gauge",
+    ]
+    for sid, (turns, _) in calls.items():
+        lines.append(f'voice_agent_call_turns{{stream_sid="{sid}"}} {turns}')
+    lines += [
+        "# HELP voice_agent_call_last_turn_latency_seconds Latest turn latency of an active call",
+        "# TYPE voice_agent_call_last_turn_latency_seconds gauge",
+    ]
+    for sid, (_, last) in calls.items():
+        if last is not None:
+            lines.append(f'voice_agent_call_last_turn_latency_seconds{{stream_sid="{sid}"}} {last}')
+    return lines
+
+def snapshot() -> dict:
+    """This process's metrics and active calls, for other workers to merge"""
+    return {"metrics": REGISTRY.snapshot(), "calls": _call_summaries()}
+
+def render_metrics(peers: Sequence[dict] = ()) -> str:
+    """Prometheus text for this process plus peer snapshot()s"""
+    calls = _call_summaries()
+    for peer in peers:
+        calls.update(peer.get("calls", {}))
+    return REGISTRY.render([peer["metrics"] for peer in peers]) + "\n".join(_render_active_calls(calls)) + "\n"
+
+class LatencyTap(FrameProcessor):
+    """Pass-through stage that timestamps turn milestones for a call"""
+
+    def __init__(self, call_metrics: CallMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self._call = call_metrics
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TTSAudioRawFrame):
+            self._call.on_tts_audio()
+        elif isinstance(frame, TextFrame):
+            self._call.on_token()
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._call.on_vad_end(frame.id)
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            self._call.on_bot_started_speaking()
+        elif isinstance(frame, StartInterruptionFrame) and direction == FrameDirection.DOWNSTREAM:
+            self._call.on_interruption(frame.id)
+
+        await self.push_frame(frame, direction)
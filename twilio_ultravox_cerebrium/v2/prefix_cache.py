@@ -0,0 +1,103 @@
+"""
+LRU cache of prompt-prefix key/value state.
+
+Every call sends the same restaurant system prompt ahead of the caller's
+audio. The prefix (the leading system messages) is prefilled once per
+distinct prompt and its KV state reused by every call and turn that starts
+with it. Entries are evicted least-recently-used once the cache exceeds its
+memory cap.
+
+This cache backs the CPU stand-in model (stub_services.py,
+bench_scheduler.py), where skipping the prefix prefill is simulated. The
+vLLM engine keeps its own prefix cache inside its KV block pool (see
+ultravox_model.py); its size is bounded by ULTRAVOX_GPU_MEMORY_UTILIZATION,
+not by this class.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+# Llama 3.1 8B: 32 layers x (K + V) x 8 KV heads x 128 dims x 2 bytes
+KV_BYTES_PER_TOKEN = 32 * 2 * 8 * 128 * 2
+
+def split_prompt_prefix(messages: List[dict]) -> Tuple[str, List[dict]]:
+    """Split the leading system messages (the shared prefix) from the rest"""
+    index = 0
+    while index < len(messages) and messages[index].get("role") == "system":
+        index += 1
+    prefix = "\n\n".join(m["content"] for m in messages[:index])
+    return prefix, messages[index:]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+class PrefixEntry:
+    __slots__ = ("state", "nbytes", "prefill_seconds", "hits", "created_at")
+
+    def __init__(self, state: Any, nbytes: int, prefill_seconds: float):
+        self.state = state
+        self.nbytes = nbytes
+        self.prefill_seconds = prefill_seconds
+        self.hits = 0
+        self.created_at = time.monotonic()
+
+class PrefixKVCache:
+    """Memory-capped LRU of prefix KV state keyed by prompt text"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, PrefixEntry]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefill_seconds_saved = 0.0
+        self.prefill_seconds_spent = 0.0
+
+    @staticmethod
+    def key(prefix: str) -> str:
+        return hashlib.sha256(prefix.encode()).hexdigest()
+
+    def lookup(self, prefix: str) -> Optional[PrefixEntry]:
+        entry = self._entries.get(self.key(prefix))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(self.key(prefix))
+        entry.hits += 1
+        self.hits += 1
+        self.prefill_seconds_saved += entry.prefill_seconds
+        return entry
+
+    def insert(self, prefix: str, state: Any, nbytes: int, prefill_seconds: float) -> PrefixEntry:
+        key = self.key(prefix)
+        existing = self._entries.pop(key, None)
+        if existing is not None:
+            self.bytes_used -= existing.nbytes
+
+        entry = PrefixEntry(state, nbytes, prefill_seconds)
+        self._entries[key] = entry
+        self.bytes_used += nbytes
+        self.prefill_seconds_spent += prefill_seconds
+
+        while self.bytes_used > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes_used -= evicted.nbytes
+            self.evictions += 1
+        return entry
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes_used": self.bytes_used,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "prefill_seconds_saved": round(self.prefill_seconds_saved, 3),
+            "prefill_seconds_spent": round(self.prefill_seconds_spent, 3),
+        }
@@ -0,0 +1,88 @@
+"""
+Multi-worker launcher: one model-owner process plus N uvicorn web workers.
+
+    python serve.py --workers 4
+    python serve.py --workers 4 --inference-socket /run/voice-agent/inference.sock
+
+The websocket, VAD and codec work for each call is CPU-bound Python, so a
+single process runs out of event loop long before the GPU runs out of
+batch capacity. This starts inference_server.py to own the model and runs
+main:app in N uvicorn workers that reach it over a Unix socket. The
+workers share the call slots and admission counters through a registry
+file and publish their own stats next to it, so /health and /metrics
+report the whole replica whichever worker answers. Everything lives in
+--run-dir, which is reset on start.
+
+With --inference-socket the workers attach to an inference daemon that is
+already running (started on its own, see inference_server.py), so
+restarting the web tier leaves the loaded weights alone.
+
+SIGTERM goes to uvicorn, which passes it to the workers; they drain as
+usual, and the model owner is stopped once they have exited.
+"""
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+
+import uvicorn
+from loguru import logger
+
+from shared_state import SharedAdmissionController
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "2")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8765")))
+    parser.add_argument("--run-dir", default=os.getenv("VOICE_AGENT_RUN_DIR", "/tmp/voice-agent"))
+    parser.add_argument("--inference-socket", help="use a running inference daemon instead of starting one")
+    parser.add_argument("--stub", action="store_true", help="start the inference daemon with the CPU stand-in model")
+    args = parser.parse_args()
+
+    os.makedirs(args.run_dir, exist_ok=True)
+    paths = {
+        "INFERENCE_SOCKET": args.inference_socket or os.path.join(args.run_dir, "inference.sock"),
+        "CALL_REGISTRY_PATH": os.path.join(args.run_dir, "calls.bin"),
+        "WORKER_STATS_DIR": os.path.join(args.run_dir, "workers"),
+    }
+    SharedAdmissionController.reset(paths["CALL_REGISTRY_PATH"])
+    shutil.rmtree(paths["WORKER_STATS_DIR"], ignore_errors=True)
+    # Inherited by the model owner and by every uvicorn worker
+    os.environ.update(paths)
+
+    model_owner = None
+    stopping = threading.Event()
+    if not args.inference_socket:
+        command = [sys.executable, os.path.join(HERE, "inference_server.py"), "--socket", paths["INFERENCE_SOCKET"]]
+        model_owner = subprocess.Popen(command + (["--stub"] if args.stub else []), cwd=HERE)
+
+        def watch_model_owner():
+            code = model_owner.wait()
+            if not stopping.is_set():
+                # Workers cannot serve a call without it; let the platform replace the replica
+                logger.error(f"Inference server exited with code {code}, shutting down")
+                os.kill(os.getpid(), signal.SIGTERM)
+
+        threading.Thread(target=watch_model_owner, daemon=True).start()
+
+    logger.info(f"Starting {args.workers} web worker(s) on port {args.port}, run dir {args.run_dir}")
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=HERE, timeout_keep_alive=300)
+    finally:
+        stopping.set()
+        if model_owner is not None:
+            model_owner.terminate()
+            try:
+                model_owner.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                model_owner.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Call state shared by the uvicorn workers of one replica.
+
+With several web workers each process only sees its own websockets, so the
+capacity budget and call list have to live outside them. The registry is a
+small fixed-size table in an mmap'd file under the run directory, guarded
+by ``fcntl.flock``; every operation is a few dozen bytes read or written
+under the lock, so it costs microseconds per call event, never per frame.
+
+Slots left behind by a worker that died are reclaimed by the next caller
+that looks at the table. Reservation deadlines use time.monotonic(), which
+is the same clock in every process on Linux.
+
+Workers also drop a JSON snapshot of their own state (connections, drain,
+metrics) into the run directory once a second; /health and /metrics in any
+worker merge those with the shared registry.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from loguru import logger
+
+_MAGIC = b"VACALLS1"
+# magic, slot count, admitted, rejected, held, expired reservations
+_HEADER = struct.Struct("<8sIQQQQ")
+# state, owning pid, reservation deadline, started at, key (call SID or stream key)
+_SLOT = struct.Struct("<BxxxIdd48s")
+
+FREE, RESERVED, ACTIVE = 0, 1, 2
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class SharedAdmissionController:
+    """AdmissionController whose slots and counters are shared across processes"""
+
+    def __init__(self, path: str, max_concurrent_calls: int, reservation_ttl: float = 30.0):
+        self.path = path
+        self.max_concurrent_calls = max_concurrent_calls
+        self.reservation_ttl = reservation_ttl
+        self._pid = os.getpid()
+        self._streams = 0
+
+        size = _HEADER.size + _SLOT.size * max_concurrent_calls
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked_fd():
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, 8, 0) != _MAGIC:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, max_concurrent_calls, 0, 0, 0, 0), 0)
+        self._map = mmap.mmap(self._fd, size)
+
+    @classmethod
+    def reset(cls, path: str) -> None:
+        """Start a fresh table (the launcher does this before workers start)"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked_fd(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # Table access - callers hold the lock
+
+    def _header(self) -> list:
+        return list(_HEADER.unpack_from(self._map, 0))
+
+    def _bump(self, index: int, amount: int = 1) -> None:
+        header = self._header()
+        header[index] += amount
+        _HEADER.pack_into(self._map, 0, *header)
+
+    def _slots(self) -> Iterator[tuple]:
+        for i in range(self.max_concurrent_calls):
+            state, pid, expires_at, started_at, key = _SLOT.unpack_from(self._map, _HEADER.size + i * _SLOT.size)
+            yield i, state, pid, expires_at, started_at, key.rstrip(b"\0").decode()
+
+    def _write_slot(self, index: int, state: int, pid: int = 0, expires_at: float = 0.0,
+                    started_at: float = 0.0, key: str = "") -> None:
+        _SLOT.pack_into(self._map, _HEADER.size + index * _SLOT.size,
+                        state, pid, expires_at, started_at, key.encode()[:48])
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for i, state, pid, expires_at, _, key in self._slots():
+            if state == RESERVED and expires_at <= now:
+                self._write_slot(i, FREE)
+                self._bump(5)
+                logger.warning(f"Reservation for call {key} expired before its stream connected")
+            elif state == ACTIVE and not _pid_alive(pid):
+                self._write_slot(i, FREE)
+                logger.warning(f"Reclaimed slot for {key} from dead worker {pid}")
+
+    def _find(self, key: str) -> Optional[tuple]:
+        for slot in self._slots():
+            if slot[1] != FREE and slot[5] == key:
+                return slot
+        return None
+
+    def _free_index(self) -> Optional[int]:
+        for i, state, *_ in self._slots():
+            if state == FREE:
+                return i
+        return None
+
+    # AdmissionController interface
+
+    @property
+    def slots_in_use(self) -> int:
+        with self._locked_fd():
+            return sum(1 for slot in self._slots() if slot[1] != FREE)
+
+    def try_reserve(self, call_sid: Optional[str]) -> bool:
+        with self._locked_fd():
+            self._purge()
+            if call_sid and self._find(call_sid) is not None:
+                return True
+            index = self._free_index()
+            if index is None:
+                return False
+            if call_sid:
+                self._write_slot(index, RESERVED, self._pid, time.monotonic() + self.reservation_ttl, 0.0, call_sid)
+            return True
+
+    def claim(self, call_sid: Optional[str], reserved_only: bool = False) -> Optional[str]:
+        with self._locked_fd():
+            self._purge()
+            existing = self._find(call_sid) if call_sid else None
+            if existing is not None and existing[1] == RESERVED:
+                index = existing[0]
+            elif reserved_only or (index := self._free_index()) is None:
+                self._bump(3)
+                return None
+            self._streams += 1
+            slot = call_sid or f"stream-{self._pid}-{self._streams}"
+            self._write_slot(index, ACTIVE, self._pid, 0.0, time.monotonic(), slot)
+            self._bump(2)
+            return slot
+
+    def release(self, slot: Optional[str]) -> None:
+        if slot is None:
+            return
+        with self._locked_fd():
+            existing = self._find(slot)
+            if existing is not None:
+                self._write_slot(existing[0], FREE)
+
+    def record_held(self) -> None:
+        with self._locked_fd():
+            self._bump(4)
+
+    def record_rejected(self) -> None:
+        with self._locked_fd():
+            self._bump(3)
+
+    def stats(self) -> dict:
+        with self._locked_fd():
+            self._purge()
+            _, _, admitted, rejected, held, expired = self._header()
+            slots = list(self._slots())
+        active = sum(1 for s in slots if s[1] == ACTIVE)
+        reserved = sum(1 for s in slots if s[1] == RESERVED)
+        in_use = active + reserved
+        return {
+            "max_concurrent_calls": self.max_concurrent_calls,
+            "active_calls": active,
+            "reserved_slots": reserved,
+            "utilisation": round(in_use / self.max_concurrent_calls, 3) if self.max_concurrent_calls else 1.0,
+            "admitted": admitted,
+            "rejected": rejected,
+            "held": held,
+            "expired_reservations": expired,
+            "calls_by_worker": {
+                str(pid): sum(1 for s in slots if s[1] == ACTIVE and s[2] == pid)
+                for pid in sorted({s[2] for s in slots if s[1] == ACTIVE})
+            },
+        }
+
+class WorkerStatsBoard:
+    """Per-worker JSON snapshots in a shared directory"""
+
+    def __init__(self, directory: str, stale_after: float = 10.0):
+        self.directory = directory
+        self.stale_after = stale_after
+        self._pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def publish(self, snapshot: dict) -> None:
+        snapshot = dict(snapshot, pid=self._pid, published_at=time.time())
+        tmp = self._path(self._pid) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self._path(self._pid))
+
+    def collect(self) -> List[dict]:
+        """Snapshots from live workers, this one included"""
+        snapshots = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _pid_alive(snapshot.get("pid", 0)) or now - snapshot.get("published_at", 0) > self.stale_after:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                continue
+            snapshots.append(snapshot)
+        return snapshots
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self._path(self._pid))
+        except OSError:
+            pass
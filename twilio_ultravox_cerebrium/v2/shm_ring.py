@@ -0,0 +1,121 @@
+"""
+Single-producer, single-consumer record rings in shared memory.
+
+Used between a web worker and the inference daemon (inference_ipc.py): one
+ring carries turn audio to the daemon, another carries tokens back. The
+Unix socket only carries small control messages and doorbells, so audio
+is copied once into the ring and once out of it, with no socket buffers,
+bytes objects or base64 in between.
+
+Layout: a 64-byte header holding the producer's write position and the
+consumer's read position (byte counts since the ring was created; each is
+only ever written by its own side), then the data area. Records are
+contiguous - a record that does not fit before the end of the data area
+starts again at the front, after a WRAP marker if there is room for one:
+
+    u32 payload length | u32 request id | u32 kind | 4 pad | f64 value | payload
+
+The consumer only looks at the ring after the producer has rung the
+doorbell over the socket, and the syscall on each side orders the memory
+writes, so no further fencing is needed. An 8-byte aligned store is a
+single instruction on the platforms we deploy to, so a position is never
+seen half written.
+"""
+import mmap
+import os
+import struct
+from typing import Iterator, Optional, Tuple
+
+_POSITIONS = struct.Struct("<QQ")
+_POSITION = struct.Struct("<Q")
+_RECORD = struct.Struct("<IIIxxxxd")
+HEADER_SIZE = 64
+WRAP = 0xFFFFFFFF
+
+class ShmRing:
+    """A record ring backed by a file (normally on /dev/shm)"""
+
+    def __init__(self, path: str, capacity: Optional[int] = None):
+        """Create the ring at ``path`` if ``capacity`` is given, else attach to it"""
+        self.path = path
+        if capacity is not None:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.ftruncate(fd, HEADER_SIZE + capacity)
+        else:
+            fd = os.open(path, os.O_RDWR)
+            capacity = os.fstat(fd).st_size - HEADER_SIZE
+        try:
+            self._map = mmap.mmap(fd, HEADER_SIZE + capacity)
+        finally:
+            os.close(fd)
+        self.capacity = capacity
+        self._data = memoryview(self._map)[HEADER_SIZE:]
+        # Each side keeps its own position locally and publishes it to the header
+        self._write, self._read = _POSITIONS.unpack_from(self._map, 0)
+
+    def unlink(self) -> None:
+        """Remove the name; both sides keep their mappings"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self) -> None:
+        self._data.release()
+        self._map.close()
+
+    @property
+    def used(self) -> int:
+        return self._write - _POSITION.unpack_from(self._map, 8)[0]
+
+    # Producer
+
+    def write(self, kind: int, request_id: int, payload=b"", value: float = 0.0) -> bool:
+        """Append a record; False (and nothing written) if the ring is full"""
+        payload = memoryview(payload).cast("B")
+        size = _RECORD.size + len(payload)
+        position = self._write
+        offset = position % self.capacity
+        tail = self.capacity - offset
+        if size > tail:
+            position += tail
+            offset = 0
+        read = _POSITION.unpack_from(self._map, 8)[0]
+        if position + size - read > self.capacity:
+            return False
+        if offset == 0 and position != self._write and tail >= _RECORD.size:
+            _RECORD.pack_into(self._data, self._write % self.capacity, 0, 0, WRAP, 0.0)
+        _RECORD.pack_into(self._data, offset, len(payload), request_id, kind, value)
+        self._data[offset + _RECORD.size:offset + size] = payload
+        self._write = position + size
+        _POSITION.pack_into(self._map, 0, self._write)
+        return True
+
+    # Consumer
+
+    def read(self) -> Iterator[Tuple[int, int, float, memoryview]]:
+        """Records published so far as (kind, request id, value, payload)
+
+        Payload views point into the ring and are only valid until release().
+        """
+        end = _POSITION.unpack_from(self._map, 0)[0]
+        position = self._read
+        while position < end:
+            offset = position % self.capacity
+            tail = self.capacity - offset
+            if tail < _RECORD.size:
+                position += tail
+                continue
+            length, request_id, kind, value = _RECORD.unpack_from(self._data, offset)
+            if kind == WRAP:
+                position += tail
+                continue
+            start = offset + _RECORD.size
+            position += _RECORD.size + length
+            self._read = position
+            yield kind, request_id, value, self._data[start:start + length]
+        self._read = position
+
+    def release(self) -> None:
+        """Hand the space of every record read so far back to the producer"""
+        _POSITION.pack_into(self._map, 8, self._read)
@@ -0,0 +1,88 @@
+"""
+CPU-only stand-ins for the model and TTS, for load testing the real server.
+
+Set ``VOICE_AGENT_STUBS`` to a comma separated list of services to replace:
+
+    VOICE_AGENT_STUBS=llm,tts   # or "all"
+
+``llm`` (alias ``stt`` - Ultravox does both) swaps the Ultravox model behind
+the inference scheduler for TinyStandInModel, so batching, queueing and the
+prefix cache still run for real. ``tts`` swaps Cartesia for StubTTSService,
+which returns a quiet tone after a fixed time to first byte. Everything
+else - transport, serializer, Silero VAD, admission - is the production
+code path, which is what the load test is meant to measure.
+"""
+import asyncio
+import math
+import os
+from array import array
+from typing import AsyncGenerator, Optional, Set
+
+from loguru import logger
+from pipecat.frames.frames import Frame, TTSAudioRawFrame, TTSStartedFrame, TTSStoppedFrame
+from pipecat.services.ai_services import TTSService
+
+from inference_scheduler import TinyStandInModel
+from prefix_cache import PrefixKVCache
+
+STUBBABLE = {"llm", "tts"}
+
+def enabled_stubs() -> Set[str]:
+    """Services named in VOICE_AGENT_STUBS"""
+    names = {n.strip().lower() for n in os.getenv("VOICE_AGENT_STUBS", "").split(",") if n.strip()}
+    if "all" in names:
+        return set(STUBBABLE)
+    if "stt" in names:
+        names.discard("stt")
+        names.add("llm")
+    unknown = names - STUBBABLE
+    if unknown:
+        logger.warning(f"Ignoring unknown VOICE_AGENT_STUBS entries: {sorted(unknown)}")
+    return names & STUBBABLE
+
+def create_stub_model(prefix_cache: Optional[PrefixKVCache] = None) -> TinyStandInModel:
+    """TinyStandInModel with timings taken from the environment"""
+    return TinyStandInModel(
+        step_ms=float(os.getenv("STUB_LLM_STEP_MS", "20")),
+        prefill_ms_per_audio_second=float(os.getenv("STUB_LLM_PREFILL_MS_PER_AUDIO_SECOND", "15")),
+        reply_tokens=(int(os.getenv("STUB_LLM_MIN_TOKENS", "10")), int(os.getenv("STUB_LLM_MAX_TOKENS", "30"))),
+        prefix_cache=prefix_cache,
+    )
+
+class StubTTSService(TTSService):
+    """Speaks every sentence as a low tone, ``ms_per_char`` long, after ``ttfb_ms``"""
+
+    CHUNK_SECONDS = 0.04
+
+    def __init__(self, *, ttfb_ms: float = 150.0, ms_per_char: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self._ttfb = ttfb_ms / 1000.0
+        self._seconds_per_char = ms_per_char / 1000.0
+        self._chunk: Optional[bytes] = None
+
+    def _tone_chunk(self) -> bytes:
+        if self._chunk is None:
+            samples = int(self.sample_rate * self.CHUNK_SECONDS)
+            self._chunk = array(
+                "h", (int(2000 * math.sin(2 * math.pi * 220 * i / self.sample_rate)) for i in range(samples))
+            ).tobytes()
+        return self._chunk
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        await self.start_ttfb_metrics()
+        yield TTSStartedFrame()
+        await asyncio.sleep(self._ttfb)
+        await self.stop_ttfb_metrics()
+
+        chunk = self._tone_chunk()
+        chunks = max(1, math.ceil(len(text) * self._seconds_per_char / self.CHUNK_SECONDS))
+        for _ in range(chunks):
+            yield TTSAudioRawFrame(audio=chunk, sample_rate=self.sample_rate, num_channels=1)
+        yield TTSStoppedFrame()
+
+def create_stub_tts(**kwargs) -> StubTTSService:
+    return StubTTSService(
+        ttfb_ms=float(os.getenv("STUB_TTS_TTFB_MS", "150")),
+        ms_per_char=float(os.getenv("STUB_TTS_MS_PER_CHAR", "60")),
+        **kwargs
+    )
@@ -0,0 +1,113 @@
+"""
+Clause-level text chunking between the model and TTS.
+
+pipecat's TTSService collects text until the end of a sentence before it
+synthesizes anything, so the caller hears nothing until the model has
+finished the whole first sentence. ClauseAggregator sits between the turn
+processor and TTS (which then runs with ``aggregate_sentences=False``) and
+hands text on at the first clause boundary - a comma, semicolon, colon or
+dash as well as sentence ends. A clause waits until at least ``min_chars``
+have built up, so "Sure," is not synthesized on its own.
+
+Punctuation only counts as a boundary when whitespace follows it, so
+"7:30", "1,250", "3.5" and "AB-12" stay whole. Digits read out one at a
+time ("4, 8, 2, 1") are held together, common abbreviations ("Dr.",
+"p.m.") do not end a sentence, and text that runs past ``max_chars``
+without a boundary is split at a space, never inside a word.
+"""
+import re
+from typing import List, Optional
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartInterruptionFrame,
+    TextFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+# Boundary punctuation followed by whitespace and the next character
+_BOUNDARY = re.compile(r"([.!?]+[\"')\]]*|[,;:]|\s[-–—])(\s+)(\S)")
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "no", "a.m", "p.m", "e.g", "i.e", "approx", "vs"}
+_LAST_WORD = re.compile(r"(\S+)$")
+
+class ClauseChunker:
+    """Splits streamed text into speakable chunks as soon as they are complete"""
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 120):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def _is_boundary(self, match: re.Match) -> bool:
+        punctuation, following = match.group(1), match.group(3)
+        before = self._buffer[:match.start()]
+        word = _LAST_WORD.search(before)
+        word = word.group(1).lower() if word else ""
+        if punctuation.startswith(".") and word.rstrip(".") in _ABBREVIATIONS:
+            # "... at 7 p.m. Your code is" still ends a sentence
+            return word in ("a.m", "p.m") and following.isupper()
+        # "4, 8, 2, 1" is one code, not four clauses
+        if punctuation in ",;:" and following.isdigit() and len(word) <= 2:
+            return False
+        return True
+
+    def push(self, text: str) -> List[str]:
+        """Add model text; returns the chunks now ready for TTS"""
+        self._buffer += text
+        chunks = []
+        start = 0
+        for match in _BOUNDARY.finditer(self._buffer):
+            end = match.end(2)
+            # A whole sentence is worth speaking however short; clauses need min_chars
+            short = end - start < self.min_chars and not match.group(1)[0] in ".!?"
+            if short or not self._is_boundary(match):
+                continue
+            # Keep sentence and clause punctuation for prosody, drop dashes
+            cut = match.start(1) if match.group(1)[0].isspace() else match.end(1)
+            chunks.append(self._buffer[start:cut].strip())
+            start = end
+        self._buffer = self._buffer[start:]
+
+        while len(self._buffer) > self.max_chars:
+            cut = self._buffer.rfind(" ", 0, self.max_chars)
+            if cut <= 0:
+                break
+            chunks.append(self._buffer[:cut].strip())
+            self._buffer = self._buffer[cut + 1:]
+        return [chunk for chunk in chunks if chunk]
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left at the end of the reply"""
+        text, self._buffer = self._buffer.strip(), ""
+        return text or None
+
+    def reset(self) -> None:
+        self._buffer = ""
+
+class ClauseAggregator(FrameProcessor):
+    """Pipeline stage that re-chunks model TextFrames at clause boundaries"""
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 120, **kwargs):
+        super().__init__(**kwargs)
+        self._chunker = ClauseChunker(min_chars, max_chars)
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, TextFrame) and direction == FrameDirection.DOWNSTREAM:
+            for chunk in self._chunker.push(frame.text):
+                await self.push_frame(TextFrame(chunk), direction)
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            text = self._chunker.flush()
+            if text is not None:
+                await self.push_frame(TextFrame(text), direction)
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, (LLMFullResponseStartFrame, StartInterruptionFrame, EndFrame, CancelFrame)):
+            self._chunker.reset()
+            await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
@@ -0,0 +1,363 @@
+"""
+Replica-level Cartesia TTS connection manager.
+
+CartesiaTTSService opens its own websocket per call, so every call pays a
+TLS + websocket handshake before the greeting can be spoken. Here a small
+set of websockets is kept open for the whole replica and every utterance
+is multiplexed over them with its own Cartesia ``context_id``.
+
+Connections that drop are reconnected in the background. Utterances that
+lose their connection before any audio arrived are retried on another
+connection, so callers never notice a reconnect.
+"""
+import asyncio
+import base64
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+import websockets
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    ErrorFrame,
+    Frame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.ai_services import TTSService
+
+CARTESIA_WS_URL = os.getenv("CARTESIA_WS_URL", "wss://api.cartesia.ai/tts/websocket")
+CARTESIA_VERSION = os.getenv("CARTESIA_VERSION", "2024-06-10")
+CARTESIA_POOL_CONNECTIONS = int(os.getenv("CARTESIA_POOL_CONNECTIONS", "2"))
+
+class TTSConnectionError(Exception):
+    """The websocket carrying a context went away"""
+
+class TTSContext:
+    """One utterance in flight on a shared connection"""
+
+    def __init__(self, context_id: str, connection: "CartesiaConnection"):
+        self.context_id = context_id
+        self.connection = connection
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.sent_at = 0.0
+        self.first_audio_at: Optional[float] = None
+
+    @property
+    def time_to_first_byte(self) -> Optional[float]:
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.sent_at
+
+class CartesiaConnection:
+    """A single warm websocket to Cartesia carrying many contexts"""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self._url = url
+        self._ws = None
+        self._receive_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self.contexts: Dict[str, TTSContext] = {}
+        self.ready = asyncio.Event()
+        self.reconnects = 0
+        self._closing = False
+
+    async def connect(self) -> None:
+        self._ws = await websockets.connect(self._url, max_size=16 * 1024 * 1024, ping_interval=20)
+        self._receive_task = asyncio.create_task(self._receive_loop())
+        self.ready.set()
+        logger.debug(f"Cartesia connection {self.index} ready")
+
+    async def close(self) -> None:
+        self._closing = True
+        self.ready.clear()
+        for task in (self._reconnect_task, self._receive_task):
+            if task is not None:
+                task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+        self._fail_contexts("connection closed")
+
+    async def send(self, message: dict) -> None:
+        if not self.ready.is_set():
+            raise TTSConnectionError(f"Cartesia connection {self.index} is not connected")
+        try:
+            await self._ws.send(json.dumps(message))
+        except websockets.ConnectionClosed as e:
+            self._on_disconnect(e)
+            raise TTSConnectionError(str(e))
+
+    async def _receive_loop(self) -> None:
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                context = self.contexts.get(message.get("context_id"))
+                if context is None:
+                    continue
+                if message["type"] == "chunk" and context.first_audio_at is None:
+                    context.first_audio_at = time.monotonic()
+                context.queue.put_nowait(message)
+                if message["type"] in ("done", "error"):
+                    self.contexts.pop(context.context_id, None)
+            self._on_disconnect(None)
+        except websockets.ConnectionClosed as e:
+            self._on_disconnect(e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Cartesia connection {self.index} receive error: {e}")
+            self._on_disconnect(e)
+
+    def _fail_contexts(self, reason: str) -> None:
+        for context in self.contexts.values():
+            context.queue.put_nowait({"type": "disconnected", "error": reason})
+        self.contexts.clear()
+
+    def _on_disconnect(self, error: Optional[Exception]) -> None:
+        if not self.ready.is_set():
+            return
+        self.ready.clear()
+        self._fail_contexts(str(error) if error else "connection closed by server")
+        if not self._closing:
+            logger.warning(f"Cartesia connection {self.index} lost ({error}), reconnecting")
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self) -> None:
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 0.1
+        while not self._closing:
+            try:
+                await self.connect()
+                self.reconnects += 1
+                return
+            except Exception as e:
+                logger.warning(f"Cartesia connection {self.index} reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+class CartesiaConnectionManager:
+    """Keeps warm Cartesia websockets and multiplexes utterances over them"""
+
+    def __init__(self, api_key: str, url: str = CARTESIA_WS_URL, connections: int = CARTESIA_POOL_CONNECTIONS):
+        self._url = f"{url}?api_key={api_key}&cartesia_version={CARTESIA_VERSION}"
+        self._connections = [CartesiaConnection(i, self._url) for i in range(connections)]
+        self._started = False
+        self._start_lock = asyncio.Lock()
+        self._ttfb: Deque[float] = deque(maxlen=1000)
+        self.contexts_opened = 0
+        self.retries = 0
+
+    async def start(self) -> None:
+        """Open all connections; safe to call more than once"""
+        async with self._start_lock:
+            if self._started:
+                return
+            results = await asyncio.gather(*(c.connect() for c in self._connections), return_exceptions=True)
+            for connection, result in zip(self._connections, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Cartesia connection {connection.index} failed to open: {result}")
+                    connection.schedule_reconnect()
+            self._started = True
+            logger.info(f"Cartesia connection manager started with {len(self._connections)} connections")
+
+    async def wait_ready(self, timeout: float = 5.0) -> None:
+        """Start, then wait for at least one open connection or raise TTSConnectionError"""
+        await self.start()
+        await self._pick_connection(timeout)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(c.close() for c in self._connections), return_exceptions=True)
+        self._started = False
+
+    async def _pick_connection(self, timeout: float = 5.0) -> CartesiaConnection:
+        ready = [c for c in self._connections if c.ready.is_set()]
+        if not ready:
+            waiters = [asyncio.create_task(c.ready.wait()) for c in self._connections]
+            try:
+                await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            ready = [c for c in self._connections if c.ready.is_set()]
+            if not ready:
+                raise TTSConnectionError("No Cartesia connection available")
+        return min(ready, key=lambda c: len(c.contexts))
+
+    async def open_context(self, message: dict) -> TTSContext:
+        """Start a new utterance; ``message`` is the Cartesia request without context_id"""
+        await self.start()
+        connection = await self._pick_connection()
+        context = TTSContext(str(uuid.uuid4()), connection)
+        connection.contexts[context.context_id] = context
+        context.sent_at = time.monotonic()
+        try:
+            await connection.send({**message, "context_id": context.context_id})
+        except TTSConnectionError:
+            connection.contexts.pop(context.context_id, None)
+            raise
+        self.contexts_opened += 1
+        return context
+
+    async def cancel_context(self, context: TTSContext) -> None:
+        if context.connection.contexts.pop(context.context_id, None) is None:
+            return
+        # Wake a reader still waiting on the context
+        context.queue.put_nowait({"type": "cancelled"})
+        try:
+            await context.connection.send({"context_id": context.context_id, "cancel": True})
+        except TTSConnectionError:
+            pass
+
+    def record_ttfb(self, seconds: float) -> None:
+        self._ttfb.append(seconds)
+
+    def stats(self) -> dict:
+        samples = sorted(self._ttfb)
+        return {
+            "connections": [
+                {"index": c.index, "ready": c.ready.is_set(), "contexts": len(c.contexts), "reconnects": c.reconnects}
+                for c in self._connections
+            ],
+            "contexts_opened": self.contexts_opened,
+            "retries": self.retries,
+            "ttfb_p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else None,
+            "ttfb_p95_ms": round(samples[int(len(samples) * 0.95)] * 1000, 1) if samples else None,
+        }
+
+_manager: Optional[CartesiaConnectionManager] = None
+
+def get_tts_manager() -> CartesiaConnectionManager:
+    """Get or create the replica-wide Cartesia connection manager"""
+    global _manager
+    if _manager is None:
+        api_key = os.getenv("CARTESIA_API_KEY")
+        if not api_key:
+            raise ValueError("CARTESIA_API_KEY environment variable is required")
+        _manager = CartesiaConnectionManager(api_key)
+    return _manager
+
+class SharedCartesiaTTSService(TTSService):
+    """Cartesia TTS that speaks through the replica's shared connections"""
+
+    def __init__(
+        self,
+        *,
+        manager: CartesiaConnectionManager,
+        voice_id: str,
+        model: str = "sonic-english",
+        speed: Optional[float] = None,
+        language: str = "en",
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self._manager = manager
+        self._voice_id = voice_id
+        self._model = model
+        self._speed = speed
+        self._language = language
+        self._context: Optional[TTSContext] = None
+        self.first_audio_latencies: List[float] = []
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    def _build_request(self, text: str) -> dict:
+        voice = {"mode": "id", "id": self._voice_id}
+        if self._speed is not None:
+            voice["__experimental_controls"] = {"speed": self._speed}
+        return {
+            "transcript": text,
+            "continue": False,
+            "model_id": self._model,
+            "voice": voice,
+            "output_format": {"container": "raw", "encoding": "pcm_s16le", "sample_rate": self.sample_rate},
+            "language": self._language,
+        }
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        logger.debug(f"Generating TTS: [{text}]")
+        await self.start_ttfb_metrics()
+        yield TTSStartedFrame()
+
+        request = self._build_request(text)
+        for attempt in range(2):
+            received_audio = False
+            # Interruptions cancel self._context from another task, so the loop keeps its own reference
+            context = None
+            try:
+                context = await self._manager.open_context(request)
+                self._context = context
+                while True:
+                    message = await context.queue.get()
+                    kind = message["type"]
+                    if kind == "chunk":
+                        if not received_audio:
+                            received_audio = True
+                            await self.stop_ttfb_metrics()
+                            ttfb = context.time_to_first_byte
+                            self.first_audio_latencies.append(ttfb)
+                            self._manager.record_ttfb(ttfb)
+                        yield TTSAudioRawFrame(
+                            audio=base64.b64decode(message["data"]),
+                            sample_rate=self.sample_rate,
+                            num_channels=1,
+                        )
+                    elif kind in ("done", "cancelled"):
+                        break
+                    elif kind == "error":
+                        logger.error(f"Cartesia error: {message.get('error')}")
+                        yield ErrorFrame(f"Cartesia error: {message.get('error')}")
+                        break
+                    elif kind == "disconnected":
+                        raise TTSConnectionError(message.get("error"))
+                break
+            except TTSConnectionError as e:
+                # Only retry when nothing has been spoken yet, otherwise the caller hears a repeat
+                if received_audio or attempt == 1:
+                    logger.error(f"Cartesia connection lost mid-utterance: {e}")
+                    yield ErrorFrame(f"Cartesia connection lost: {e}")
+                    break
+                self._manager.retries += 1
+                logger.warning(f"Retrying TTS on another connection: {e}")
+            finally:
+                if context is not None:
+                    await self._manager.cancel_context(context)
+                    if self._context is context:
+                        self._context = None
+
+        yield TTSStoppedFrame()
+
+    async def _handle_interruption(self, frame: StartInterruptionFrame, direction: FrameDirection):
+        await super()._handle_interruption(frame, direction)
+        # Only cancel: the run_tts loop reading the context clears it on its way out
+        if self._context is not None:
+            await self._manager.cancel_context(self._context)
+
+    def _log_first_audio_summary(self) -> None:
+        if self.first_audio_latencies:
+            samples = sorted(self.first_audio_latencies)
+            logger.info(
+                f"TTS time-to-first-audio over {len(samples)} utterances: "
+                f"first={self.first_audio_latencies[0] * 1000:.0f}ms "
+                f"p50={samples[len(samples) // 2] * 1000:.0f}ms max={samples[-1] * 1000:.0f}ms"
+            )
+
+    async def stop(self, frame: EndFrame):
+        await super().stop(frame)
+        self._log_first_audio_summary()
+
+    async def cancel(self, frame: CancelFrame):
+        await super().cancel(frame)
+        self._log_first_audio_summary()
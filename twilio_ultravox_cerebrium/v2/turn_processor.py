@@ -0,0 +1,242 @@
+"""
+Per-call model stage that hands each caller turn to the shared scheduler.
+
+This replaces putting the process-wide UltravoxSTTService instance into
+every pipeline. Each call gets its own lightweight processor that buffers
+the caller's speech between VAD start/stop, keeps the call's conversation
+context, and streams the reply tokens from the InferenceScheduler back
+into the pipeline as TextFrames for TTS.
+
+With ``speculative_silence_ms`` set, generation starts as soon as the
+caller has been quiet that long (by the call's VAD confidence), instead of
+waiting for VAD to confirm the end of the turn (stop_secs, 0.8 s by
+default). The reply is held back until the confirmation arrives and then
+released at once; if the caller speaks again first, it is cancelled and
+generated again at the next pause. CallMetrics counts both outcomes.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    InputAudioRawFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMMessagesFrame,
+    LLMMessagesUpdateFrame,
+    StartInterruptionFrame,
+    TextFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from audio_codec import AudioRingBuffer
+from inference_scheduler import InferenceScheduler, TurnRequest
+from metrics import CallMetrics
+
+AUDIO_PROMPT = "<|audio|>\n"
+# Placeholder for earlier caller turns; their audio is not re-sent to the model
+PAST_AUDIO_TURN = "(the caller spoke)"
+
+class _Speculation:
+    """A reply generated before the end of the caller's turn was confirmed"""
+
+    __slots__ = ("started_at", "audio_seconds", "reply", "commit")
+
+    def __init__(self, audio_seconds: float):
+        self.started_at = time.monotonic()
+        self.audio_seconds = audio_seconds
+        self.reply: List[str] = []
+        self.commit = asyncio.Event()
+
+class UltravoxTurnProcessor(FrameProcessor):
+    """Buffers caller audio per turn and streams replies from the shared model"""
+
+    def __init__(
+        self,
+        scheduler: InferenceScheduler,
+        messages: List[dict],
+        temperature: float = 0.7,
+        max_tokens: int = 200,
+        history_turns: int = 10,
+        preroll_seconds: float = 0.3,
+        max_turn_seconds: float = 30.0,
+        call_metrics: Optional[CallMetrics] = None,
+        vad_analyzer=None,
+        speculative_silence_ms: float = 0,
+        **kwargs
+    ):
+        super().__init__(**kwargs)
+        self._scheduler = scheduler
+        self._messages = list(messages)
+        self._temperature = temperature
+        self._max_tokens = max_tokens
+        self._history: deque = deque(maxlen=history_turns * 2)
+        self._preroll_seconds = preroll_seconds
+        self._max_turn_seconds = max_turn_seconds
+        self._call_metrics = call_metrics
+
+        self._speaking = False
+        self._sample_rate = 16000
+        # Pre-roll and turn audio share one preallocated buffer; turns longer
+        # than max_turn_seconds keep their most recent audio
+        self._turn_audio: Optional[AudioRingBuffer] = None
+        self._preroll_samples = 0
+        self._request: Optional[TurnRequest] = None
+        self._generation_task: Optional[asyncio.Task] = None
+
+        # Speculation needs the call's VAD analyzer (SharedSileroVADAnalyzer) for per-window confidence
+        self._vad = vad_analyzer if speculative_silence_ms > 0 else None
+        self._speculative_silence_seconds = speculative_silence_ms / 1000
+        self._silent_samples = 0
+        self._speculation: Optional[_Speculation] = None
+
+    def _context(self, user_content: Optional[str]) -> List[dict]:
+        messages = self._messages + list(self._history)
+        if user_content is not None:
+            messages.append({"role": "user", "content": user_content})
+        return messages
+
+    def _buffer_audio(self, frame: InputAudioRawFrame) -> None:
+        if self._turn_audio is None or frame.sample_rate != self._sample_rate:
+            self._sample_rate = frame.sample_rate
+            self._turn_audio = AudioRingBuffer(int(self._max_turn_seconds * self._sample_rate))
+            self._preroll_samples = int(self._preroll_seconds * self._sample_rate)
+        self._turn_audio.write(np.frombuffer(frame.audio, dtype=np.int16))
+        # Outside a turn keep only a short pre-roll, so the words spoken before VAD triggered are not lost
+        if not self._speaking and len(self._turn_audio) > self._preroll_samples:
+            self._turn_audio.skip(len(self._turn_audio) - self._preroll_samples)
+
+    def _take_turn_audio(self, keep: bool = False) -> Optional[np.ndarray]:
+        if not self._turn_audio:
+            return None
+        samples = np.empty(len(self._turn_audio), dtype=np.int16)
+        if keep:
+            self._turn_audio.peek(samples)
+        else:
+            self._turn_audio.read(samples)
+        return samples.astype(np.float32) / 32768.0
+
+    async def _track_silence(self, samples: int) -> None:
+        """Start a speculative reply after a short pause; drop it if the caller goes on"""
+        if self._vad.last_confidence >= self._vad.params.confidence:
+            self._silent_samples = 0
+            if self._speculation is not None:
+                await self._cancel_turn()
+            return
+        self._silent_samples += samples
+        if (self._speculation is None
+                and self._silent_samples >= self._speculative_silence_seconds * self._sample_rate):
+            audio = self._take_turn_audio(keep=True)
+            if audio is not None:
+                await self._start_turn(audio, _Speculation(len(audio) / self._sample_rate))
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, InputAudioRawFrame):
+            # Audio stops here; nothing downstream of the model needs it
+            self._buffer_audio(frame)
+            if self._speaking and self._vad is not None:
+                await self._track_silence(len(frame.audio) // 2)
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            self._speaking = True
+            self._silent_samples = 0
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._speaking = False
+            await self.push_frame(frame, direction)
+            audio = self._take_turn_audio()
+            speculation = self._speculation
+            if speculation is not None:
+                # Only silence followed the speculative audio, so its reply stands
+                self._speculation = None
+                speculation.commit.set()
+                if self._call_metrics is not None:
+                    self._call_metrics.on_speculation_committed(time.monotonic() - speculation.started_at)
+            elif audio is not None:
+                await self._start_turn(audio)
+        elif isinstance(frame, StartInterruptionFrame):
+            await self._cancel_turn()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, LLMMessagesUpdateFrame):
+            self._messages = list(frame.messages)
+            self._history.clear()
+        elif isinstance(frame, LLMMessagesFrame):
+            self._messages = list(frame.messages)
+            self._history.clear()
+            await self._start_turn(None)
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            await self._cancel_turn()
+            await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
+
+    async def _start_turn(self, audio: Optional[np.ndarray], speculation: Optional[_Speculation] = None) -> None:
+        await self._cancel_turn()
+        self._request = self._scheduler.submit(
+            self._context(AUDIO_PROMPT if audio is not None else None),
+            audio=audio,
+            sample_rate=self._sample_rate,
+            temperature=self._temperature,
+            max_tokens=self._max_tokens,
+        )
+        self._speculation = speculation
+        self._generation_task = asyncio.create_task(self._stream_reply(self._request, audio is not None, speculation))
+
+    async def _stream_reply(self, request: TurnRequest, from_audio: bool,
+                            speculation: Optional[_Speculation] = None) -> None:
+        # A speculative reply collects its tokens until the turn is confirmed
+        reply = speculation.reply if speculation is not None else []
+        held = speculation is not None
+        if not held:
+            await self.push_frame(LLMFullResponseStartFrame())
+        try:
+            async for text in request.tokens():
+                if not reply and self._call_metrics is not None and request.queue_wait is not None:
+                    self._call_metrics.on_queue_wait(request.queue_wait)
+                reply.append(text)
+                # Confirmed mid-generation: the held tokens go out with the next one
+                if held and speculation.commit.is_set():
+                    held = False
+                    await self.push_frame(LLMFullResponseStartFrame())
+                    for earlier in reply[:-1]:
+                        await self.push_frame(TextFrame(earlier))
+                if not held:
+                    await self.push_frame(TextFrame(text))
+        except Exception as e:
+            logger.error(f"Error generating reply: {e}")
+        if held:
+            # Generation finished before the caller's turn was confirmed
+            await speculation.commit.wait()
+            await self.push_frame(LLMFullResponseStartFrame())
+            for text in reply:
+                await self.push_frame(TextFrame(text))
+        await self.push_frame(LLMFullResponseEndFrame())
+
+        if reply and not request.cancelled:
+            if from_audio:
+                self._history.append({"role": "user", "content": PAST_AUDIO_TURN})
+            self._history.append({"role": "assistant", "content": "".join(reply).strip()})
+
+    async def _cancel_turn(self) -> None:
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None and self._call_metrics is not None:
+            self._call_metrics.on_speculation_cancelled(len(speculation.reply), speculation.audio_seconds)
+        if self._request is not None:
+            self._scheduler.cancel(self._request)
+            self._request = None
+        if self._generation_task is not None and not self._generation_task.done():
+            self._generation_task.cancel()
+            try:
+                await self._generation_task
+            except asyncio.CancelledError:
+                pass
+        self._generation_task = None
@@ -0,0 +1,89 @@
+"""
+Low-overhead codec for the Twilio media stream websocket protocol.
+
+About 50 ``media`` messages arrive per second per call, and each one went
+through ``json.loads`` (building two dicts and several strings) just to get
+at the base64 payload. Twilio sends compact JSON with ``event`` first, so
+media messages can be recognised from their first bytes and the
+payload sliced out and decoded into a buffer the caller owns. Everything
+else (``connected``, ``start``, ``mark``, ``stop``, ``dtmf``) is rare and
+gets a normal ``json.loads``. Messages that do not look like Twilio's
+compact form fall back to full parsing, so the fast path is never wrong,
+only sometimes not taken.
+
+Outbound ``media``, ``mark`` and ``clear`` messages are built from per-stream
+string templates instead of ``json.dumps``.
+"""
+import binascii
+import json
+from typing import Tuple, Union
+
+MEDIA = "media"
+
+# Twilio sends "event" as the first key, so a media message starts with this
+_MEDIA_HEAD = '{"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+
+class TwilioMessageDecoder:
+    """Decodes inbound messages; media payloads land in a reusable buffer
+
+    ``decode`` returns ``("media", n)`` with the mu-law bytes in
+    ``self.payload[:n]`` (valid until the next call), or ``(event, message)``
+    with the parsed JSON for every other event.
+    """
+
+    def __init__(self, max_payload: int = 4096):
+        self._buffer = bytearray(max_payload)
+        self.payload = memoryview(self._buffer)
+
+    def _store(self, raw: bytes) -> int:
+        n = len(raw)
+        if n > len(self._buffer):
+            self._buffer = bytearray(n)
+            self.payload = memoryview(self._buffer)
+        self.payload[:n] = raw
+        return n
+
+    def decode(self, message: Union[str, bytes]) -> Tuple[str, Union[int, dict]]:
+        if isinstance(message, bytes):
+            message = message.decode()
+        if message.startswith(_MEDIA_HEAD):
+            start = message.find(_PAYLOAD_KEY)
+            if start >= 0:
+                start += len(_PAYLOAD_KEY)
+                end = message.find('"', start)
+                if end > 0:
+                    return MEDIA, self._store(binascii.a2b_base64(message[start:end]))
+
+        parsed = json.loads(message)
+        event = parsed.get("event")
+        if event == MEDIA:
+            return MEDIA, self._store(binascii.a2b_base64(parsed["media"]["payload"]))
+        return event, parsed
+
+def parse_control(message: Union[str, bytes]) -> dict:
+    """Full parse for the handshake and other non-media events"""
+    return json.loads(message)
+
+class TwilioMessageEncoder:
+    """Outbound messages for one stream, built from templates"""
+
+    def __init__(self, stream_sid: str):
+        sid = json.dumps(stream_sid)
+        self._media_prefix = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+        self._mark_prefix = '{"event":"mark","streamSid":' + sid + ',"mark":{"name":'
+        self._clear = '{"event":"clear","streamSid":' + sid + '}'
+
+    def media(self, ulaw) -> str:
+        """Media message for raw mu-law bytes (any buffer)"""
+        return self._media_prefix + binascii.b2a_base64(ulaw, newline=False).decode("ascii") + '"}}'
+
+    def media_b64(self, payload: str) -> str:
+        """Media message for an already base64 encoded payload"""
+        return self._media_prefix + payload + '"}}'
+
+    def mark(self, name: str) -> str:
+        return self._mark_prefix + json.dumps(name) + "}}"
+
+    def clear(self) -> str:
+        return self._clear
@@ -0,0 +1,75 @@
+"""
+TwilioFrameSerializer with the audio conversion done by audio_codec.
+
+The stock serializer converts every frame with pipecat's ulaw_to_pcm /
+pcm_to_ulaw helpers, which allocate several intermediate bytes objects and
+rebuild resampler state for each 20 ms frame, and runs json.loads/dumps on
+every media message. This one keeps a decoder and an encoder per call, so
+the filter state carries across frames, and uses twilio_protocol for the
+media, mark and clear messages. Everything else is left to the stock
+serializer.
+"""
+import inspect
+from typing import Optional
+
+from pipecat.frames.frames import AudioRawFrame, Frame, InputAudioRawFrame, StartInterruptionFrame
+from pipecat.serializers.twilio import TwilioFrameSerializer
+
+from audio_codec import UlawDecoder, UlawEncoder
+from twilio_protocol import MEDIA, TwilioMessageDecoder, TwilioMessageEncoder
+
+# Returned by _serialize_fast for frames the stock serializer should handle
+_UNHANDLED = object()
+
+class FastTwilioFrameSerializer(TwilioFrameSerializer):
+    """Drop-in TwilioFrameSerializer with stateful, allocation-free audio conversion"""
+
+    def __init__(self, stream_sid: str, sample_rate: int = 16000, **kwargs):
+        super().__init__(stream_sid, **kwargs)
+        self._stream_sid = stream_sid
+        self._sample_rate = sample_rate
+        self._decoder = UlawDecoder(out_rate=sample_rate)
+        self._encoder = UlawEncoder()
+        self._inbound = TwilioMessageDecoder()
+        self._outbound = TwilioMessageEncoder(stream_sid)
+        self._muted = False
+
+    def mute(self) -> None:
+        """Stop sending the pipeline's audio, e.g. while the replica says goodbye itself"""
+        self._muted = True
+
+    def _serialize_fast(self, frame: Frame):
+        """Media and clear messages (None when muted), _UNHANDLED for anything else"""
+        if isinstance(frame, AudioRawFrame):
+            if self._muted:
+                return None
+            return self._outbound.media(self._encoder.encode(frame.audio, frame.sample_rate))
+        if isinstance(frame, StartInterruptionFrame):
+            return None if self._muted else self._outbound.clear()
+        return _UNHANDLED
+
+    def _deserialize_media(self, data) -> Optional[Frame]:
+        """Audio frame for media messages; None for every other event"""
+        event, size = self._inbound.decode(data)
+        if event != MEDIA:
+            return None
+        pcm = self._decoder.decode(self._inbound.payload[:size])
+        return InputAudioRawFrame(audio=pcm.tobytes(), num_channels=1, sample_rate=self._sample_rate)
+
+    # pipecat made the serializer API async along the way; match whichever we run on
+    if inspect.iscoroutinefunction(TwilioFrameSerializer.serialize):
+        async def serialize(self, frame: Frame) -> Optional[str]:
+            message = self._serialize_fast(frame)
+            return message if message is not _UNHANDLED else await super().serialize(frame)
+
+        async def deserialize(self, data) -> Optional[Frame]:
+            frame = self._deserialize_media(data)
+            return frame if frame is not None else await super().deserialize(data)
+    else:
+        def serialize(self, frame: Frame) -> Optional[str]:
+            message = self._serialize_fast(frame)
+            return message if message is not _UNHANDLED else super().serialize(frame)
+
+        def deserialize(self, data) -> Optional[Frame]:
+            frame = self._deserialize_media(data)
+            return frame if frame is not None else super().deserialize(data)
@@ -0,0 +1,92 @@
+"""
+Ultravox model loading for the shared inference scheduler.
+
+pipecat's UltravoxModel builds its vLLM engine with fixed arguments. This
+subclass rebuilds the engine with automatic prefix caching turned on, so
+the KV blocks for the restaurant system prompt are computed once and
+reused by every call and turn that starts with it. The engine decides which
+blocks stay resident.
+
+Cache figures come from the public RequestOutput of each request's first
+output: ``num_cached_tokens`` (prompt tokens served from the prefix cache)
+and ``prompt_token_ids``. That needs vLLM 0.6.4 or later, V0 or V1 engine;
+on older versions the counters stay at zero and no hit rate is reported.
+Prefill time per computed token is taken from ``RequestOutput.metrics``
+(V0) or, where the engine does not fill it in (V1), from the wall time to
+the first output, which includes queueing and so overstates the savings.
+"""
+import os
+import time
+from typing import Optional
+
+from pipecat.services.ultravox.stt import UltravoxModel
+from vllm import AsyncEngineArgs, AsyncLLMEngine
+
+class PrefixCacheCounters:
+    """Prompt tokens served from the engine's prefix cache and the prefill time that saved"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.computed_tokens = 0
+        self.prefill_seconds = 0.0
+
+    def observe(self, output, waited: float) -> None:
+        """Count a request from its first RequestOutput; waited is the wall time to it"""
+        cached = getattr(output, "num_cached_tokens", None)
+        prompt = getattr(output, "prompt_token_ids", None)
+        if cached is None or prompt is None:
+            return
+        metrics = getattr(output, "metrics", None)
+        scheduled = getattr(metrics, "first_scheduled_time", None)
+        first_token = getattr(metrics, "first_token_time", None)
+        self.requests += 1
+        self.prompt_tokens += len(prompt)
+        self.cached_tokens += cached
+        self.computed_tokens += len(prompt) - cached
+        self.prefill_seconds += first_token - scheduled if scheduled and first_token else waited
+
+    def stats(self) -> dict:
+        per_token = self.prefill_seconds / self.computed_tokens if self.computed_tokens else 0.0
+        return {
+            "engine": "vllm",
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "hit_rate": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "prefill_ms_per_token": round(per_token * 1000, 4),
+            "prefill_seconds_spent": round(self.prefill_seconds, 3),
+            "prefill_seconds_saved": round(self.cached_tokens * per_token, 3),
+        }
+
+class PrefixCachingUltravoxModel(UltravoxModel):
+    """UltravoxModel whose vLLM engine reuses KV blocks for shared prompt prefixes"""
+
+    def _initialize_engine(self):
+        engine_args = AsyncEngineArgs(
+            model=self.model_name,
+            gpu_memory_utilization=float(os.getenv("ULTRAVOX_GPU_MEMORY_UTILIZATION", "0.9")),
+            max_model_len=int(os.getenv("ULTRAVOX_MAX_MODEL_LEN", "8192")),
+            trust_remote_code=True,
+            enable_prefix_caching=True,
+        )
+        self.engine = AsyncLLMEngine.from_engine_args(engine_args)
+        self.prefix_counters = PrefixCacheCounters()
+        # UltravoxModel.generate calls engine.generate; count each request's first output on the way
+        engine_generate = self.engine.generate
+
+        async def counting_generate(*args, **kwargs):
+            started = time.monotonic()
+            first = True
+            async for output in engine_generate(*args, **kwargs):
+                if first:
+                    first = False
+                    self.prefix_counters.observe(output, time.monotonic() - started)
+                yield output
+
+        self.engine.generate = counting_generate
+
+    def prefix_cache_stats(self) -> Optional[dict]:
+        """Engine prefix cache counters, or None until a request has reported them"""
+        return self.prefix_counters.stats() if self.prefix_counters.requests else None
@@ -0,0 +1,184 @@
+"""
+Process-wide Silero VAD engine shared by every call on the replica.
+
+pipecat's SileroVADAnalyzer loads its own ONNX session per call. Here the
+model is loaded once and each call only keeps its recurrent state (a
+2x1x128 float array) and the few samples of audio context Silero needs.
+
+Calls that ask for a VAD decision at the same time are run as one batched
+inference: whoever holds the run lock drains every pending request, so
+concurrent streams share a single ``session.run`` without adding any wait.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+
+# Same periodic reset pipecat uses to keep Silero's state from drifting
+_MODEL_RESET_STATES_TIME = 5.0
+
+_CHUNK_SAMPLES = {16000: 512, 8000: 256}
+_CONTEXT_SAMPLES = {16000: 64, 8000: 32}
+
+def _silero_model_path() -> str:
+    """Locate the silero_vad.onnx file bundled with pipecat"""
+    from importlib import resources
+    return str(resources.files("pipecat.audio.vad.data").joinpath("silero_vad.onnx"))
+
+class SileroStreamState:
+    """Per-call recurrent state for the shared Silero model"""
+
+    __slots__ = ("state", "context", "last_reset", "confidence")
+
+    def __init__(self, sample_rate: int):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = np.zeros((1, _CONTEXT_SAMPLES[sample_rate]), dtype=np.float32)
+        self.last_reset = time.monotonic()
+        self.confidence = 0.0
+
+    def reset(self) -> None:
+        self.state.fill(0.0)
+        self.context.fill(0.0)
+        self.last_reset = time.monotonic()
+
+class _Request:
+    __slots__ = ("stream", "audio", "sample_rate", "done")
+
+    def __init__(self, stream: SileroStreamState, audio: np.ndarray, sample_rate: int):
+        self.stream = stream
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.done = False
+
+class SileroVADEngine:
+    """One ONNX session for all calls, with opportunistic cross-call batching"""
+
+    def __init__(self, model_path: Optional[str] = None, max_batch_size: int = 32):
+        import onnxruntime
+
+        opts = onnxruntime.SessionOptions()
+        opts.inter_op_num_threads = 1
+        opts.intra_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            model_path or _silero_model_path(),
+            providers=["CPUExecutionProvider"],
+            sess_options=opts,
+        )
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[_Request] = []
+        self._pending_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+        self.inferences = 0
+        self.batches = 0
+
+    def confidence(self, stream: SileroStreamState, audio: np.ndarray, sample_rate: int) -> float:
+        """Voice confidence for one chunk of float32 audio from one call"""
+        request = _Request(stream, audio, sample_rate)
+        with self._pending_lock:
+            self._pending.append(request)
+
+        while True:
+            with self._run_lock:
+                with self._pending_lock:
+                    if request.done:
+                        break
+                    batch = self._pending[:self.max_batch_size]
+                    del self._pending[:self.max_batch_size]
+                self._run(batch)
+                with self._pending_lock:
+                    for item in batch:
+                        item.done = True
+                    if request.done:
+                        break
+
+        return stream.confidence
+
+    def _run(self, batch: List[_Request]) -> None:
+        by_rate: Dict[int, List[_Request]] = {}
+        for request in batch:
+            by_rate.setdefault(request.sample_rate, []).append(request)
+
+        for sample_rate, requests in by_rate.items():
+            context_size = _CONTEXT_SAMPLES[sample_rate]
+            x = np.concatenate(
+                [np.concatenate((r.stream.context, r.audio[None, :]), axis=1) for r in requests],
+                axis=0,
+            )
+            state = np.concatenate([r.stream.state for r in requests], axis=1)
+            try:
+                out, new_state = self._session.run(
+                    None,
+                    {"input": x, "state": state, "sr": np.array(sample_rate, dtype=np.int64)},
+                )
+            except Exception as e:
+                logger.error(f"Error analyzing audio with shared Silero VAD: {e}")
+                for r in requests:
+                    r.stream.confidence = 0.0
+                continue
+
+            for i, r in enumerate(requests):
+                r.stream.state = new_state[:, i:i + 1, :]
+                r.stream.context = x[i:i + 1, -context_size:]
+                r.stream.confidence = float(out[i][0])
+
+            self.inferences += len(requests)
+            self.batches += 1
+
+    def stats(self) -> dict:
+        return {
+            "inferences": self.inferences,
+            "batches": self.batches,
+            "mean_batch_size": round(self.inferences / self.batches, 2) if self.batches else 0.0,
+        }
+
+_engine: Optional[SileroVADEngine] = None
+_engine_lock = threading.Lock()
+
+def get_vad_engine() -> SileroVADEngine:
+    """Get or create the process-wide Silero VAD engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                logger.info("Loading shared Silero VAD model...")
+                _engine = SileroVADEngine()
+    return _engine
+
+class SharedSileroVADAnalyzer(VADAnalyzer):
+    """Drop-in replacement for SileroVADAnalyzer backed by the shared engine"""
+
+    def __init__(self, *, sample_rate: Optional[int] = None, params: Optional[VADParams] = None):
+        super().__init__(sample_rate=sample_rate, params=params or VADParams())
+        self._engine = get_vad_engine()
+        self._stream: Optional[SileroStreamState] = None
+
+    def set_sample_rate(self, sample_rate: int):
+        super().set_sample_rate(sample_rate)
+        if self.sample_rate not in _CHUNK_SAMPLES:
+            raise ValueError(f"Silero VAD sample rate needs to be 16000 or 8000 (sample rate: {self.sample_rate})")
+        self._stream = SileroStreamState(self.sample_rate)
+        # confidence() returns before the next window arrives, so one buffer per call is enough
+        self._window = np.empty(self.num_frames_required(), dtype=np.float32)
+
+    @property
+    def last_confidence(self) -> float:
+        """Confidence of the latest window, for stages that act before VAD declares a stop"""
+        return self._stream.confidence if self._stream is not None else 0.0
+
+    def num_frames_required(self) -> int:
+        return _CHUNK_SAMPLES.get(self.sample_rate, 512)
+
+    def voice_confidence(self, buffer) -> float:
+        samples = np.frombuffer(buffer, dtype=np.int16)
+        audio = self._window[:len(samples)]
+        np.multiply(samples, 1 / 32768.0, out=audio)
+        confidence = self._engine.confidence(self._stream, audio, self.sample_rate)
+
+        if time.monotonic() - self._stream.last_reset >= _MODEL_RESET_STATES_TIME:
+            self._stream.reset()
+        return confidence
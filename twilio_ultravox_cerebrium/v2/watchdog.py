@@ -0,0 +1,269 @@
+"""
+Event-loop lag watchdog, per-call loop time and an on-demand sampling profiler.
+
+Every call on a worker shares one event loop. Anything synchronous - a
+blocking log write, a slow regex, a model call that should have been
+``to_thread`` - stalls audio for every caller, not just the one that caused it.
+
+- A heartbeat task sleeps ``interval`` at a time and records how late it
+  wakes up (``voice_agent_event_loop_lag_seconds``).
+- A monitor thread notices when the heartbeat is overdue by more than
+  ``block_threshold`` while the loop is still stuck. It captures the loop
+  thread's stack at that moment, so the report shows the code that was
+  blocking, not whatever ran afterwards.
+- Tasks created under ``watchdog.call(stream_sid)`` (the call's pipeline
+  and every task it spawns) run through a wrapper that times each step.
+  Loop CPU time, step count and longest step are kept per stream SID, and
+  a block is attributed to the call that was running.
+- ``profile()`` samples the loop thread's stack from another thread for a
+  few seconds. It returns folded stacks (``frame;frame;frame count``)
+  prefixed with the running call. flamegraph.pl and speedscope read them
+  directly.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from collections.abc import Coroutine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+from loguru import logger
+
+from metrics import LOOP_BLOCKS, LOOP_LAG
+
+current_call: ContextVar[Optional[str]] = ContextVar("current_call", default=None)
+
+class CallProfile:
+    """Event loop time spent on one call's tasks"""
+
+    __slots__ = ("stream_sid", "cpu_seconds", "wall_seconds", "steps", "max_step", "slow_steps", "started")
+
+    def __init__(self, stream_sid: str):
+        self.stream_sid = stream_sid
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.steps = 0
+        self.max_step = 0.0
+        self.slow_steps = 0
+        self.started = time.time()
+
+    def record(self, cpu: float, wall: float, slow_step: float) -> None:
+        self.cpu_seconds += cpu
+        self.wall_seconds += wall
+        self.steps += 1
+        if wall > self.max_step:
+            self.max_step = wall
+        if wall > slow_step:
+            self.slow_steps += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "stream_sid": self.stream_sid,
+            "loop_cpu_seconds": round(self.cpu_seconds, 4),
+            "loop_wall_seconds": round(self.wall_seconds, 4),
+            "steps": self.steps,
+            "max_step_ms": round(self.max_step * 1000, 2),
+            "slow_steps": self.slow_steps,
+            "duration_seconds": round(time.time() - self.started, 1),
+        }
+
+class _ProfiledCoroutine(Coroutine):
+    """Coroutine proxy that times every step the task runs"""
+
+    __slots__ = ("_coro", "_profile", "_watchdog")
+
+    def __init__(self, coro, profile: CallProfile, watchdog: "LoopWatchdog"):
+        self._coro = coro
+        self._profile = profile
+        self._watchdog = watchdog
+
+    def _step(self, method, *args):
+        watchdog = self._watchdog
+        previous, watchdog.running = watchdog.running, self._profile.stream_sid
+        cpu, wall = time.thread_time(), time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._profile.record(time.thread_time() - cpu, time.perf_counter() - wall, watchdog.slow_step)
+            watchdog.running = previous
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    # asyncio reads these for task repr and get_stack()
+    @property
+    def cr_frame(self):
+        return getattr(self._coro, "cr_frame", None)
+
+    @property
+    def cr_running(self):
+        return getattr(self._coro, "cr_running", False)
+
+    @property
+    def cr_code(self):
+        return getattr(self._coro, "cr_code", None)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})"
+
+class LoopWatchdog:
+    """Heartbeat, block capture and per-call attribution for one event loop"""
+
+    def __init__(self, interval: float = 0.05, block_threshold: float = 0.1, slow_step: float = 0.02,
+                 profile_calls: bool = True, max_events: int = 50):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.slow_step = slow_step
+        self.profile_calls = profile_calls
+        # Stream SID whose task is running right now (read by the monitor and profiler threads)
+        self.running: Optional[str] = None
+        self.calls: Dict[str, CallProfile] = {}
+        self.finished_calls: Deque[dict] = deque(maxlen=50)
+        self.blocks: Deque[dict] = deque(maxlen=max_events)
+        self.max_lag = 0.0
+        self._lags: Deque[float] = deque(maxlen=max(1, int(60 / interval)))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = time.perf_counter()
+        self._blocked: Optional[dict] = None
+        self._stop = threading.Event()
+        self._profiling = threading.Lock()
+        self._previous_factory = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        if self.profile_calls:
+            self._previous_factory = loop.get_task_factory()
+            loop.set_task_factory(self._task_factory)
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True).start()
+        logger.info(f"Event loop watchdog started (interval={self.interval * 1000:.0f}ms, "
+                    f"block threshold={self.block_threshold * 1000:.0f}ms, per-call profiling={self.profile_calls})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._heartbeat_task.cancel()
+        if self.profile_calls and self._loop is not None:
+            self._loop.set_task_factory(self._previous_factory)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        context = kwargs.get("context")
+        stream_sid = context.get(current_call) if context is not None else current_call.get()
+        profile = self.calls.get(stream_sid) if stream_sid else None
+        if profile is not None:
+            coro = _ProfiledCoroutine(coro, profile, self)
+        if self._previous_factory is not None:
+            return self._previous_factory(loop, coro, **kwargs)
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    @contextmanager
+    def call(self, stream_sid: str):
+        """Tasks created inside the block are profiled as ``stream_sid``"""
+        self.calls[stream_sid] = CallProfile(stream_sid)
+        token = current_call.set(stream_sid)
+        try:
+            yield
+        finally:
+            current_call.reset(token)
+
+    def finish_call(self, stream_sid: str) -> Optional[dict]:
+        profile = self.calls.pop(stream_sid, None)
+        if profile is None:
+            return None
+        summary = profile.to_dict()
+        self.finished_calls.append(summary)
+        logger.info(f"Call {stream_sid} event loop time: {summary['loop_cpu_seconds']:.3f}s CPU over "
+                    f"{summary['steps']} steps, longest step {summary['max_step_ms']:.1f}ms, "
+                    f"{summary['slow_steps']} over {self.slow_step * 1000:.0f}ms")
+        return summary
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._beat = now
+            self._lags.append(lag)
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            blocked, self._blocked = self._blocked, None
+            if blocked is not None:
+                blocked["lag_ms"] = round(lag * 1000, 1)
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms (call={blocked['call']}) at "
+                               f"{blocked['stack'][-1] if blocked['stack'] else '?'}")
+
+    def _monitor(self):
+        while not self._stop.wait(self.block_threshold / 4):
+            overdue = time.perf_counter() - self._beat - self.interval
+            if overdue < self.block_threshold or self._blocked is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            event = {
+                "at": time.time() - overdue,
+                "lag_ms": None,  # filled in when the loop wakes up
+                "call": self.running,
+                "stack": [f"{f.filename}:{f.lineno} {f.name}" for f in traceback.extract_stack(frame)] if frame else [],
+            }
+            self.blocks.append(event)
+            self._blocked = event
+            LOOP_BLOCKS.inc()
+
+    def profile(self, seconds: float = 10.0, hz: float = 100.0) -> str:
+        """Sample the loop thread's stack (call from another thread); folded stacks"""
+        if not self._profiling.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            stacks: Counter = Counter()
+            period = 1.0 / hz
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                frame = sys._current_frames().get(self._loop_thread)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                call = self.running
+                stacks[";".join([f"call {call}" if call else "replica"] + labels[::-1])] += 1
+                time.sleep(period)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._profiling.release()
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+        return {
+            "lag_p50_ms": round(lags[len(lags) // 2] * 1000, 2) if lags else None,
+            "lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 2) if lags else None,
+            "lag_max_ms": round(self.max_lag * 1000, 2),
+            "blocks": len(self.blocks),
+            "blocked_now": self._blocked is not None,
+        }
+
+    def report(self) -> dict:
+        """Everything the admin endpoint shows"""
+        return {
+            **self.stats(),
+            "recent_blocks": list(self.blocks),
+            "calls": sorted((p.to_dict() for p in list(self.calls.values())),
+                            key=lambda c: c["loop_cpu_seconds"], reverse=True),
+            "finished_calls": list(self.finished_calls),
+        }
+